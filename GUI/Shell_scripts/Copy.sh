@@ -1,6 +1,17 @@
 # File to sync the latest interface build into the GUI directory
 # Make sure this one is in.gitignore!
 cp ~/Wikiportrait-Bot/Wikiportret_core.py ~/Wikiportrait-Bot/GUI/Wikiportret_core.py
+cp ~/Wikiportrait-Bot/Wikiportret_http.py ~/Wikiportrait-Bot/GUI/Wikiportret_http.py
+cp ~/Wikiportrait-Bot/Wikiportret_ratelimit.py ~/Wikiportrait-Bot/GUI/Wikiportret_ratelimit.py
+cp ~/Wikiportrait-Bot/Wikiportret_retry.py ~/Wikiportrait-Bot/GUI/Wikiportret_retry.py
+cp ~/Wikiportrait-Bot/Wikiportret_cache.py ~/Wikiportrait-Bot/GUI/Wikiportret_cache.py
+cp ~/Wikiportrait-Bot/Wikiportret_health.py ~/Wikiportrait-Bot/GUI/Wikiportret_health.py
+cp ~/Wikiportrait-Bot/Wikiportret_deadline.py ~/Wikiportrait-Bot/GUI/Wikiportret_deadline.py
+cp ~/Wikiportrait-Bot/Wikiportret_codec.py ~/Wikiportrait-Bot/GUI/Wikiportret_codec.py
+cp ~/Wikiportrait-Bot/Wikiportret_metrics.py ~/Wikiportrait-Bot/GUI/Wikiportret_metrics.py
+cp ~/Wikiportrait-Bot/Wikiportret_schedule.py ~/Wikiportrait-Bot/GUI/Wikiportret_schedule.py
+cp ~/Wikiportrait-Bot/Wikiportret_plan.py ~/Wikiportrait-Bot/GUI/Wikiportret_plan.py
+cp ~/Wikiportrait-Bot/Wikiportret_pool.py ~/Wikiportrait-Bot/GUI/Wikiportret_pool.py
 
 # File to copy all files from the Github repo into the proper directory at Toolfore
 cd ~/Wikiportrait-Bot/GUI
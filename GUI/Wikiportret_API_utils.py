@@ -5,27 +5,30 @@ Module that contains all functionalities to communicate with the Wikiportret API
 import requests
 import tomllib
 import os
+from Wikiportret_deadline import timeout as request_timeout
 
 
-def generate_wikiportret_key():
+def generate_wikiportret_key(deadline=None):
     with open(os.path.join(os.path.dirname(__file__), 'config.toml'), 'rb') as f:
         data = tomllib.load(f)
     payload = {'User': data['WIKIPORTRET_USERNAME'],
                'Pass': data['WIKIPORTRET_PASS'],
                'Authentication': data['WIKIPORTRET_API_KEY']}
     response = requests.post('https://www.wikiportret.nl/api/login/',
-                             headers=payload).text
+                             headers=payload,
+                             timeout=request_timeout(deadline, 'www.wikiportret.nl')).text
     # Note: API end is written in PHP, so it returns a bytestring
     #
     return f'Bearer {response}'
 
 
-def pull_data(key='2ebec06c3dbbcec2493e859c3799308f65e6624d'):
+def pull_data(key='2ebec06c3dbbcec2493e859c3799308f65e6624d', deadline=None):
     with open(os.path.join(os.path.dirname(__file__), 'config.toml'), 'rb') as f:
         data = tomllib.load(f)
     payload = {'User': data['WIKIPORTRET_USERNAME'],
-               'Authentication': generate_wikiportret_key()}
+               'Authentication': generate_wikiportret_key(deadline)}
     data = {'key': key}
     print(requests.post('https://www.wikiportret.nl/api/ticket/',
                         data=data,
-                        headers=payload).text)
+                        headers=payload,
+                        timeout=request_timeout(deadline, 'www.wikiportret.nl')).text)
@@ -4,16 +4,52 @@
 import toolforge
 import threading
 import tomllib
+import queue
 import time
 import os
 import Wikiportret_core_web_link as wcl  # Dealing with the db & getting info from the UI
 import Wikiportret_db_utils as dbutil
+import Wikiportret_http as http  # Pooled sessions, shared by all upload threads
+import Wikiportret_ratelimit as ratelimit  # Edit limit, shared with the webservice
+import Wikiportret_cache as cache  # Persistent cache of wikitext & Wikidata items
+import Wikiportret_health as health  # Circuit breaker: pauses the uploads while a wiki is in trouble
+from Wikiportret_core import ImageSet, MaxlagError, purge_pages
+from Wikiportret_deadline import Deadline, DeadlineExceeded
+import Wikiportret_metrics as metrics  # Queue depth, active threads & the API/db calls of the sessions
+import Wikiportret_outbox as outbox  # Durable queue of the writes to the wikis
 
 # First job: read config of the app
 __dir__ = os.path.dirname(__file__)
 with open(os.path.join(__dir__, 'config.toml'), 'rb') as f:
     config = tomllib.load(f)
 
+# All threads share the keep-alive connections to the wikis, so size the pool to the number of parallel jobs
+http.set_pool_size(config.get('HTTP_POOL_SIZE', http.pool_size))
+# The edit limiter keeps its state on disk, this directory must be shared by all processes editing for the tool
+ratelimit.set_state_dir(config.get('RATELIMIT_DIR', ratelimit.state_dir))
+cache.configure(config.get('CACHE_PATH'), config.get('CACHE_MAX_BYTES'))
+# Time budget (seconds) of a single session, a session that takes longer is stopped
+load_deadline = config.get('LOAD_DEADLINE', 120)
+upload_deadline = config.get('UPLOAD_DEADLINE', 600)
+
+# The metrics are dumped to a file (read by the /metrics endpoint of the webservice) and optionally served locally
+metrics.process = 'worker'
+metrics_file = config.get('METRICS_FILE', metrics.dump_path)
+metrics_interval = config.get('METRICS_INTERVAL', 10)  # Seconds between two dumps
+if config.get('METRICS_PORT') is not None:
+    metrics.serve(config['METRICS_PORT'])
+
+# Purging & the short urls are done after the session is marked as uploaded (see post_process)
+post_process_interval = config.get('POST_PROCESS_INTERVAL', 5)  # Seconds between two batches
+post_process_deadline = config.get('POST_PROCESS_DEADLINE', 120)  # Time budget of a batch
+uploaded = queue.Queue()  # (session id, bot) of the uploads that still need to be post-processed
+
+# If the outbox is used, the upload threads only plan the edits & the outbox sender does them (see Wikiportret_outbox)
+use_outbox = config.get('OUTBOX', False)
+outbox_interval = config.get('OUTBOX_INTERVAL', 5)  # Seconds between two runs of the sender
+outbox_deadline = config.get('OUTBOX_DEADLINE', 600)  # Time budget of a single run of the sender
+outbox.attempts = config.get('OUTBOX_ATTEMPTS', outbox.attempts)
+
 # Reset the user agent per Toolforge policy
 toolforge.set_user_agent('Wikiportret-updater-bg',
                          email='wikiportret@wikimedia.org')  # Just setting up a custom user agent
@@ -21,6 +57,11 @@ toolforge.set_user_agent('Wikiportret-updater-bg',
 # Second job: prepare a connection for the db
 connection = toolforge.toolsdb(config['DB_NAME'])
 connection.autocommit(True)
+dbutil.adjust_db(wcl.checkpoint_table, config['DB_NAME'], connection=connection)  # Steps of the uploads
+dbutil.adjust_db(wcl.preflight_table, config['DB_NAME'], connection=connection)  # Checks done while loading a session
+dbutil.adjust_db(wcl.session_images_table, config['DB_NAME'], connection=connection)  # Sessions with several files
+if use_outbox:
+    dbutil.adjust_db(outbox.table, config['DB_NAME'], connection=connection)
 
 # Third job: compile a list of queries to be performed during each sample
 queries = (  #"DELETE FROM tokens where timestamp < NOW() - INTERVAL 15 MINUTE;",
@@ -34,30 +75,46 @@ trigger_upload = "SELECT * FROM sessions WHERE status = 'ready';"
 
 
 # Define some auxiliary methods
+def update_metrics(pending, ready):
+    """Registers the state of the queue & the number of sessions that are being processed"""
+    metrics.gauge('wikiportret_queue_depth', len(pending), status='pending')
+    metrics.gauge('wikiportret_queue_depth', len(ready), status='ready')
+    metrics.gauge('wikiportret_active_threads',
+                  sum(1 for i in threading.enumerate() if i.name.startswith(('load-', 'upload-'))))
+
+
 def background_load(session_id, config):
     """
     Method that allows reading a bot's claims in the background.
     Procedure: gets called through the background job...
         In the meantime, the web tool will be kept on hold for some time...
     """
-    conn = toolforge.toolsdb(config['DB_NAME'])
+    deadline = Deadline(load_deadline)
+    conn = dbutil.connect(config['DB_NAME'], deadline)
     conn.autocommit(True)
-    success = False  # By default, assume that Daniuu is crap at coding & the bot fails
+    success, status = False, None  # By default, assume that Daniuu is crap at coding & the bot fails
     try:
         bot = wcl.create_from_db(session_id,
                                  config,
                                  retrieve_claims=False,
                                  adjust_input_data=False,
-                                 check_status=False)  # We still need to write stuff to the db, so silent
-        bot.prepare_image_data()  # Load stuff in the background
-        bot.get_commons_claims()
-        bot.ini_wikidata()
+                                 check_status=False,
+                                 deadline=deadline)  # We still need to write stuff to the db, so silent
+        bot.prepare_image_data()  # Load stuff in the background (claims on Commons & Wikidata included)
         # We need to clearly communicate with the db !!!
         bot.write_to_db(session_id, conn)
         bot.input_data_to_db(session_id, conn)
+        # The checks of the upload are done now, so the operator sees the problems on the review page
+        report = bot.preflight_to_db(session_id, conn)
+        print(f'Session {session_id:d}: preflight on revision {report["article_revid"]} of the article')
+        print(f'Session {session_id:d}: {bot.memo}')
         success = True
+    except DeadlineExceeded as error:
+        print(f'Session {session_id:d}: {error}')
+        status = 'timeout'
     finally:
-        status = 'completed' if success else 'failed'
+        if status is None:
+            status = 'completed' if success else 'failed'
         dbutil.adjust_db(
             "UPDATE sessions SET locked = 0, locked_at = NULL, status = '%s' WHERE session_id=%d" % (status,
                                                                                                      session_id),
@@ -67,36 +124,79 @@ def background_load(session_id, config):
         print(f'SUCCESS in getting data & writing db stuff for {session_id:d}')
 
 
+def store_confirmation(session_id, user_id, bot, urls, confirmation, conn):
+    """Stores the upload messages => to make life easier for the operator"""
+    query = """
+    INSERT INTO messages
+    (session_id, user_id, message, file_url, wiki_url, qid) values (%d, %d, %r, %r, %r, %r);""" % (session_id,
+                                                                                                   user_id,
+                                                                                                   confirmation,
+                                                                                                   urls[0],
+                                                                                                   urls[1],
+                                                                                                   bot.qid)
+    dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
+
+
+def mark_uploaded(session_id, user_id, bot, conn):
+    """bot is the WebImage of the session, or its ImageSet if the session has several files or subjects"""
+    # 20260409 - explicitly set uploaded status in time
+    query = f"""
+            UPDATE sessions
+            SET status = 'uploaded' where session_id = {session_id:d};
+            """
+    dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
+    # 20250314 - HACKATHON - succesfull upload => add to the list of user uploads in the db
+    for file in [i.file for i in bot.files] if isinstance(bot, ImageSet) else [bot.file]:
+        query = f"insert into user_uploads (operator_id, file_uploaded) values ({user_id:d}, %s);"
+        dbutil.adjust_db(query, config['DB_NAME'], connection=conn, args=(file,))
+    uploaded.put((session_id, bot))
+
+
 def upload_in_background(session_id, config, user_id):
     # 20260406 - extended to also store short urls in the messages db
     success = False  # By default, assume that Daniuu is crap at coding & the bot fails
-    conn, status, bot = toolforge.toolsdb(config['DB_NAME']), None, None
+    deadline = Deadline(upload_deadline)
+    conn, status, bot = dbutil.connect(config['DB_NAME'], deadline), None, None
+    queue_writes = use_outbox
     try:
-        bot = wcl.create_from_db(session_id, config)
-        _, shorts, confirmation = bot(True, True, True, True, True, False)  # Make the actual calls to the API
+        bot = wcl.create_from_db(session_id, config, deadline=deadline)
+        bot.connection = conn  # The checkpoints are written while the upload runs
+        # A session with several files or subjects is uploaded as one set (the outbox only takes single uploads)
+        upload = bot.image_set() or bot
+        queue_writes = use_outbox and upload is bot
+        if bot.checkpoints and upload is bot and not use_outbox:  # A set does all steps again (present claims are skipped)
+            print(f'Session {session_id:d}: resuming the upload, skipping {", ".join(bot.checkpoints)}')
+        if queue_writes:
+            # Only the reads are done here, the writes are sent by the outbox sender (see outbox_loop)
+            plan = bot.plan_upload(True, True, True, True, True, False)
+            urls = bot.full_urls()
+            confirmation = bot.generate_confirmation(urls)
+        else:
+            # Purging & making the short urls is done after the session is marked as uploaded (see post_process)
+            _, urls, confirmation = upload(True, True, True, True, True, False,
+                                           post_process=False)  # Make the actual calls to the API
         # 20260313 - HACKATHON - improve logging
         if not isinstance(session_id, int):
             status = 'sessioniderror'
         success = True  # Flag upload as success
-        # Also store the upload messages => to make life easier for the operator
-        query = """
-        INSERT INTO messages
-        (session_id, user_id, message, file_url, wiki_url, qid) values (%d, %d, %r, %r, %r, %r);""" % (session_id,
-                                                                                                       user_id,
-                                                                                                       confirmation,
-                                                                                                       shorts[0],
-                                                                                                       shorts[1],
-                                                                                                       bot.qid)
-        dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
-        # 20260409 - explicitly set uploaded status in time
-        query = f"""
-                UPDATE sessions
-                SET status = 'uploaded' where session_id = {session_id:d};
-                """
-        dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
-        # 20250314 - HACKATHON - succesfull upload => add to the list of user uploads in the db
-        query = f"insert into user_uploads (operator_id, file_uploaded) values ({user_id:d}, {bot.file!r});"
-        dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
+        store_confirmation(session_id, user_id, bot, urls, confirmation, conn)
+        if queue_writes:
+            outbox.enqueue(session_id, user_id, plan, config['DB_NAME'], conn, deadline)
+            print(f'Session {session_id:d}: {len(plan)} writes are waiting in the outbox')
+            if status is None:
+                status = 'queued'  # The sender marks the session as uploaded once all writes are confirmed
+        else:
+            mark_uploaded(session_id, user_id, upload, conn)
+    except Exception as error:
+        if health.requeue(error, (MaxlagError,)):
+            # A wiki is in trouble, put the session back in the queue (the steps that were done are skipped next time)
+            print(f'Session {session_id:d} is put back in the queue until the wikis are healthy again ({error})')
+            status = 'ready'
+        elif isinstance(error, DeadlineExceeded):
+            print(f'Session {session_id:d}: {error}')
+            status = 'utimeout'  # The steps that were done are skipped if the upload is started again
+        else:
+            raise
     finally:
         if status is None:
             status = 'uploaded' if success else 'ufail'
@@ -105,22 +205,103 @@ def upload_in_background(session_id, config, user_id):
         SET status = %r, locked = 0, locked_at = NULL
         WHERE session_id = %d""" % (status, session_id)
         dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
-        if bot is not None:  # 20260314 - HACKATHON: fix bug that caused categories to be added > 1 time
-            bot.ini_wikidata(session_id, conn)
+        if bot is not None and status != 'utimeout':  # 20260314 - HACKATHON: fix bug that caused categories to be added > 1 time
+            if not queue_writes:  # With the outbox, nothing was edited yet (the claims in the db are still correct)
+                bot.write_to_db(session_id, conn)  # The responses to the edits were applied to the claims, no reads needed
             bot.input_data_to_db(session_id, conn)
+            print(f'Session {session_id:d}: {bot.memo}')
         conn.close()
 
 
+def outbox_loop():
+    """Sends the writes in the outbox, marks the sessions of which all writes are confirmed as uploaded"""
+    while 1:
+        time.sleep(outbox_interval)
+        if health.paused():
+            continue  # The writes stay in the outbox until the wikis are healthy again
+        conn = None
+        try:
+            conn = dbutil.connect(config['DB_NAME'])
+            conn.autocommit(True)
+            for session_id, state in outbox.drain(config, conn, Deadline(outbox_deadline)).items():
+                if state == 'done':
+                    bot = wcl.create_from_db(session_id, config, check_status=False)
+                    user_id = dbutil.query_db("SELECT * FROM sessions WHERE session_id=%d;" % session_id,
+                                              config['DB_NAME'],
+                                              connection=conn)[1]
+                    mark_uploaded(session_id, user_id, bot, conn)
+                    print(f'Session {session_id:d}: all writes are confirmed')
+                elif state == 'failed':
+                    query = f"UPDATE sessions SET status = 'ufail' WHERE session_id = {session_id:d};"
+                    dbutil.adjust_db(query, config['DB_NAME'], connection=conn)
+                    print(f'Session {session_id:d}: the outbox gave up on a write')
+        except Exception as error:
+            print(f'The outbox sender failed: {error}')  # The writes are tried again on the next run
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def post_process(sessions):
+    """
+    Purges the pages & makes the short urls of uploads that are done (sessions is a list of (session id, bot)).
+    The pages of all sessions are purged with one request per wiki, the short urls of the sessions are made at once.
+    Nothing here affects the upload itself, so errors are only printed.
+    """
+    deadline = Deadline(post_process_deadline)  # The budget of the uploads might be used up by now
+    for _, bot in sessions:
+        bot.set_deadline(deadline)
+    try:
+        purge_pages([j for _, i in sessions for j in i.purge_targets()])
+    except Exception as error:
+        print(f'Purging the pages of sessions {", ".join(str(i) for i, _ in sessions)} failed: {error}')
+
+    def shorten(session_id, bot):
+        try:
+            shorts = bot.short_urls()  # Both urls at the same time
+            # The confirmation starts out with the full urls, switch to the short ones
+            query = """
+            UPDATE messages
+            SET message = %s, file_url = %s, wiki_url = %s
+            WHERE session_id = %s;"""
+            dbutil.adjust_db(query,
+                             config['DB_NAME'],
+                             args=(bot.generate_confirmation(shorts), shorts[0], shorts[1], session_id))
+        except Exception as error:
+            print(f'Session {session_id:d}: could not make the short urls ({error}), keeping the full urls')
+
+    threads = [threading.Thread(target=shorten, args=i, name=f'shorten-{i[0]:d}') for i in sessions]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+
+
+def post_process_loop():
+    """Collects the uploads that are done & post-processes them in batches"""
+    while 1:
+        sessions = [uploaded.get()]  # Wait for the first one
+        time.sleep(post_process_interval)  # Give other uploads the chance to join the batch
+        while not uploaded.empty():
+            sessions.append(uploaded.get())
+        post_process(sessions)
+
+
 # The actual continuous loop
+threading.Thread(target=post_process_loop, name='post-process', daemon=True).start()
+if use_outbox:
+    threading.Thread(target=outbox_loop, name='outbox', daemon=True).start()
+last_dump = 0.0  # Time of the last dump of the metrics
 try:
     while 1:
         connection.ping(reconnect=True)  # Avoid having this one open too long
         # To do: check if there are any locked jobs pending in the db
         # If so, launch a thread for each job to start dealing with the Wikidata stuff
-        for i in dbutil.query_db(background_trigger,
-                                 config['DB_NAME'],
-                                 need_all=True,
-                                 connection=connection):
+        pending = dbutil.query_db(background_trigger,
+                                  config['DB_NAME'],
+                                  need_all=True,
+                                  connection=connection)
+        for i in pending:
             update_query = """
                         UPDATE sessions 
                         SET status = 'processing', locked = 1, locked_at = CURRENT_TIMESTAMP 
@@ -128,12 +309,16 @@ try:
             dbutil.adjust_db(update_query, config['DB_NAME'], connection=connection)
             threading.Thread(target=background_load,
                              args=(i[0],
-                                   config)).start()  # Launch a background job
+                                   config),
+                             name=f'load-{i[0]:d}').start()  # Launch a background job
 
-        for i in dbutil.query_db(trigger_upload,
-                                 config['DB_NAME'],
-                                 need_all=True,
-                                 connection=connection):
+        health.probe_due()  # Check whether the wikis that were in trouble are healthy again
+        ready = dbutil.query_db(trigger_upload,
+                                config['DB_NAME'],
+                                need_all=True,
+                                connection=connection)
+        # The sessions stay in the queue (status ready) until all circuits are closed
+        for i in (ready if not health.paused() else ()):
             update_query = """
             UPDATE sessions
             SET locked = 1, locked_at = CURRENT_TIMESTAMP, status = 'up'
@@ -143,7 +328,13 @@ try:
             threading.Thread(target=upload_in_background,
                              args=(i[0],
                                    config,
-                                   i[1])).start()
+                                   i[1]),
+                             name=f'upload-{i[0]:d}').start()
+
+        update_metrics(pending, ready)
+        if time.monotonic() - last_dump >= metrics_interval:
+            metrics.dump(metrics_file)
+            last_dump = time.monotonic()
 
         time.sleep(1)  # Do sampling stuff at a frequency of 1 Hz (ok, slightly less)
 finally:
@@ -2,24 +2,70 @@
 A module to couple Wikiportret Core to some very handy Flask utilities
 """
 # import flask
-import toolforge
 
-from Wikiportret_core import Image
+from requests_oauthlib import OAuth1
+from Wikiportret_core import Image, ImageSet
+from Wikiportret_deadline import Deadline
+import Wikiportret_pool as pool
 import Wikiportret_db_utils as dbut
+import Wikiportret_codec as codec
 import datetime as dt
-import json
+
+# The steps of an upload that are done, so a failed upload can be resumed (see Image.record_step)
+# Created by the background job if it does not exist yet
+checkpoint_table = """
+CREATE TABLE IF NOT EXISTS `checkpoints` (
+    `session_id` INT NOT NULL,
+    `step` VARCHAR(32) NOT NULL,
+    `result` BLOB,
+    `done_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (`session_id`, `step`)
+);
+"""
+
+# The checks done while loading a session (see Image.preflight), with the text of the article they are based on
+# Shown on the review page, the upload only reads the article again if it changed since
+preflight_table = """
+CREATE TABLE IF NOT EXISTS `preflight` (
+    `session_id` INT NOT NULL,
+    `article_revid` INT,
+    `report` BLOB NOT NULL,
+    `article` MEDIUMBLOB,
+    `checked_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (`session_id`)
+);
+"""
+
+# The other files & subjects of a session with several files or people (see ImageSet), stored as JSON lists
+# Sessions without a row here only handle the file & page of the sessions table
+session_images_table = """
+CREATE TABLE IF NOT EXISTS `session_images` (
+    `session_id` INT NOT NULL,
+    `files` BLOB NOT NULL,
+    `subjects` BLOB NOT NULL,
+    PRIMARY KEY (`session_id`)
+);
+"""
 
 
 class WebImage(Image):
-    def __init__(self, file, name, config, user):
+    def __init__(self, file, name, config, user, deadline=None):
         super().__init__(file, name)
         self.dbname = config['DB_NAME']
-        self.verify_OAuth(config, user=user)  # Automatically verify OAuth
+        self.session = None  # Session in the db, the checkpoints of the upload are stored if set
+        self.extra_files, self.extra_subjects = [], []  # Other files & subjects of the session (see image_set)
+        self.connection = None  # Connection used for the checkpoints (a new one is made if None)
+        self.set_deadline(deadline)  # Also limits the time spent on the db
+        if not isinstance(user, (int, str)):
+            raise TypeError('Only integers and strings are accepted as input for the user!')
+        # The tokens are only read from the db once a bot of this user calls the API (the review page never does)
+        self.user = user
+        pool.register(user, lambda: login_from_db(config, user))
 
     def verify_OAuth(self, config, secret=None, user=None):  # Overloading from parent class
         if secret is None:
             if isinstance(user, (int, str)):
-                secret = dbut.get_tokens_from_db(self.dbname, user)
+                secret = dbut.get_tokens_from_db(self.dbname, user, deadline=self.deadline)
             else:
                 raise TypeError('Only integers and strings are accepted as input for the user!')
 
@@ -33,74 +79,145 @@ class WebImage(Image):
     def write_to_db(self, session_number, connection=None):
         connection_provided = connection is None
         if connection is None:
-            connection = toolforge.toolsdb(self.dbname)
+            connection = dbut.connect(self.dbname, self.deadline)
         if self.claims is None:
             self.ini_wikidata()
         if self.comtext is None:
             self.get_commons_text()
         if self.mc is None:
             self.get_commons_claims()
+        # The claims are passed to the db as encoded JSON (bytes), without building an escaped copy in the query
         query = f"""
         insert into `claims` (`session_id`, `json_response`, `commons_claims`, `qid`, `mid`, `comm_text`) 
         values  ({session_number},
-         '{json.dumps(self.claims)}',
-          '{json.dumps(self.mc)}',
-           '{self.qid}',
-            '{self.mid}',
-             '{self.comtext}')
+         %s,
+          %s,
+           %s,
+            %s,
+             %s)
         ON DUPLICATE KEY UPDATE
-        json_response = '{self.wikidata_claims_json}',
-        commons_claims = '{json.dumps(self.mc)}',
-        comm_text = '{self.comtext}',
-        qid = '{self.qid}'
+        json_response = VALUES(json_response),
+        commons_claims = VALUES(commons_claims),
+        comm_text = VALUES(comm_text),
+        qid = VALUES(qid)
         ;
         """
-        dbut.adjust_db(query, self.dbname, connection=connection)
+        dbut.adjust_db(query,
+                       self.dbname,
+                       connection=connection,
+                       deadline=self.deadline,
+                       args=(self.wikidata_claims_json, self.commons_claims_json, self.qid, self.mid, self.comtext))
         if connection_provided is True:
             connection.close()
 
     def input_data_to_db(self, session_number, connection=None):
         connection_provided = connection is None
         if connection is None:
-            connection = toolforge.toolsdb(self.dbname)
+            connection = dbut.connect(self.dbname, self.deadline)
+        # The values are passed to the db separately, so quotes in the caption or summary cannot break the query
         query = f"""
         INSERT INTO input_data (`session_id`, `custom_caption`, `category_name`, `edit_summary`, `ticket`)
-        VALUES ({session_number}, '{self.caption}', '{self.catname}', '{self.sum}', {self.ticket_number})
+        VALUES ({session_number}, %s, %s, %s, %s)
         ON DUPLICATE KEY UPDATE
-        category_name = '{self.catname}',
-        edit_summary = '{self.sum}',
-        custom_caption = '{self.caption}'
+        category_name = VALUES(category_name),
+        edit_summary = VALUES(edit_summary),
+        custom_caption = VALUES(custom_caption)
         ;
         """
-        dbut.adjust_db(query, self.dbname, connection=connection)
-
-        if self.date is not None:
-            query = """
-            UPDATE input_data
-            SET date = '%4d-%02d-%02d'
-            WHERE session_id = %d;
-            """ % (self.date.year, self.date.month, self.date.day, session_number)
-            dbut.adjust_db(query, self.dbname, connection=connection)
-
-        # And now time to add the birth & death date of the subject
-        if self.birth is not None:
-            query = """
-                    UPDATE input_data
-                    SET birth_date = '%4d-%02d-%02d'
-                    WHERE session_id = %d;
-                    """ % (self.birth.year, self.birth.month, self.birth.day, session_number)
-            dbut.adjust_db(query, self.dbname, connection=connection)
-
-        if self.death is not None:
-            query = """
-                    UPDATE death_date
-                    SET death_date = '%4d-%02d-%02d'
-                    WHERE session_id = %d;
-                    """ % (self.death.year, self.death.month, self.death.day, session_number)
-            dbut.adjust_db(query, self.dbname, connection=connection)
+        dbut.adjust_db(query, self.dbname, connection=connection, deadline=self.deadline,
+                       args=(self.caption, self.catname, self.sum, self.ticket_number))
+
+        # And now time to add the date of the image & the birth & death date of the subject
+        for column, date in (('date', self.date), ('birth_date', self.birth), ('death_date', self.death)):
+            if date is not None:
+                query = f"""
+                UPDATE input_data
+                SET {column} = %s
+                WHERE session_id = {session_number};
+                """
+                dbut.adjust_db(query, self.dbname, connection=connection, deadline=self.deadline,
+                               args=(f'{date.year:04d}-{date.month:02d}-{date.day:02d}',))
         if connection_provided is True:
             connection.close()
 
+    def record_step(self, name, result):
+        record = super().record_step(name, result)
+        if self.session is not None:
+            query = f"""
+            INSERT INTO checkpoints (`session_id`, `step`, `result`)
+            VALUES ({self.session:d}, %s, %s)
+            ON DUPLICATE KEY UPDATE result = VALUES(result);
+            """
+            dbut.adjust_db(query,
+                           self.dbname,
+                           connection=self.connection,
+                           deadline=self.deadline,
+                           args=(name, codec.dumps(record)))
+        return record
+
+    def checkpoints_from_db(self, session_number, connection=None):
+        """Reads the steps that were done in an earlier attempt to upload the session"""
+        query = f"SELECT `step`, `result` FROM checkpoints WHERE session_id = {session_number:d} ORDER BY done_at;"
+        result = dbut.query_db(query, self.dbname, need_all=True, connection=connection, deadline=self.deadline)
+        self.checkpoints = {i[0]: codec.loads(i[1]) for i in result or ()}
+        return self.checkpoints
+
+    def preflight_to_db(self, session_number, connection=None):
+        """Runs the checks of the upload (see Image.preflight) & stores them with the article they are based on"""
+        report = self.preflight()
+        query = f"""
+        INSERT INTO preflight (`session_id`, `article_revid`, `report`, `article`)
+        VALUES ({session_number:d}, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        article_revid = VALUES(article_revid),
+        report = VALUES(report),
+        article = VALUES(article),
+        checked_at = CURRENT_TIMESTAMP;
+        """
+        dbut.adjust_db(query,
+                       self.dbname,
+                       connection=connection,
+                       deadline=self.deadline,
+                       args=(self.article_revid,
+                             codec.dumps(report),
+                             self.article.encode('utf8') if self.article is not None else None))
+        return report
+
+    def preflight_from_db(self, session_number, connection=None):
+        """Reads the checks done while loading the session (None if there are none)"""
+        query = f"SELECT `report`, `article` FROM preflight WHERE session_id = {session_number:d};"
+        result = dbut.query_db(query, self.dbname, connection=connection, deadline=self.deadline)
+        if not result:
+            return None
+        report, article = result
+        return self.restore_preflight(codec.loads(report), article.decode('utf8') if article is not None else None)
+
+    def image_set(self):
+        """The ImageSet of the session, with this WebImage as main file (None if there are no other files or subjects)"""
+        if not self.extra_files and not self.extra_subjects:
+            return None
+        return ImageSet([self.file] + self.extra_files, [self.name] + self.extra_subjects, main=self)
+
+    def extra_images_to_db(self, session_number, connection=None):
+        """Stores the other files & subjects of the session"""
+        query = f"""
+        INSERT INTO session_images (`session_id`, `files`, `subjects`)
+        VALUES ({session_number:d}, %s, %s)
+        ON DUPLICATE KEY UPDATE
+        files = VALUES(files),
+        subjects = VALUES(subjects);
+        """
+        dbut.adjust_db(query, self.dbname, connection=connection, deadline=self.deadline,
+                       args=(codec.dumps(self.extra_files), codec.dumps(self.extra_subjects)))
+
+    def extra_images_from_db(self, session_number, connection=None):
+        """Reads the other files & subjects of the session (none if the session only has one file & subject)"""
+        query = f"SELECT `files`, `subjects` FROM session_images WHERE session_id = {session_number:d};"
+        result = dbut.query_db(query, self.dbname, connection=connection, deadline=self.deadline)
+        if result:
+            self.extra_files, self.extra_subjects = codec.loads(result[0]), codec.loads(result[1])
+        return self.extra_files, self.extra_subjects
+
     # Part 1 of the extension: additional properties for interaction with the session
     @property
     def claims_dict(self):  # Goal of property is to secure the required information
@@ -118,16 +235,16 @@ class WebImage(Image):
     @property
     def wikidata_claims_json(self):
         """
-        Property that generates the json string for use in the _claims_ table
+        Property that generates the json (bytes) for use in the _claims_ table
         """
-        return json.dumps(self.claims)
+        return codec.dumps(self.claims)
 
     @wikidata_claims_json.setter
     def wikidata_claims_json(self, value):
         if isinstance(value, dict):
             self.claims_dict = value
-        elif isinstance(value, str):
-            self.claims_dict = json.loads(value)  # Directly load claims from JSON
+        elif isinstance(value, (str, bytes)):
+            self.claims_dict = codec.loads(value)  # Directly load claims from JSON
 
     @property
     def commmons_claims(self):
@@ -141,16 +258,16 @@ class WebImage(Image):
     @property
     def commons_claims_json(self):
         """
-        Generates the json string for use in the _claims_ table.
+        Generates the json (bytes) for use in the _claims_ table.
         """
-        return json.dumps(self.mc)
+        return codec.dumps(self.mc)
 
     @commons_claims_json.setter
     def commons_claims_json(self, value):
         if isinstance(value, dict):
             self.mc = value
-        elif isinstance(value, str):
-            self.mc = json.loads(value)
+        elif isinstance(value, (str, bytes)):
+            self.mc = codec.loads(value)
 
     @property
     def ticket_number(self):
@@ -164,14 +281,14 @@ class WebImage(Image):
         return self.ticket(action=False)
 
     def get_commons_text(self, session=None, connection=None):
-        super().get_commons_text(True)
+        super().get_commons_text(True)  # Only downloads the text again if the file page changed
         if session is not None:
             query = f"""
             UPDATE claims
-            set comm_text = '{self.comtext}'
+            set comm_text = %s
             where session_id = {session};
             """
-            dbut.adjust_db(query, self.dbname, connection=connection)
+            dbut.adjust_db(query, self.dbname, connection=connection, deadline=self.deadline, args=(self.comtext,))
         return self.comtext
 
     def ini_wikidata(self, session=None, connection=None):
@@ -179,13 +296,25 @@ class WebImage(Image):
         if session is not None:
             query = f"""
                         UPDATE claims
-                        set json_response = '{self.wikidata_claims_json}'
+                        set json_response = %s
                         where session_id = {session};
                         """
-            dbut.adjust_db(query, self.dbname, connection=connection)
+            dbut.adjust_db(query,
+                           self.dbname,
+                           connection=connection,
+                           deadline=self.deadline,
+                           args=(self.wikidata_claims_json,))
         return self.qid, self.claims
 
 
+def login_from_db(config, user):
+    """Makes the login of a user from the tokens in the db (called by the pool when a bot first needs it)"""
+    secret = dbut.get_tokens_from_db(config['DB_NAME'], user)
+    auth = OAuth1(config['CONSUMER_KEY'], config['CONSUMER_SECRET'], secret['key'], secret['secret'])
+    del secret  # Destroy these immediately for obvious reasons
+    return auth
+
+
 # Define custom exception for dealing with incorrect data
 class WikiError(Exception):
     def __str__(self):
@@ -212,22 +341,26 @@ def create_from_db(session_number,
                    config,
                    retrieve_claims=True,
                    adjust_input_data=True,
-                   check_status=True):
+                   check_status=True,
+                   deadline=None):
     """
     Reads a session number & will then parse all relevant output form the db.
     Method takes two arguments:
         * session number: integer representing a session in the database
+    If a deadline (seconds or a Deadline) is passed, it is used for the db & for the WebImage that is returned
     """
     # To make our life slightly easier...
     dbname = config['DB_NAME']
 
     # First job: create a connection to the db
     # Since we need to run a few queries, we will just use one steady connection
-    connection = toolforge.toolsdb(dbname)
+    if deadline is not None and not isinstance(deadline, Deadline):
+        deadline = Deadline(deadline)
+    connection = dbut.connect(dbname, deadline)
 
     # Second job: check in the db what file & nlwiki page the user wishes to process
     query = "SELECT * FROM sessions WHERE session_id=%d;" % session_number
-    result = dbut.query_db(query, dbname, connection=connection)  # Get relevant row as a tuple
+    result = dbut.query_db(query, dbname, connection=connection, deadline=deadline)  # Get relevant row as a tuple
     operator_id = result[1]  # Operator id, needed further down the road
     page, file = result[2], result[3]  # Make life slightly easier & shorten notation
     status = result[4]
@@ -237,18 +370,22 @@ def create_from_db(session_number,
         match status:
             case 'failed':
                 raise WikiError('That did not work')
+            case 'timeout':
+                raise WikiError('Loading the data took too long')
             case 'processing':
                 raise TimeError('Still processing in the background')
             case 'pending':
                 raise BackgroundError('BG JOB IS DOWN!!!')
 
     # Third job: all input is there to generate the WebImage desperately needed
-    output = WebImage(file, page, config, operator_id)
+    output = WebImage(file, page, config, operator_id, deadline)
+    output.session = session_number
+    output.extra_images_from_db(session_number, connection)  # Other files & subjects, if any
 
     # Fourth job: obtain the relevant parameters from the db
     if retrieve_claims is True:
         query = "SELECT * FROM claims WHERE session_id=%d;" % session_number
-        result = dbut.query_db(query, dbname, connection=connection)
+        result = dbut.query_db(query, dbname, connection=connection, deadline=deadline)
         output.qid, output.mid = result[3], result[4]
         output.wikidata_claims_json = result[1]  # JSON loading is done through the property
         output.commons_claims_json = result[2]
@@ -257,7 +394,7 @@ def create_from_db(session_number,
         # Fifth job: if there is already some customized input data, get it
         if adjust_input_data is True:
             query = "SELECT * FROM input_data WHERE session_id=%d;" % session_number
-            result = dbut.query_db(query, dbname, connection=connection)
+            result = dbut.query_db(query, dbname, connection=connection, deadline=deadline)
             # Now set the relevant properties
             if result[1] is not None:
                 output.caption = result[1]
@@ -273,6 +410,12 @@ def create_from_db(session_number,
                 output.death = date_from_db(result[8])
             # Result 3 = ticket number, we don't need it for now
             # Result 6 = used only for the db and cleanup scripts
+
+        # Sixth job: the steps that were done if an earlier upload of the session failed
+        output.checkpoints_from_db(session_number, connection)
+
+        # Seventh job: the checks done while loading the session (the article is not read again if it did not change)
+        output.preflight_from_db(session_number, connection)
     # 20260405 - addition to fix the bugs with birth dates...
     output.date_born()
     output.date_deceased()
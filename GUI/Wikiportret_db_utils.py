@@ -8,7 +8,10 @@ Auxliary functions are listed separately to keep the code of the main app clean
 import toolforge
 import json
 import Wikiportret_crypto as crypto
+from Wikiportret_deadline import timeout as request_timeout
+import Wikiportret_metrics as metrics
 import tomllib
+import time
 import os
 
 # Load config for local dev check
@@ -22,10 +25,34 @@ except:
 LOCAL_DEV = config.get('LOCAL_DEV', False)
 
 
-def query_db(query, dbname, need_all=False, connection=None):
+def connect(dbname, deadline=None):
+    """
+    Opens a connection to the database. The timeouts of the connection are limited by the deadline (if given)
+    Note: the timeouts are fixed when the connection is made, so also check the deadline before every query
+    """
+    connect_timeout, read_timeout = request_timeout(deadline, dbname)
+    return toolforge.toolsdb(dbname,
+                             connect_timeout=max(1, round(connect_timeout)),
+                             read_timeout=read_timeout,
+                             write_timeout=read_timeout)
+
+
+def _execute(cursor, query, args=None):
+    """Executes a query & registers it (kind, latency & errors) in the metrics"""
+    started = time.monotonic()
+    try:
+        cursor.execute(query, args)
+    except Exception as error:
+        metrics.db_query(query, time.monotonic() - started, type(error).__name__)
+        raise
+    metrics.db_query(query, time.monotonic() - started)
+
+
+def query_db(query, dbname, need_all=False, connection=None, deadline=None):
     """
     Query information from the database.
     (details on arguments & output to be added)
+    If a deadline is passed, DeadlineExceeded is raised if it expired before the query was sent
     """
     if LOCAL_DEV:
         if "SELECT status FROM sessions" in query:
@@ -38,12 +65,14 @@ def query_db(query, dbname, need_all=False, connection=None):
 
     if not isinstance(query, str):
         return None
+    if deadline is not None:
+        deadline.check(dbname)
     connection_passed = connection is not None
     if connection is None:
-        connection = toolforge.toolsdb(dbname)
+        connection = connect(dbname, deadline)
     connection.autocommit(True)
     with connection.cursor() as cursor:
-        cursor.execute(query)
+        _execute(cursor, query)
         if need_all is True:
             info = cursor.fetchall()
         else:
@@ -54,7 +83,7 @@ def query_db(query, dbname, need_all=False, connection=None):
     return info  # Return the relevant info & process it elsewhere
 
 
-def get_user_id(username, dbname, connection=None):
+def get_user_id(username, dbname, connection=None, deadline=None):
     if LOCAL_DEV:
         return 1
     if isinstance(username, int):
@@ -62,23 +91,30 @@ def get_user_id(username, dbname, connection=None):
     data = query_db(f"SELECT `user_id` from `users` where `username`='{username}'",
                     dbname,
                     need_all=False,
-                    connection=connection)  # '' are required to get a proper query
+                    connection=connection,
+                    deadline=deadline)  # '' are required to get a proper query
     if isinstance(data, tuple):
         return data[0]
     return None  # No valid user
 
 
-def adjust_db(query, dbname, retrieve_id=False, connection=None):
+def adjust_db(query, dbname, retrieve_id=False, connection=None, deadline=None, args=None):
+    """
+    Runs a query that changes the database.
+    args are the values for the %s-placeholders in the query (e.g. JSON as bytes, which is sent to the db as it is)
+    """
     if LOCAL_DEV:
         return 1 if retrieve_id else True
     if not isinstance(query, str):
         return None
+    if deadline is not None:
+        deadline.check(dbname)
     connection_passed = connection is not None
     if connection is None:
-        connection = toolforge.toolsdb(dbname)
+        connection = connect(dbname, deadline)
     connection.autocommit(True)  # Force autocommit
     with connection.cursor() as cursor:
-        cursor.execute(query)
+        _execute(cursor, query, args)
         connection.commit()
         if retrieve_id is True:
             new_row_id = cursor.lastrowid
@@ -88,10 +124,10 @@ def adjust_db(query, dbname, retrieve_id=False, connection=None):
     return new_row_id if retrieve_id is True else True  # Just to indicate that everything worked out fine
 
 
-def get_tokens_from_db(dbname, operator_name, connection=None):  # To do: extend with encryption stuff
+def get_tokens_from_db(dbname, operator_name, connection=None, deadline=None):  # To do: extend with encryption stuff
     if isinstance(operator_name, str):
         query = f"""
-        select * from tokens where operator_id={get_user_id(operator_name, dbname)};
+        select * from tokens where operator_id={get_user_id(operator_name, dbname, deadline=deadline)};
         """
     elif isinstance(operator_name, int):
         query = f"""
@@ -99,14 +135,14 @@ def get_tokens_from_db(dbname, operator_name, connection=None):  # To do: extend
                 """
     else:
         raise TypeError('operator_name must be str or int!')
-    coded = json.loads(query_db(query, dbname, connection=connection)[1])  # Automatically
+    coded = json.loads(query_db(query, dbname, connection=connection, deadline=deadline)[1])  # Automatically
 
     # 20260314 - HACKATHON - decrypt tokens
     # Encrypted stuff is stored in the db (so we need to get some stuff stored in the same table)
     sec = {}
     for i, j in coded.items():
         query = f"select * from secret_stuff where `ciphertext`={j!r}"
-        obtained = query_db(query, dbname, connection=connection)
+        obtained = query_db(query, dbname, connection=connection, deadline=deadline)
         sec[i] = crypto.decrypt_token(j, obtained[2], obtained[3])
         del obtained, query  # No longer needed
     return sec  # Be careful with this dictionary!
@@ -0,0 +1,158 @@
+"""
+Module containing the outbox of the background job: a durable queue of the writes to the wikis.
+
+If the outbox is used (OUTBOX in the config), an upload thread does not edit the wikis itself.
+It plans the upload (see Image.plan_upload) and appends the writes of the plan to the outbox table.
+The sender (see drain) takes the writes that are due, applies them for all sessions in a single pass,
+and marks every write that the wiki confirmed as done. Writes that failed are tried again later on,
+so a wiki that is in trouble only delays the edits, and the operator does not have to submit the session again.
+A session is uploaded once all its writes are done.
+
+The session & the number of the write in its plan form the key of a write (its idempotency key):
+a write is never queued twice, and a new claim is only sent if it is not on the entity yet (see Wikiportret_plan).
+"""
+
+import Wikiportret_db_utils as dbut
+import Wikiportret_codec as codec
+import Wikiportret_plan as plans
+import Wikiportret_pool as pool
+from Wikiportret_core import CommonsBot, WikidataBot, NlBot
+from Wikiportret_core_web_link import login_from_db
+
+table = """
+CREATE TABLE IF NOT EXISTS `outbox` (
+    `session_id` INT NOT NULL,
+    `write_id` INT NOT NULL,
+    `user_id` INT NOT NULL,
+    `info` BLOB,
+    `data` MEDIUMBLOB NOT NULL,
+    `status` VARCHAR(16) NOT NULL DEFAULT 'pending',
+    `attempts` INT NOT NULL DEFAULT 0,
+    `next_attempt` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `response` MEDIUMBLOB,
+    PRIMARY KEY (`session_id`, `write_id`)
+);
+"""
+
+attempts = 10  # A write that failed this many times is given up (& the session fails)
+backoff = 30  # Seconds before the first retry of a write, doubled after every failed attempt...
+max_backoff = 3600  # ... up to this number of seconds
+
+
+def enqueue(session_id, user_id, plan, dbname, connection=None, deadline=None):
+    """Appends the writes of a plan to the outbox (writes that are already in there are left alone)"""
+    info = codec.dumps(plan.info)
+    for write in plan:
+        query = f"""
+        INSERT IGNORE INTO outbox (`session_id`, `write_id`, `user_id`, `info`, `data`)
+        VALUES ({session_id:d}, {write.id:d}, {user_id:d}, %s, %s);
+        """
+        dbut.adjust_db(query, dbname, connection=connection, deadline=deadline, args=(info, codec.dumps(write.to_dict())))
+    return len(plan)
+
+
+def _due(dbname, connection):
+    """
+    The writes of the sessions that have a write that is due, grouped per session: (user, plan, done, waiting).
+    Sessions of which all writes are finished, but that are still waiting for the outbox, are included as well.
+    All writes of such a session are read (the plan needs them), but the pending writes that are not due yet
+    are waiting: they are not sent in this pass.
+    """
+    query = """
+    SELECT `session_id`, `write_id`, `user_id`, `info`, `data`, `status`, `response`, next_attempt <= NOW() FROM outbox
+    WHERE session_id IN (SELECT DISTINCT session_id FROM outbox WHERE status = 'pending' AND next_attempt <= NOW())
+    OR session_id IN (SELECT session_id FROM sessions WHERE status = 'queued'
+                      AND session_id NOT IN (SELECT session_id FROM outbox WHERE status = 'pending'))
+    ORDER BY session_id, write_id;"""
+    sessions = {}
+    for session_id, write_id, user_id, info, data, status, response, due in dbut.query_db(query,
+                                                                                          dbname,
+                                                                                          need_all=True,
+                                                                                          connection=connection) or ():
+        if session_id not in sessions:
+            sessions[session_id] = (user_id, plans.EditPlan(codec.loads(info)), {}, set())
+        _, plan, done, waiting = sessions[session_id]
+        plan.writes.append(plans.Write.from_dict(codec.loads(data)))
+        if status == 'done':
+            done[write_id] = codec.loads(response)
+        elif status == 'failed':
+            done[write_id] = None  # Given up
+        elif not due:
+            waiting.add(write_id)
+    return sessions
+
+
+def _bots(config, user_id, deadline):
+    """The bots editing for a user (one per wiki, by API), their logins come from the pool"""
+    pool.register(user_id, lambda: login_from_db(config, user_id))
+    bots = {}
+    for i in (CommonsBot(), WikidataBot(), NlBot()):
+        i.user, i.deadline = user_id, deadline
+        bots[i.api] = i
+    return bots
+
+
+def _give_up(session_id, write_id, dbname, connection):
+    query = f"UPDATE outbox SET status = 'failed' WHERE session_id = {session_id:d} AND write_id = {write_id:d};"
+    dbut.adjust_db(query, dbname, connection=connection)
+
+
+def drain(config, connection, deadline=None):
+    """
+    Sends the writes that are due, for all sessions at once.
+    Returns session id => 'done' (all writes confirmed), 'failed' (a write was given up) or None (writes left)
+    """
+    dbname = config['DB_NAME']
+    sessions = _due(dbname, connection)
+    ids = list(sessions)
+    for session_id in ids:
+        _, plan, done, _ = sessions[session_id]
+        for write in plan:  # In the order of the plan, so a write is always checked after the writes it needs
+            if write.id not in done and any(j in done and done[j] is None for j in write.requires):
+                print(f'Session {session_id:d}: giving up write {write}, a write it needs was given up')
+                _give_up(session_id, write.id, dbname, connection)
+                done[write.id] = None
+
+    bots = {i: _bots(config, i, deadline) for i in {sessions[j][0] for j in ids}}
+    owner = {id(sessions[i][1]): sessions[i][0] for i in ids}  # Plan => user
+    finished = [{k: v for k, v in sessions[i][2].items() if v is not None} for i in ids]  # The writes that were done
+    # The writes that were given up or are not due are not sent, and neither are the writes that need them
+    skip = []
+    for n, session_id in enumerate(ids):
+        _, plan, done, waiting = sessions[session_id]
+        skip.append(plans.blocked(plan, finished[n], waiting | {k for k, v in done.items() if v is None}))
+    results = plans.apply([sessions[i][1] for i in ids], lambda plan, api: bots[owner[id(plan)]][api], finished, skip)
+
+    status = {}
+    for n, session_id in enumerate(ids):
+        _, plan, done, _ = sessions[session_id]
+        left = False
+        for write in plan:
+            if write.id in done:
+                continue
+            if write.id in skip[n]:
+                left = True  # Not sent in this pass, its attempts are not counted
+                continue
+            if write.id in results[n]:
+                query = f"""
+                UPDATE outbox SET status = 'done', response = %s
+                WHERE session_id = {session_id:d} AND write_id = {write.id:d};"""
+                dbut.adjust_db(query, dbname, connection=connection, args=(codec.dumps(results[n][write.id]),))
+                continue
+            if any(j not in results[n] for j in write.requires):
+                left = True  # Not sent, a write it needs failed in this pass
+                continue
+            query = f"""
+            UPDATE outbox
+            SET attempts = attempts + 1,
+                status = IF(attempts >= {attempts:d}, 'failed', 'pending'),
+                next_attempt = NOW() + INTERVAL LEAST({backoff:d} * POW(2, attempts - 1), {max_backoff:d}) SECOND
+            WHERE session_id = {session_id:d} AND write_id = {write.id:d};"""
+            dbut.adjust_db(query, dbname, connection=connection)
+            left = True
+        query = f"SELECT COUNT(*) FROM outbox WHERE session_id = {session_id:d} AND status = 'failed';"
+        if dbut.query_db(query, dbname, connection=connection)[0]:
+            status[session_id] = 'failed'
+        else:
+            status[session_id] = None if left else 'done'
+    return status
@@ -22,11 +22,13 @@ import Wikiportret_core_web_link as wcl
 import Wikiportret_API_utils as wpor_api
 import Wikiportret_db_utils as db_utils
 import Wikiportret_crypto as crypto
+import Wikiportret_metrics as metrics
 
 toolforge.set_user_agent('Wikiportret-updater',
                          email='wikiportret@wikimedia.org')  # Just setting up a custom user agent
 
 data = SiteSettings()
+metrics.process = 'web'
 
 # Define the application (this will be the object representing the web page we're interested in)
 app = flask.Flask(__name__)
@@ -240,6 +242,10 @@ def load():
                                   flask.request.form['Article'].strip(),
                                   app.config,
                                   flask.session['username'])  # Configure a new bot object
+        # Other files & subjects of the session (optional, one per line), these are uploaded as one set
+        bot_object.extra_files = [i.strip() for i in flask.request.form.get('ExtraFiles', '').splitlines() if i.strip()]
+        bot_object.extra_subjects = [i.strip() for i in flask.request.form.get('ExtraArticles', '').splitlines()
+                                     if i.strip()]
         # bot_object.verify_OAuth(app.config, user=flask.session['username'])
 
         # Previous versions of code set stuff to the session (now no longer needed: done via db)
@@ -252,6 +258,8 @@ def load():
         flask.session['session_id'] = db_utils.adjust_db(query,
                                                          app.config['DB_NAME'],
                                                          retrieve_id=True)
+        if bot_object.extra_files or bot_object.extra_subjects:
+            bot_object.extra_images_to_db(flask.session['session_id'])
 
         # Background load is truly done in the background, by the continuous bg job
 
@@ -293,6 +301,7 @@ def review():
                                      license_options=wcl.WebImage.licenses.keys(),
                                      selected_license='CC-BY-SA 4.0',
                                      bot=bot_object,
+                                     preflight=getattr(bot_object, 'preflight_report', None),
                                      user_name=flask.session['username'])
     except wcl.WikiError:
         raise NotImplementedError  # Still need to work on this - will go to sep page
@@ -374,6 +383,10 @@ def statussubmit():
     message_data = db_utils.query_db(query, app.config['DB_NAME'])
     if message_data[0] == 'uploaded':
         return flask.redirect(flask.url_for('uploaddone'))
+    if message_data[0] == 'queued':
+        return 'The edits of session %d are waiting to be sent to the wikis' % (flask.session['session_id'])
+    if message_data[0] == 'utimeout':
+        return 'The upload of session %d took too long and was stopped, please try again' % (flask.session['session_id'])
     # To do: change this, but for alpha testing, just keep as is...
     return 'Warn Daniuu, something might have gone wrong in session %d' % (flask.session['session_id'])
 
@@ -398,6 +411,19 @@ def forbidden_test():
     check_login_data('forbidden_test')
     return flask.render_template('403.html')
 
+@app.route('/metrics')
+def prometheus_metrics():
+    # Metrics of the webservice, together with those dumped by the background job (Prometheus text format)
+    # Only for scrapers on this host (not through the proxy) & users that are logged in
+    local = flask.request.remote_addr in {'127.0.0.1', '::1'} and 'X-Forwarded-For' not in flask.request.headers
+    logged_in = 'username' in flask.session and 'token_expiry' in flask.session and \
+        dt.datetime.utcnow() <= dt.datetime.fromisoformat(flask.session['token_expiry'])
+    if not local and not logged_in and not app.config.get('LOCAL_DEV'):
+        flask.abort(403)
+    worker = metrics.load(app.config.get('METRICS_FILE', metrics.dump_path))
+    return flask.Response(metrics.render(*([worker] if worker is not None else [])),
+                          mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(403)
 def forbidden(e):
     check_login_data('forbidden_test')
@@ -23,6 +23,7 @@ class Interface:
         print("I am now preparing to process the file. Please pass the file name on Commons and the nlwiki article "
               "below.")
         print('For devs or people who accidentally (re)started me: just type exit to stop the bot.')
+        print('Several files of the same person(s), or several people in one photo: separate the names with |')
         file = input("Please enter the name (NOT THE URL) of the file that should be processed. ").strip()
         if file.strip().lower() in {'exit', 'stop', 'quit'}:
             return None
@@ -35,7 +36,11 @@ class Interface:
             sleep(5)  # Give the user a 5 second time period to rethink their input
             name = input("Please enter the corresponding name of the article on the Dutch Wikipedia. ").strip()
         # try:
-        _, _, confmes = Image(file, name)()  # Discard filename and short urls, the confirmation message will be printed
+        files, names = [i.strip() for i in file.split('|') if i.strip()], [i.strip() for i in name.split('|') if i.strip()]
+        if len(files) > 1 or len(names) > 1:
+            _, _, confmes = ImageSet(files, names)()  # All files & subjects in a single session
+        else:
+            _, _, confmes = Image(file, name)()  # Discard filename and short urls, the confirmation message will be printed
         #except:
         #    print('\nBOT ERROR! Please check output above\n')
         #    sleep(5)
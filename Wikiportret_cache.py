@@ -0,0 +1,86 @@
+"""
+Module containing the persistent cache of the bots.
+
+Wikidata items & the wikitext of pages on Commons and nlwiki are stored in a small SQLite database on disk,
+which is shared by all processes of the tool. Every entry is stored together with its revision id,
+so the bots only need a cheap check of the latest revision (prop=info) before they can reuse an entry.
+The cache is bounded in size, the least recently used entries are removed first.
+"""
+
+import contextlib
+import threading
+import sqlite3
+import tempfile
+import time
+import os
+import Wikiportret_codec as codec
+import Wikiportret_metrics as metrics
+
+path = os.path.join(tempfile.gettempdir(), 'wikiportret-cache.sqlite')  # Must be shared by all worker processes
+max_bytes = 64 * 1024 * 1024  # Maximum size of the cached values
+
+stats = {'hits': 0, 'misses': 0, 'evictions': 0}  # Counters for this process (used for monitoring)
+_lock = threading.Lock()
+
+
+def configure(cache_path=None, max_size=None):
+    """Changes the location and/or maximum size (bytes) of the cache"""
+    global path, max_bytes
+    if cache_path is not None:
+        path = cache_path
+    if max_size is not None:
+        max_bytes = int(max_size)
+
+
+def _count(name, n=1):
+    with _lock:
+        stats[name] += n
+    metrics.count(f'wikiportret_cache_{name}_total', n)
+
+
+def _connect():
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS entries (
+        `key` TEXT PRIMARY KEY,
+        revid INTEGER NOT NULL,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        used REAL NOT NULL
+    );""")
+    return connection
+
+
+def get(key, revid):
+    """Returns the cached value for key if it was stored for the given revision (None otherwise)"""
+    try:
+        with contextlib.closing(_connect()) as connection, connection:
+            row = connection.execute('SELECT revid, value FROM entries WHERE `key` = ?', (key,)).fetchone()
+            if row is None or row[0] != revid:
+                _count('misses')
+                return None
+            connection.execute('UPDATE entries SET used = ? WHERE `key` = ?', (time.time(), key))
+        _count('hits')
+        return codec.loads(row[1])
+    except sqlite3.Error as error:  # The cache should never stop the bot
+        print(f'Could not read from the cache: {error}')
+        _count('misses')
+        return None
+
+
+def put(key, revid, value):
+    """Stores value for the given revision & evicts the least recently used entries if the cache is too large"""
+    data = codec.dumps(value)
+    try:
+        with contextlib.closing(_connect()) as connection, connection:
+            connection.execute('INSERT OR REPLACE INTO entries (`key`, revid, value, size, used) VALUES (?, ?, ?, ?, ?)',
+                               (key, revid, data, len(data), time.time()))
+            total, evicted = 0, []
+            for i, size in connection.execute('SELECT `key`, size FROM entries ORDER BY used DESC'):
+                total += size
+                if total > max_bytes:
+                    evicted.append((i,))
+            connection.executemany('DELETE FROM entries WHERE `key` = ?', evicted)
+        _count('evictions', len(evicted))
+    except sqlite3.Error as error:
+        print(f'Could not write to the cache: {error}')
@@ -0,0 +1,43 @@
+"""
+Module containing the JSON codec of the bots.
+
+The claims of a well-documented person on Wikidata easily take several hundred KB of JSON,
+which is decoded & encoded a couple of times per session (API responses, the claims table in the db, the cache).
+If orjson is installed, it is used for this, otherwise the json module of the standard library is used.
+The encoded JSON is always returned as bytes (UTF-8), so it can go to the db & the cache without another copy.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library is a bit slower but gives the same result
+    orjson = None
+
+name = 'orjson' if orjson is not None else 'json'  # Codec that is in use (handy for logging)
+
+
+def loads(data):
+    """Decodes JSON, data can be bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value):
+    """Encodes a value as JSON, returns bytes (UTF-8)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+
+
+def dumps_str(value):
+    """Encodes a value as JSON, returns a str (for the parameters of an API call)"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def decode_response(response):
+    """Decodes the body of a requests.Response (without building the intermediate str of response.json())"""
+    return loads(response.content)
@@ -15,14 +15,26 @@ The bot will do a couple of tasks:
 Information can be found in Wikiportret ticket 2021021010009189 (VRT access required)
 """
 
-import threading  # Required to speed up dealing with the web interface
-import requests
+import asyncio
+import threading
+import time
+import concurrent.futures
 import toolforge
 import urllib
-import time
 import datetime as dt
 import re  # Regex to filter the ticket number
+import requests
 from requests_oauthlib import OAuth1
+import Wikiportret_http as http  # Shared keep-alive sessions for all bots
+import Wikiportret_ratelimit as ratelimit  # Edit limit shared by all bots of the same account
+import Wikiportret_retry as retry  # Backoff for maxlag & other transient errors
+import Wikiportret_cache as cache  # Wikitext & Wikidata items that did not change since the last session
+import Wikiportret_codec as codec  # orjson if it is installed, json otherwise
+from Wikiportret_deadline import Deadline, DeadlineExceeded, timeout as request_timeout
+import Wikiportret_metrics as metrics  # Counts, latency & bytes per wiki
+from Wikiportret_schedule import Step, Scheduler  # Runs the edits on different wikis at the same time
+import Wikiportret_plan as plans  # Planning mode: collects the writes of a session, to apply them later on
+import Wikiportret_pool as pool  # Logins of the bots, made on first use & shared by all Images of the process
 
 toolforge.set_user_agent('wikiportret-uploader', email='wikiportret@wikimedia.org')
 
@@ -37,26 +49,126 @@ class MaxlagError(Exception):
         return "Maxlag error occured, bot run aborted."
 
 
+# Errors on Commons that only stop the steps on Commons, the other wikis are still edited.
+# Maxlag that persisted, an expired deadline & an open circuit (see Wikiportret_health) stop the entire run.
+commons_errors = (AssertionError, KeyError, ValueError, TypeError, requests.exceptions.RequestException)
+
+
+class ReadMemo:
+    """
+    Single-flight memo for the reads of one session (shared by the bots of an Image).
+    Identical requests share one request that is in flight & reuse its result afterwards,
+        until we write to that wiki ourselves.
+    """
+
+    def __init__(self):
+        self._results = {}  # (api, request) => Future with the response
+        self._lock = threading.Lock()
+        self.saved = 0  # Number of API calls that were not needed thanks to the memo
+
+    def __str__(self):
+        return f'{self.saved} API calls saved'
+
+    def get(self, api, payload, fetch):
+        """Returns the response to payload, only calls fetch if the same request was not done (or started) yet"""
+        key = api, tuple(sorted((k, str(v)) for k, v in payload.items()))
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self._results[key] = future
+            else:
+                self.saved += 1
+        if owner:
+            try:
+                future.set_result(fetch())
+            except BaseException as error:
+                with self._lock:  # Errors are not remembered, the next call tries again
+                    if self._results.get(key) is future:
+                        del self._results[key]
+                future.set_exception(error)
+                raise
+        return future.result()
+
+    def invalidate(self, api):
+        """Forgets all responses of a wiki (called after we edited it)"""
+        with self._lock:
+            for key in [i for i in self._results if i[0] == api]:
+                del self._results[key]
+
+
 class Bot:
     """
     This class is designed to facilitate all interactions with Wikipedia
         (and to get the processing functions out of other classes)
     """
-    max_edit = 12  # The maximum number of edits that a single bot can do per minute
+    max_edit = 12  # Edits per minute if the wiki does not tell us the limit of the account
+    _tokens = {}  # Token cache shared by all bots: (host, identity, type) => token (valid for the entire login)
+    _token_lock = threading.Lock()
 
     def __init__(self, api, m=None):
         """Constructs a bot, designed to interact with one Wikipedia"""
         self.api = api
-        self.ti = []  # A list to store the time stamps of the edits in
-        self._token = None  # This is a token that is handy
-        self._auth = None  # The OAuth ID (this is the token that will allow the auth - store this for every bot)
-        self._max = Bot.max_edit if m is None else m  # Can be changed if bot bit is granted
+        self._login = None  # The OAuth ID (this is the token that will allow the auth - store this for every bot)
+        self.user = None  # Key of the login in the pool (see _auth), None if the tokens file is used (see verify_OAuth)
+        self._max = m  # Explicit number of edits per minute, by default the limit of the account is used
         self.testing = False  # By default, set all bots to write to the wiki
         self._testfile = 'General.txt'  # File to which output is written if bot is called in test mode
+        self.retry = retry.RetryPolicy()  # Replaced by the policy of the session if the bot belongs to an Image
+        self.memo = None  # ReadMemo of the session (if the bot belongs to an Image)
+        self.deadline = None  # Deadline of the session, limits the timeouts of the requests
+        self.plan = None  # EditPlan of the session in planning mode: the writes are added to it, not sent to the wiki
+        self.on_write = None  # Called with (bot, params, response) after every write (see Image.apply_write)
 
     def __str__(self):
         return self.api.copy()
 
+    @property
+    def _auth(self):
+        """The OAuth1 signer of the bot, taken from the pool the first time it is needed (if the bot has a user)"""
+        if self._login is None and self.user is not None:
+            self._login = pool.login(self.user)
+        return self._login
+
+    @_auth.setter
+    def _auth(self, new):
+        self._login = new
+
+    def _refused_login(self, response, *codes):
+        """
+        Checks whether the wiki refused the login of the bot (revoked or renewed tokens), codes are other errors
+        that mean the same.
+        If so, the login is dropped from the pool, so the bot makes it again the next time it needs it.
+        """
+        code = response.get('error', {}).get('code', '') if isinstance(response, dict) else ''
+        if self.user is None or not (code.startswith('mwoauth-invalid-authorization') or code in codes):
+            return False
+        print(f'The wiki refused the login of the bot ({code}), logging in again')
+        pool.invalidate(self.user, self._login)
+        self._login = None
+        return True
+
+    @property
+    def session(self):
+        """The pooled session for this wiki & OAuth identity (shared with all other bots using the same login)"""
+        return http.get_session(self.api, self._auth)
+
+    @property
+    def limiter(self):
+        """The token bucket shared by all bots (threads & processes) editing this wiki with the same account"""
+        return ratelimit.get_bucket(http.host_of(self.api),
+                                    http.identity_of(self._auth),
+                                    self.get_userinfo,
+                                    (Bot.max_edit, 60),
+                                    None if self._max is None else (self._max, 60))
+
+    def get_userinfo(self):
+        """Gets the name, rights & rate limits of the account that is used by the bot"""
+        return self.get({'action': 'query',
+                         'meta': 'userinfo',
+                         'uiprop': 'rights|ratelimits'})['query']['userinfo']
+
     # noinspection PyPep8Naming
     def verify_OAuth(self, file="Tokens_Wikiportraitbot.txt"):
         """
@@ -77,18 +189,58 @@ class Bot:
                             secret['key'],
                             secret['secret'])
 
-    def verify_token(self):
-        if self._token is None:
-            self.get_token()
-        elif float(time.time()) - self._token[1] > 8:
-            self.get_token()  # Tokens expire after approximately 8 seconds, so generate a new one
-        return self._token[0]
+    def _token_key(self, t='csrf'):
+        return http.host_of(self.api), http.identity_of(self._auth), t
+
+    def verify_token(self, t='csrf'):
+        """
+        Returns the cached token for this wiki & login, only gets a new one if none is cached yet.
+        A token remains valid for the entire login, post gets a new one if the wiki returns badtoken.
+        """
+        token = Bot._tokens.get(self._token_key(t))
+        if token is None:
+            token = self.get_token(t)
+        return token
 
-    def get(self, payload):
-        """This function will provide functionality that does all the get requests"""
+    def get(self, payload, memoize=True):
+        """
+        This function will provide functionality that does all the get requests
+        If the bot has a ReadMemo, identical requests are only sent once (unless memoize is False)
+        """
         self.verify_OAuth()
         payload['format'] = 'json'  # Set the output format to json
-        return requests.get(self.api, params=payload, auth=self._auth).json()
+        if self.memo is not None and memoize is True:
+            return self.memo.get(self.api, payload, lambda: self._get(payload))
+        return self._get(payload)
+
+    def latest_revid(self, title):
+        """
+        Returns the id of the latest revision of a page (None if the page does not exist).
+        This is a cheap check (prop=info), use it to find out whether content we already have is still up to date.
+        """
+        pages = self.get({'action': 'query', 'titles': title, 'prop': 'info'}, memoize=False)['query']['pages']
+        return next(iter(pages.values())).get('lastrevid')
+
+    def _get(self, payload):
+        k = self.retry.call(http.host_of(self.api), True, lambda: self._send('GET', params=payload))
+        if self._refused_login(k):
+            k = self.retry.call(http.host_of(self.api), True, lambda: self._send('GET', params=payload))
+        return k
+
+    def _send_post(self, params):
+        return self._send('POST', data=params)
+
+    def _send(self, method, **kwargs):
+        """Sends a single HTTP request to the API (every attempt of the retry policy), registers it in the metrics"""
+        send = self.session.get if method == 'GET' else self.session.post
+        started = time.monotonic()
+        try:
+            response = send(self.api, auth=self._auth, timeout=request_timeout(self.deadline, self.api), **kwargs)
+        except Exception as error:
+            metrics.http_request(http.host_of(self.api), method, time.monotonic() - started, error=type(error).__name__)
+            raise
+        metrics.http_request(http.host_of(self.api), method, time.monotonic() - started, response)
+        return response
 
     def get_token(self, t='csrf', n=0, store=True):
         """This function will get a token"""
@@ -96,56 +248,76 @@ class Bot:
         pay = {'action': 'query',
                'meta': 'tokens',
                'type': t}
-        z = self.get(pay), float(time.time())
+        z = self.get(pay, memoize=False)  # A rejected token should never come back from the memo
         try:
-            if store is True:
-                self._token = z[0]['query']['tokens'][f'{t}token'], z[1]
-                return self._token[0]
-            else:
-                return self._token[0]  # Just return the token
+            token = z['query']['tokens'][f'{t}token']
         except KeyError:
             assert n <= 1, 'Cannot generate the requested token'
-            return self.get_token(t, n + 1)
+            return self.get_token(t, n + 1, store)
+        if store is True:
+            with Bot._token_lock:
+                Bot._tokens[self._token_key(t)] = token
+        return token
 
     def post(self, params):
         assert 'action' in params, 'Please provide an action'
 
+        # Planning mode: the write is only added to the plan (see Wikiportret_plan)
+        if self.plan is not None:
+            k = self.plan.add(self, params)
+            if self.on_write is not None:
+                self.on_write(self, params, k)  # The later writes are planned against the state after this one
+            return k
+
         # Additional safety loop for testing
         if self.testing is True:  # This loop is designed to prevent the bots from making accidental edits while in
             # test mode
             print('BOT called in test mode!')
             if params['action'] == 'edit':
                 with open(self._testfile, 'w', encoding='utf8') as outfile:
-                    outfile.write(params['text'])
+                    # Section edits & edits that only add text to the page are written as well
+                    outfile.write(params.get('text', params.get('prependtext', params.get('appendtext', ''))))
             elif params['action'] == 'purge':
                 print('Received a request to purge the page %s' % (params['titles']))
             elif 'claim' in params['action']:
                 print('\nSetting property %s to %s\n' % (params['prop'], params['value']))
             elif 'link' in params['action']:
                 print('\nSetting link to %s to value %s' % (params['linksite'], params['linktitle']))
+            elif params['action'] == 'wbeditentity':
+                print('\nEditing entity %s: %s' % (params['id'], params['data']))
             else:
                 raise NotImplementedError(
                     'Bot called in test mode - with an action unknown to me: %s' % (params['action']))
             return {}  # Return empty dictionary - stops the function immediately
 
-        t = float(time.time())
-        self.ti = [i for i in self.ti if i >= t - 60]  # Clean this mess
-        if len(self.ti) >= Bot.max_edit:  # Check this again, after doing the cleaning
-            print('Going to sleep for a while')
-            time.sleep(20)  # Fuck, we need to stop
-            return self.post(params)  # run the function again - but: with a delay of some 60 seconds
-        if 'token' not in params:  # Place this generation of the key here, to avoid having to request too many tokens
-            params['token'] = self.verify_token()  # Generate a new token
+        # Waits until the account is allowed to make another edit
+        metrics.limiter_sleep(http.host_of(self.api), self.limiter.acquire())
+        cached_token = 'token' not in params
+        if cached_token:  # Place this generation of the key here, to avoid having to request too many tokens
+            params['token'] = self.verify_token()  # Only goes to the wiki if no token is cached yet
         params['format'] = 'json'
         params['maxlag'] = 5  # Using the standard that's implemented in PyWikiBot
-        self.ti.append(float(time.time()))
-        k = requests.post(self.api, data=params, auth=self._auth).json()
+        try:
+            k = self.retry.call(http.host_of(self.api), False, lambda: self._send_post(params))
+            if cached_token and k.get('error', {}).get('code') == 'badtoken':
+                print('The cached token was rejected, getting a new one')  # Wiki refused the edit, so we can try again
+                params['token'] = self.get_token()
+                k = self.retry.call(http.host_of(self.api), False, lambda: self._send_post(params))
+            # The wiki did not do the edit, so we can try again (badtoken now means that even a new token was refused)
+            if cached_token and self._refused_login(k, 'badtoken'):
+                params['token'] = self.get_token()
+                k = self.retry.call(http.host_of(self.api), False, lambda: self._send_post(params))
+        finally:
+            if self.memo is not None:
+                self.memo.invalidate(self.api)  # What we read before might no longer be correct after this write
         if 'error' in k:
             print('An error occured somewhere')  # We found an error
             if 'code' in k['error'] and 'maxlag' in k['error']['code']:
-                print('Maxlag occured, please try to file the request at a later point in space and time.')
+                print('Maxlag persisted after retrying, please try to file the request at a later point in space and time.')
                 raise MaxlagError
                 # time.sleep(10)
+        elif self.on_write is not None:
+            self.on_write(self, params, k)
         return k
 
 
@@ -169,7 +341,9 @@ class MetaBot(Bot):
     def short(self, params):
         """This function can be used to create a short url (without generating a token first)"""
         params['format'] = 'json'
-        return requests.post(self.api, data=params, auth=self._auth).json()
+        return self.retry.call(http.host_of(self.api),
+                               True,  # Shortening the same url twice gives the same result
+                               lambda: self._send_post(params))
 
 
 class NlBot(Bot):
@@ -183,22 +357,203 @@ class NlBot(Bot):
         This function relies on https://www.mediawiki.org/wiki/Extension:Disambiguator
         This function uses the MediaWiki API & the "disambiguation" ppprop
         """
+        # Type checking is done while building the request, then send it to the wiki
+        dp_material = self.get(self.dp_query(title))  # Get the content from the wiki
+        return self.dp_from_response(dp_material)
+
+    @staticmethod
+    def dp_query(title):
+        """Builds the request that checks whether a page is a disambiguation page"""
         if not isinstance(title, str):
             raise TypeError('Thy shall not pass non-strings to the "is_dp"-routine!')
-
-        # Type checking done, send a request to the wiki to check whether the supplied page is a disambiguation page
-        dp_get_dict = {'action': 'query',
-                       'prop': 'pageprops',
-                       'titles': title,
-                       'ppprop': 'disambiguation'}
-        dp_material = self.get(dp_get_dict)  # Get the content from the wiki
-
-        # Now check whether the requested page is a dp
+        return {'action': 'query',
+                'prop': 'pageprops',
+                'titles': title,
+                'ppprop': 'disambiguation'}
+
+    @staticmethod
+    def dp_from_response(dp_material):
+        """Checks whether the page in the response of dp_query is a disambiguation page"""
         place = dp_material.get('query', {})['pages']
         key = next(iter(place.keys()))
         return 'disambiguation' in place[key].get('pageprops', {})
 
 
+def run_sync(coroutine):
+    """
+    Runs a coroutine (of AsyncImage) for the synchronous methods of Image, returns its result.
+    Code that already runs an event loop should await the AsyncImage method instead. If it calls the synchronous
+        method anyway, the coroutine runs on a loop of its own in another thread (the caller waits for it).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:  # No event loop in this thread
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+class AsyncBot:
+    """
+    Asyncio counterpart of Bot. This is not native async I/O: every request is still done by a regular Bot,
+        blocking a thread of the default executor of the event loop while it waits for the wiki.
+    This way, the async bots use the same pooled sessions, retries & limits as the synchronous ones,
+        and the requests of a session to different wikis (or of several sessions) are waited for at the same time.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot  # The synchronous bot doing the actual work
+
+    def __str__(self):
+        return str(self.bot)
+
+    @property
+    def api(self):
+        return self.bot.api
+
+    @property
+    def testing(self):
+        return self.bot.testing
+
+    @testing.setter
+    def testing(self, new):
+        self.bot.testing = new
+
+    async def get(self, payload):
+        return await asyncio.to_thread(self.bot.get, payload)
+
+    async def post(self, params):
+        return await asyncio.to_thread(self.bot.post, params)
+
+    async def get_token(self, t='csrf'):
+        return await asyncio.to_thread(self.bot.get_token, t)
+
+    async def latest_revid(self, title):
+        return await asyncio.to_thread(self.bot.latest_revid, title)
+
+    async def verify_token(self, t='csrf'):
+        return await asyncio.to_thread(self.bot.verify_token, t)
+
+
+class AsyncWikidataBot(AsyncBot):
+    def __init__(self, bot=None):
+        super().__init__(WikidataBot() if bot is None else bot)
+
+
+class AsyncCommonsBot(AsyncBot):
+    def __init__(self, bot=None):
+        super().__init__(CommonsBot() if bot is None else bot)
+
+
+class AsyncMetaBot(AsyncBot):
+    def __init__(self, bot=None):
+        super().__init__(MetaBot() if bot is None else bot)
+
+    async def short(self, params):
+        return await asyncio.to_thread(self.bot.short, params)
+
+
+class AsyncNlBot(AsyncBot):
+    def __init__(self, bot=None):
+        super().__init__(NlBot() if bot is None else bot)
+
+    async def is_dp(self, title):
+        return NlBot.dp_from_response(await self.get(NlBot.dp_query(title)))
+
+
+class ReadPlan:
+    """
+    Collects the pages an Image needs to read & folds them into a single action=query per wiki.
+    The props & parameters of all needs for the same wiki are merged (e.g. prop=pageprops|imageinfo|info),
+        and all titles are requested at once.
+    The content of pages is taken from the persistent cache if the latest revision is still the cached one,
+        only the other revisions are downloaded (in a second request, see content_query).
+    """
+
+    def __init__(self):
+        self._needs = {}  # wiki => parameter => list of values
+        self._content = {}  # wiki => title => (slots, section) of which we need the content
+        self._missing = {}  # wiki => pages of which the content was not found in the cache
+
+    def need(self, wiki, title, prop, slots=None, section=None, **params):
+        """
+        Registers that we need the given props (separated by |) of a page on a wiki.
+        If slots is given, we also need the content of those slots (e.g. main|mediainfo) of the latest revision.
+        If section is given as well, only the content of that section is downloaded (e.g. 0 for the lead section).
+        """
+        if slots is not None:
+            prop += '|info'  # lastrevid tells whether the cached content is still up to date
+            self._content.setdefault(wiki, {})[title] = slots, section
+        need = self._needs.setdefault(wiki, {'titles': [], 'prop': []})
+        for key, value in (('titles', title), ('prop', prop), *params.items()):
+            values = need.setdefault(key, [])
+            for i in str(value).split('|'):
+                if i not in values:
+                    values.append(i)
+        return self
+
+    def queries(self):
+        """Returns a dictionary wiki => the parameters of the single request for that wiki"""
+        return {wiki: {'action': 'query', **{key: '|'.join(value) for key, value in need.items()}}
+                for wiki, need in self._needs.items()}
+
+    @staticmethod
+    def pages(response):
+        """Maps the requested titles onto their pages in the response (also if the wiki normalized the title)"""
+        query = response.get('query', {})
+        pages = {i['title']: i for i in query.get('pages', {}).values()}
+        for i in query.get('normalized', ()):
+            if i['to'] in pages:
+                pages[i['from']] = pages[i['to']]
+        return pages
+
+    def content_query(self, wiki, response):
+        """
+        Adds the cached content to the pages in the response to the query of a wiki.
+        Returns the request for the revisions that were not cached (None if all content was found in the cache).
+        """
+        pages, slots, sections = self.pages(response), set(), set()
+        for title, (page_slots, section) in self._content.get(wiki, {}).items():
+            page = pages.get(title)
+            if page is None or 'lastrevid' not in page:
+                continue  # The page does not exist, so there is no content
+            key = self._cache_key(wiki, title, page_slots, section)
+            revision = cache.get(key, page['lastrevid'])
+            if revision is not None:
+                page['revisions'] = [revision]
+            else:
+                self._missing.setdefault(wiki, []).append((key, page))
+                slots.update(page_slots.split('|'))
+                sections.add(section)
+        if not slots:
+            return None
+        query = {'action': 'query',
+                 'revids': '|'.join(str(i[1]['lastrevid']) for i in self._missing[wiki]),
+                 'prop': 'revisions',
+                 'rvprop': 'content|ids|timestamp',
+                 'rvslots': '|'.join(sorted(slots))}
+        if sections != {None}:
+            # rvsection applies to all revisions in the request, so all pages of a wiki should ask for the same section
+            assert len(sections) == 1, 'Only one section per wiki can be requested!'
+            query['rvsection'] = sections.pop()
+        return query
+
+    @staticmethod
+    def _cache_key(wiki, title, slots, section):
+        if section is None:
+            return f'{wiki}:{slots}:{title}'
+        return f'{wiki}:{slots}:{section}:{title}'
+
+    def add_content(self, wiki, response):
+        """Adds the revisions in the response to content_query to the pages & stores them in the cache"""
+        revisions = {j['revid']: j for i in response['query']['pages'].values() for j in i.get('revisions', ())}
+        for key, page in self._missing.pop(wiki, ()):
+            revision = revisions.get(page['lastrevid'])
+            if revision is not None:
+                page['revisions'] = [revision]
+                cache.put(key, page['lastrevid'], revision)
+
+
 class Image:
     """
     This class will contain the main methods that are required for the post-processing of an image from Wikiportrait
@@ -213,6 +568,10 @@ class Image:
                 'CC-BY-SA-2.0': 19068220,
                 'CC-BY-4.0': 20007257}  # This dictionary links the relevant images to their structured data on Wikidata
 
+    # The parameters of the infobox with the image & its caption (used by add_image_to_article & preflight)
+    image_parameter = r'\|\s*afbeelding\s*=[^\|]+'
+    caption_parameter = r'\|\s*(bij|onder)schrift\s*=[^|]+'
+
     def __init__(self, file, name):
         """
         This function will do some construction works
@@ -229,13 +588,17 @@ class Image:
         # If True, the bots will be programmed to make no edits
         self._testing = False
 
-        # Store a bunch of tokens, that can be used in the further processing (and to make edits in general)
-        self._commons = CommonsBot()
-        self._wikidata = WikidataBot()
-        self._nl = NlBot()
-        self._meta = MetaBot()
+        # The bots are only made when they are first used (see _bot), so building an Image costs nothing
+        self._bots = {}  # Class of the bot => the bot
+        self._bots_lock = threading.Lock()
+        self.user = None  # Login of the bots in the pool (see Wikiportret_pool), None to use the tokens file
+        self.retry = retry.RetryPolicy()  # One wait budget for the entire session, shared by the four bots
+        self.memo = ReadMemo()  # Repeated reads of the session are only sent once
+        self.deadline = None  # Time budget of the session (see set_deadline)
         self.qid = None  # this is the Wikidata item that we want to use
         self.claims = None  # temporary storage of the claims @Wikidata
+        self.sitelinks = None  # Link to Commons of the Wikidata item (other sitelinks are not loaded)
+        self.wdrevid = None  # Last revision of the Wikidata item that we know of
         self.mid = None  # id of the file on Wikimedia commons
         self.mc = None  # A dictionary to store the claims for the Commons item in
         self.comtext = None  # Text associated with the image on Commons (save for a couple of purposes)
@@ -246,6 +609,20 @@ class Image:
         self._customcaption = None  # Allow for a manual override of the caption
         self._customcatname = None
 
+        # Results of the reads done in prefetch (None means: not checked yet)
+        self.dp = None  # Is the article on nlwiki a disambiguation page?
+        self.redirect = None  # Is the article on nlwiki a redirect?
+        self.article = None  # Wikitext of the article on nlwiki (only the lead section if lead_section is True)
+        self.article_revid, self.article_timestamp = None, None
+        self.lead_section = True  # Only read & edit section 0 of the article (the infobox is almost always there)
+        self.article_infobox = None  # Does the article use an infobox (anywhere)? None if we could not tell
+        self.file_in_article = None  # Is the file already used somewhere in the article?
+        self.comrevid, self.comtimestamp = None, None  # Revision of the file page on Commons
+        self._categories = {}  # Category name => does it already exist on Commons?
+        self._exif_checked = False  # True once the metadata of the file were checked for a date
+        self.checkpoints = {}  # Steps of __call__ that are done => what they returned (ids & revisions, see record_step)
+        self.preflight_report = None  # Checks done before the upload (see preflight), the article is only read again if it changed
+
         # 20260313 - add check for dates with year-only precision
         # Two booleans, False is date of birth/death is not accurate to 1 day (or None)
         self.baccurate, self.daccurate = False, False
@@ -273,10 +650,51 @@ class Image:
         """
         A method that configures all wiki-interfaces to swap into a test mode
         """
-        self._commons.testing = self.testing
-        self._wikidata.testing = self.testing
-        self._nl.testing = self.testing
-        self._meta.testing = self.testing
+        for i in list(self._bots.values()):
+            i.testing = self.testing
+
+    # The bots of the session, made on first use
+    def _bot(self, kind):
+        """The bot of the given class, made with the settings of the session the first time it is needed"""
+        bot = self._bots.get(kind)
+        if bot is not None:
+            return bot
+        with self._bots_lock:  # The steps of an upload run in several threads, every Image has one bot per wiki
+            if kind not in self._bots:
+                bot = kind()
+                bot.user, bot.testing = self.user, self.testing
+                bot.retry, bot.memo, bot.deadline = self.retry, self.memo, self.deadline
+                bot.on_write = self.apply_write  # The responses to the writes keep the local state up to date
+                self._bots[kind] = bot
+            return self._bots[kind]
+
+    @property
+    def _commons(self):
+        return self._bot(CommonsBot)
+
+    @property
+    def _wikidata(self):
+        return self._bot(WikidataBot)
+
+    @property
+    def _nl(self):
+        return self._bot(NlBot)
+
+    @property
+    def _meta(self):
+        return self._bot(MetaBot)
+
+    def sibling(self, file, name):
+        """
+        A new Image for another file or subject of the same session (see ImageSet).
+        It uses the same login, memo, retry policy & deadline, but has its own bots (their writes update its own state).
+        """
+        other = Image(file, name)
+        other.user = self.user  # The tokens are cached per login, so they are shared as well
+        other.retry, other.memo, other.deadline = self.retry, self.memo, self.deadline
+        other.lead_section = self.lead_section
+        other.testing = self.testing
+        return other
 
     # Properties to control the timestamp of the image
     # self.date was not a property in some older versions of the code
@@ -392,9 +810,17 @@ class Image:
     def catname(self):
         self._customcatname = None
 
+    @property
+    def category_exists(self):
+        """Whether the category already exists on Commons (None if this was not checked for the current name)"""
+        return self._categories.get(self.catname)
+
     # Do a first task - make the category on commons
     def make_cat(self):
         """This function will, when triggered, generate an empty category on Wikimedia Commons."""
+        if self.category_exists:
+            print('The category already exists on Commons, no need to create it')
+            return None
         content = r'{{Wikidata Infobox}}'  # Only call this method if there is a valid Wikidata item!
         pars = {'action': 'edit',
                 'title': f'Category:{self.catname}',
@@ -408,21 +834,57 @@ class Image:
     # First get the number of the item on Wikidata and the associated claims
     def ini_wikidata(self):
         """this function will generate the item number and gets the claims connected to that item"""
-        # first, get the initial json from the API ()
-        pars = {'action': 'wbgetentities',
+        # first, check the latest revision of the item (the item itself might still be in the cache)
+        response = self._cached_wikidata(self._wikidata.get(self._wikidata_query('info')))
+        if response is None:
+            response = self._wikidata.get(self._wikidata_query())
+            self._cache_wikidata(response)
+        return self._store_wikidata(response)
+
+    def _wikidata_query(self, props='info|claims|sitelinks'):
+        """Request used by ini_wikidata (props=info is the cheap check of the latest revision)"""
+        return {'action': 'wbgetentities',
                 'titles': self.name,
                 'sites': 'nlwiki',
-                'props': 'claims'}
-        q = self._wikidata.get(pars)['entities']
+                'props': props,
+                'sitefilter': 'commonswiki'}
+
+    @staticmethod
+    def _cached_wikidata(probe):
+        """
+        Builds the response to _wikidata_query from the cache, if the item did not change since it was cached.
+        probe is the response to _wikidata_query('info'). Returns None if the item must be downloaded.
+        """
+        qid, entity = next(iter(probe['entities'].items()))
+        if 'lastrevid' not in entity:
+            return probe  # The item does not exist, nothing more to download
+        cached = cache.get(f'wikidata:{qid}', entity['lastrevid'])
+        return None if cached is None else {'entities': {qid: cached}}
+
+    @staticmethod
+    def _cache_wikidata(response):
+        for qid, entity in response['entities'].items():
+            if 'lastrevid' in entity:
+                cache.put(f'wikidata:{qid}', entity['lastrevid'], entity)
+
+    def _store_wikidata(self, response):
+        """Stores the item number & claims from the response to _wikidata_query"""
+        q = response['entities']
         self.qid = next(iter(q.keys()))
         assert self.qid != '-1', 'I could not find a valid Wikidata item!'
-        self.claims = q[self.qid]['claims']
+        self._store_entity(q[self.qid])
 
         # Extraction of P569 & P570 to occur through other methods (call them by default)
         self.date_deceased()
         self.date_born()
         return self.qid, self.claims
 
+    def _store_entity(self, entity):
+        """Stores the claims, link to Commons & revision of the Wikidata item"""
+        self.claims = entity['claims']
+        self.sitelinks = entity.get('sitelinks', {})
+        self.wdrevid = entity.get('lastrevid')
+
     def interwiki(self):
         """This function will set the interwikilink to Commons at Wikidata"""
         if self.claims is None or self.qid is None:
@@ -453,9 +915,7 @@ class Image:
                 'summary': self.sum,
                 'entity': self.qid,
                 'value': f'"{self.file}"'}
-        k = self._wikidata.post(p18d)
-        self.claims['P18'] = self.claims.get('P18', []) + [k['claim']]
-        return k
+        return self._wikidata.post(p18d)  # The new claim is added to self.claims by apply_write
 
     def commons_cat(self):
         """This function will set the Commons category of the subject (P373)"""
@@ -474,42 +934,116 @@ class Image:
                 'value': f'"{self.catname}"'}  # Set a new P373 claim
         return self._wikidata.post(p18d)
 
+    def apply_write(self, bot, params, response):
+        """
+        Applies the response to a write to the local state: the claims, the structured data, the wikitext & revisions.
+        This way, nothing has to be read again after the edits (e.g. to store the claims in the db).
+        Called by the bots after every write that succeeded (see Bot.post).
+        """
+        if not response or 'error' in response:
+            return None  # Test mode, or the write failed
+        action, edit = params['action'], response.get('edit', {})
+        revid = response.get('pageinfo', response.get('entity', {})).get('lastrevid')
+        if bot is self._wikidata:
+            if action == 'wbeditentity' and 'entity' in response:
+                self._store_entity(response['entity'])
+            if 'claim' in response and self.claims is not None:
+                self._apply_claim(self.claims, response['claim'])
+            if action == 'wbsetsitelink' and 'sitelinks' in response.get('entity', {}):
+                self.sitelinks = dict(self.sitelinks or {}, **response['entity']['sitelinks'])
+            if revid is not None:
+                self.wdrevid = revid
+        elif bot is self._commons and action == 'edit':
+            if params.get('title') == f'Category:{self.catname}' and 'nochange' not in edit:
+                self._categories[self.catname] = True
+            elif params.get('title') == f'File:{self.file}' and 'newrevid' in edit:
+                self.comtext = self._edited_text(self.comtext, params)
+                self.comrevid, self.comtimestamp = edit['newrevid'], edit['newtimestamp']
+        elif bot is self._commons and action.startswith('wb'):  # Structured data of the file
+            if action == 'wbeditentity' and 'entity' in response:
+                self.mc = response['entity'].get('statements') or {}
+            if 'claim' in response and self.mc is not None:
+                self._apply_claim(self.mc, response['claim'])
+            if revid is not None:
+                self.comrevid, self.comtimestamp = revid, None  # The time of the new revision is not returned
+        elif bot is self._nl and action == 'edit' and 'newrevid' in edit:
+            self.article = self._edited_text(self.article, params)
+            self.article_revid, self.article_timestamp = edit['newrevid'], edit['newtimestamp']
+        return response
+
+    @staticmethod
+    def _apply_claim(claims, claim):
+        """Adds a claim to the claims of an entity (or replaces the claim with the same id, e.g. after a new qualifier)"""
+        existing = claims.setdefault(claim['mainsnak']['property'], [])
+        for n, i in enumerate(existing):
+            if i.get('id') == claim.get('id'):
+                existing[n] = claim
+                return None
+        existing.append(claim)
+
+    @staticmethod
+    def _edited_text(text, params):
+        """The wikitext after an edit with the given parameters (text, prependtext or appendtext)"""
+        if 'text' in params:
+            return params['text']
+        if text is None:
+            return None
+        return params.get('prependtext', '') + text + params.get('appendtext', '')
+
     def purge(self):
         """This function will purge the cache of the corresponding page on Commons and the Wikidata-item"""
+        self.purge_commons()
+        self.purge_wikidata()
+        self.purge_nl()
+
+    @staticmethod
+    def _purge(bot, title):
+        return bot.post({'action': 'purge',
+                         'titles': title,
+                         'forcelinkupdate': True,
+                         'forcerecursivelinkupdate': True})
+
+    def purge_commons(self):
         print('I am starting with purging the cache of the file on Commons.')
-        purgedic = {'action': 'purge',
-                    'titles': f'Category:{self.catname}',
-                    'forcelinkupdate': True,
-                    'forcerecursivelinkupdate': True}
-        self._commons.post(purgedic)
-        p2d = purgedic.copy()
+        return self._purge(self._commons, f'Category:{self.catname}')
+
+    def purge_wikidata(self):
         print('Clearing the cache on Wikidata now.')  # Preparing to go to Wikidata
-        p2d['titles'] = self.qid
-        self._wikidata.post(p2d)
+        return self._purge(self._wikidata, self.qid)
+
+    def purge_nl(self):
         print('Preparing to empty the cache on the Dutch Wikipedia')
-        p3d = purgedic.copy()  # Also do the Dutch Wikipedia
-        p3d['titles'] = self.name
-        self._nl.post(p3d)
+        return self._purge(self._nl, self.name)
+
+    def purge_targets(self):
+        """The pages purged after an upload, as (bot, title) for purge_pages (which can combine them with other uploads)"""
+        targets = [(self._commons, f'Category:{self.catname}'), (self._nl, self.name)]
+        if self.qid not in (None, '-1'):
+            targets.append((self._wikidata, self.qid))
+        return targets
+
+    def full_urls(self):
+        """The urls of the image on Commons & the article on nlwiki (used until the short urls are made)"""
+        # https:// added in front of the parser
+        return ('https://' + urllib.parse.quote(f'commons.wikimedia.org/wiki/File:{self.file}'),
+                'https://' + urllib.parse.quote(f'nl.wikipedia.org/wiki/{self.name}'))
 
     # Generate a shortened URL to the image on Commons
     def short_url_commons(self):
         """This function will generate a shortened url for the image"""
-        url = 'https://' + urllib.parse.quote(
-            f'commons.wikimedia.org/wiki/File:{self.file}')  # https:// added in front of the parser
         z = self._meta.short({'action': 'shortenurl',
-                              'url': url})
+                              'url': self.full_urls()[0]})
         return z['shortenurl']['shorturl']
 
     def short_url_nlwiki(self):
         """This function will generate a shortened url for the article on nlwiki"""
-        url = 'https://' + urllib.parse.quote(
-            f'nl.wikipedia.org/wiki/{self.name}')  # https:// added in front of the parser
         z = self._meta.short({'action': 'shortenurl',
-                              'url': url})
+                              'url': self.full_urls()[1]})
         return z['shortenurl']['shorturl']
 
     def short_urls(self):
-        return self.short_url_commons(), self.short_url_nlwiki()
+        """Both short urls, requested at the same time"""
+        return run_sync(AsyncImage(self).short_urls())
 
     def date_deceased(self):
         """
@@ -588,12 +1122,18 @@ class Image:
         """
         if date is None:  # If no explicit value is passed, get the class
             date = self.date
-        if self.death is not None and date > self.death:
+        date = self._day(date)  # The date of the image is a date, birth & death are datetimes
+        if self.death is not None and date > self._day(self.death):
             return False
-        if self.birth is not None and date < self.birth:
+        if self.birth is not None and date < self._day(self.birth):
             return False  # Obviously, person was not alive at this point...
         return True
 
+    @staticmethod
+    def _day(value):
+        """The day of a date or datetime (a datetime cannot be compared with a date)"""
+        return value.date() if isinstance(value, dt.datetime) else value
+
     def get_date_from_commons_text(self):
         # To do (20260314 HACKATHON): check this one
         # Checked 20260405
@@ -627,12 +1167,26 @@ class Image:
         Returns: the point in time at which the image was generated.
         """
         self.get_date_from_commons_text()
+        if self.date is None and not self._exif_checked:
+            return self._store_image_date(self._commons.get(self._image_date_query()))
+        return self.date
+
+    def _image_date_query(self):
+        """Request used by get_image_date (the EXIF-data of the file)"""
+        return {'action': 'query',
+                'titles': f'File:{self.file}',
+                'prop': 'imageinfo',
+                'iiprop': 'commonmetadata'}
+
+    def _store_image_date(self, z):
+        """Gets the date at which the image was made from the response to _image_date_query"""
+        return self._date_from_imageinfo(next(iter(z['query']['pages'].values())))
+
+    def _date_from_imageinfo(self, page):
+        """Gets the date at which the image was made from the imageinfo (commonmetadata) of the file page"""
+        self._exif_checked = True
         if self.date is None:
-            z = self._commons.get({'action': 'query',
-                                   'titles': f'File:{self.file}',
-                                   'prop': 'imageinfo',
-                                   'iiprop': 'commonmetadata'})
-            q = next(iter(z['query']['pages'].values()))['imageinfo'][0]['commonmetadata']
+            q = page['imageinfo'][0]['commonmetadata']
             t = [i['value'] for i in q if 'datetime' in i['name'].lower().strip()]
             d = sorted((i for i in t if i.count(':') == 4))  # Filter the correct format
             if not d:  # We got an empty list, no valid dates were passed
@@ -664,15 +1218,11 @@ class Image:
             if idc is None:  # Bit difficult to set a qualifier if the image is not yet set
                 raise ValueError('The image was not attached to the Wikidata item!')
             if 'P585' not in i.get('qualifiers', ()):  # Code should only be executed if this hasn't been specified yet
-                deceased = self.date_deceased()
-                if deceased is not None and self.check_person_alive():
-                    print(
-                        'The metadata are likely corrupt, so I will not add a date past the date at which the subject died.')
+                if not self._date_qualifier_allowed():
                     return None  # Return None to abort this function
-                val = f'"time": "+{self.date.isoformat()}Z", "timezone": 0, "before": 0, "after": 0, "precision": 11, "calendarmodel": "http://www.wikidata.org/entity/Q1985727"'
                 n = {'action': 'wbsetqualifier',
                      'claim': idc,
-                     'value': '{' + val + '}',
+                     'value': codec.dumps_str(self._date_value()),
                      'snaktype': 'value',
                      'property': 'P585',
                      'summary': self.sum,
@@ -681,24 +1231,113 @@ class Image:
         else:
             print('Could not find a useful date')
 
+    def _date_qualifier_allowed(self):
+        """Checks whether the date of the image can be added as a qualifier (P585)"""
+        deceased = self.date_deceased()
+        if deceased is not None and not self.check_person_alive():
+            print('The metadata are likely corrupt, so I will not add a date past the date at which the subject died.')
+            return False
+        return True
+
+    def _date_value(self):
+        """The date of the image as a Wikibase time value (precision: day)"""
+        return {'time': f'+{self.date.year:04d}-{self.date.month:02d}-{self.date.day:02d}T00:00:00Z',
+                'timezone': 0,
+                'before': 0,
+                'after': 0,
+                'precision': 11,
+                'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}
+
+    def wikidata_entity_data(self, category=True, image=True):
+        """
+        Builds the data for a single wbeditentity that does all Wikidata edits of an upload:
+            * category: P373 & the sitelink to the category on Commons
+            * image: P18 (with the date of the image as P585 qualifier)
+        Only the things that are not yet on the item are included. Returns an empty dictionary if nothing is missing.
+        """
+        if self.claims is None or self.qid is None:
+            self.ini_wikidata()
+        claims, data = [], {}
+        if image is True:
+            if self.date is None:
+                self.get_image_date()
+            existing = [i for i in self.claims.get('P18', ()) if i['mainsnak']['datavalue']['value'] == self.file]
+            if not existing:
+                if self.claims.get('P18'):
+                    print('Watch out, there are already images present! Please check this!')
+                claim = self._statement('P18', self.file)
+            else:
+                claim = existing[0]  # Sending the claim with its id updates it (adding the qualifier)
+            if self.date is not None and 'P585' not in claim.get('qualifiers', {}) and self._date_qualifier_allowed():
+                claim = dict(claim, qualifiers=dict(claim.get('qualifiers', {}),
+                                                    P585=[{'snaktype': 'value',
+                                                           'property': 'P585',
+                                                           'datavalue': {'value': self._date_value(),
+                                                                         'type': 'time'}}]))
+            if not existing or claim is not existing[0]:  # New claim, or an existing one that got a qualifier
+                claims.append(claim)
+        if category is True:
+            if not any(i['mainsnak']['datavalue']['value'] == self.catname for i in self.claims.get('P373', ())):
+                claims.append(self._statement('P373', self.catname))
+            link = f'Category:{self.catname}'
+            if (self.sitelinks or {}).get('commonswiki', {}).get('title') != link:
+                data['sitelinks'] = {'commonswiki': {'site': 'commonswiki', 'title': link}}
+        if claims:
+            data['claims'] = claims
+        return data
+
+    def edit_wikidata(self, category=True, image=True):
+        """
+        Does all Wikidata edits of the upload (see wikidata_entity_data) in a single wbeditentity.
+        If the wiki refuses the combined edit, the edits are done one by one (so one failing part does not block the rest).
+        """
+        data = self.wikidata_entity_data(category, image)
+        if not data:
+            print('Everything was already present on Wikidata')
+            return None
+        params = {'action': 'wbeditentity',
+                  'id': self.qid,
+                  'data': codec.dumps_str(data),
+                  'summary': self.sum,
+                  'bot': True}
+        if self.wdrevid is not None:
+            params['baserevid'] = self.wdrevid  # Refuses the edit if the item changed since we read it
+        k = self._wikidata.post(params)  # The item in the response is stored by apply_write
+        if 'error' in k:
+            print(f"The combined edit on Wikidata failed ({k['error'].get('code')}), doing the edits one by one")
+            self.ini_wikidata()  # Start from the current state of the item
+            if category is True:
+                self.interwiki()
+                self.commons_cat()
+            if image is True:
+                self.set_image()
+                self.date_meta()
+        return k
+
     def get_commons_claims(self):
         """This function will get the claims on Commons (and content of the page)"""
-        temp = self._commons.get({'action': 'wbgetentities',
-                                  'props': 'claims',
-                                  'sites': 'commonswiki',
-                                  'titles': f'File:{self.file}'})['entities']
-        self.mid = next(iter(temp))
-        self.mc = next(iter(temp.values())).get('statements', {})  # 20260101: change default value to dict
-        # 20260313 - HACKATHON - bugfix: sometimes, no structured data on Commons, avoiding TypeErrors
-        if not isinstance(self.mc, dict):
-            self.mc = {}  # Data is completely missing, same as if it were there and empty
+        # Same request as in prefetch (structured data & wikitext are read together), so the memo can reuse it
+        self.read_from_plan('commons')
+        return self.mid, self.mc
+
+    def _file_claims(self):
+        """The structured data of the file (read if needed), AssertionError if the file was not found on Commons"""
+        if self.mc is None:
+            self.get_commons_claims()
+        assert self.mc is not None, f'Could not find the file {self.file} on Commons!'
+        return self.mc
 
     def get_commons_text(self, force_update=False):
-        """This function will get the content of the file page on Commons"""
+        """
+        This function will get the content of the file page on Commons
+        If force_update is True, the content is only downloaded again if the file page changed since we read it
+        """
         if self.comtext is None or force_update is True:
-            self.comtext = self._commons.get({'action': 'parse',
-                                              'page': f'File:{self.file}',
-                                              'prop': 'wikitext'})['parse']['wikitext']['*']
+            if self.comtext is not None and self.comrevid is not None:
+                if self._commons.latest_revid(f'File:{self.file}') == self.comrevid:
+                    return self.comtext  # Still the latest revision, no need to download it again
+                self.memo.invalidate(self._commons.api)  # The responses in the memo are outdated as well
+            self.read_from_plan('commons')
         return self.comtext  # Store this one as a variable of the class, will be more pratical
 
     def ticket(self, action=True):
@@ -706,22 +1345,11 @@ class Image:
         This function will add the ticket number (from the Wikiportrait template) as P6305 on Commons
         """
         # First, check whether the number has already been set or not
-        if self.mc is None:
-            self.get_commons_claims()
+        self._file_claims()
         if self.mc.get('P6305') is None:  # the property still has to be set
-            if self.comtext is None:
-                self.get_commons_text()
-            tick = re.findall(r'(\{\{wikiportrait2\|\d{16})', self.comtext)
-            if not tick:
-                tick = re.findall(r'(\{\{PermissionTicket\|id=\d{16})', self.comtext)
-            if not tick:
-                print("I could not find a valid ticket number, will skip this for now.")
+            num = self._ticket_number()
+            if num is None:
                 return None  # No match found, just emptying this one
-            num = tick[0].replace('{', '').replace('}', '').replace('wikiportrait2|', '').replace(
-                'PermissionTicket|id=', '')
-            if not num.strip().isdigit():
-                print('Something went wrong, the obtained Ticket number is not an integer, so skipping.')
-                return None
             td = {'action': 'wbcreateclaim',
                   'snaktype': 'value',
                   'entity': self.mid,
@@ -736,23 +1364,43 @@ class Image:
             print('The ticket number is already added as a claim.')
             return self.mc.get('P6305')
 
+    def _ticket_number(self):
+        """Finds the VRT ticket number in the wikitext of the file page (None if there is no valid one)"""
+        if self.comtext is None:
+            self.get_commons_text()
+        tick = re.findall(r'(\{\{wikiportrait2\|\d{16})', self.comtext)
+        if not tick:
+            tick = re.findall(r'(\{\{PermissionTicket\|id=\d{16})', self.comtext)
+        if not tick:
+            print("I could not find a valid ticket number, will skip this for now.")
+            return None
+        num = tick[0].replace('{', '').replace('}', '').replace('wikiportrait2|', '').replace(
+            'PermissionTicket|id=', '')
+        if not num.strip().isdigit():
+            print('Something went wrong, the obtained Ticket number is not an integer, so skipping.')
+            return None
+        return num
 
     def get_licence_for_image(self):
-        if self.mc is None:
-            self.get_commons_claims()  # Set the claims using the previously defined function
+        self._file_claims()
 
         # First, do the P275 thingy
+        lic = self.licence  # Kept if P275 is already set (or if the file page has no permission line)
         if self.mc.get('P275') is None:
             if self.comtext is None:
                 self.get_commons_text()
-            k = re.findall('PERMISSION=\s?\S+ [\d.]+', self.comtext.upper())  # Filter the permission rule (using regex)
-            lic = sorted((i for i in k if i), key=lambda t: len(t))[-1].replace('PERMISSION', '').replace('=',
-                                                                                                          '').strip()
+            k = [i for i in re.findall(r'PERMISSION=\s?\S+ [\d.]+', self.comtext.upper()) if i]  # The permission rule
+            if k:
+                lic = sorted(k, key=lambda t: len(t))[-1].replace('PERMISSION', '').replace('=', '').strip()
         self.licence = lic
         return self.licence
 
-    def set_licence_properties(self):
-        """This function will set the copyright related structured data (P275 and P6216)"""
+    def set_licence_properties(self, public_domain=None):
+        """
+        This function will set the copyright related structured data (P275 and P6216)
+        public_domain is the decision of the operator on whether the file is in the public domain (see _copyrighted)
+        """
+        self._file_claims()
         if self.mc.get('P275') is None:
             self.get_licence_for_image()  # Get the licence for the image
             # Previous versions of the code had the licence incorporated here
@@ -778,14 +1426,9 @@ class Image:
 
         # Now set the second claim
         if self.mc.get('P6216') is None:
-            if self.comtext is None:
-                self.get_commons_text()
-            if any((i in self.comtext.lower() for i in ('pd', 'public domain'))):
-                print('I found a potential indication that the file could be in the public domain!')
-                a = input('\nIs this an incorrect indication? [y/n] ').lower().strip()
-                if a == 'n':
-                    print('Terminating the process of P6216 setting')
-                    return None
+            if not self._copyrighted(public_domain):
+                print('Terminating the process of P6216 setting')
+                return None
             val = '"entity-type": "item", "numeric-id": 50423863,"id": "Q50423863"'
             dic = {'action': 'wbcreateclaim',
                    'summary': self.sum,
@@ -799,12 +1442,114 @@ class Image:
         else:
             print('The copyright status was already present')
 
-    def add_category(self):
-        """This function will append the category generated before if it is not yet in the Commons datasheet"""
+    def _copyrighted(self, public_domain=None):
+        """
+        Checks whether the copyright status (P6216) can be set to copyrighted.
+        public_domain is the decision of the operator: True (public domain, P6216 is not set), False (copyrighted,
+            even if the file page hints at the public domain) or None (no decision, the file page is checked).
+        If the file page hints at the public domain (e.g. {{PD-...}}), the status is left for the operator to set.
+        """
+        if public_domain is not None:
+            return not public_domain
         if self.comtext is None:
             self.get_commons_text()
-        cat = f'[[Category:{self.catname}]]'
-        if cat in self.comtext:
+        if re.search(r'\bpd\b|public domain', self.comtext.lower()):  # Not in words like update or pdf
+            print('I found a potential indication that the file could be in the public domain! Please check this!')
+            return False
+        return True
+
+    @staticmethod
+    def _statement(prop, value, kind='string'):
+        """Builds a new statement for wbeditentity (kind is the type of the datavalue)"""
+        return {'type': 'statement',
+                'rank': 'normal',
+                'mainsnak': {'snaktype': 'value',
+                             'property': prop,
+                             'datavalue': {'value': value, 'type': kind}}}
+
+    @staticmethod
+    def _item_value(numeric_id):
+        """The value of a snak referring to a Wikidata item"""
+        return {'entity-type': 'item', 'numeric-id': int(numeric_id), 'id': f'Q{numeric_id}'}
+
+    def commons_entity_data(self, permission=True, depicted=True, public_domain=None, items=None):
+        """
+        Builds the data for a single wbeditentity that sets all structured data of the file on Commons:
+            * permission: P6305 (VRT ticket), P275 (licence) & P6216 (copyright status)
+            * depicted: P180 (the Wikidata item of the person in the image)
+        Only the properties that are missing in self.mc are included.
+        items are the Wikidata items of all people in the image (see ImageSet), every one that is not depicted yet is added.
+        """
+        self._file_claims()
+        claims = []
+        if permission is True:
+            if self.mc.get('P6305') is None:
+                num = self._ticket_number()
+                if num is not None:
+                    claims.append(self._statement('P6305', num))
+            if self.mc.get('P275') is None:
+                try:
+                    self.get_licence_for_image()
+                except IndexError:
+                    print('Could not find a license')
+                licq = Image.licenses.get(self.licence)
+                if licq is not None:
+                    claims.append(self._statement('P275', self._item_value(licq), 'wikibase-entityid'))
+                    if self.mc.get('P6216') is None and self._copyrighted(public_domain):
+                        claims.append(self._statement('P6216', self._item_value(50423863), 'wikibase-entityid'))
+            elif self.mc.get('P6216') is None and self._copyrighted(public_domain):
+                claims.append(self._statement('P6216', self._item_value(50423863), 'wikibase-entityid'))
+        if depicted is True and items is not None:
+            for i in items:
+                if i not in self._depicted():
+                    claims.append(self._statement('P180', self._item_value(i[1:]), 'wikibase-entityid'))
+        elif depicted is True and self.mc.get('P180') is None:
+            if self.qid is None:
+                self.ini_wikidata()
+            claims.append(self._statement('P180', self._item_value(self.qid[1:]), 'wikibase-entityid'))
+        return {'claims': claims} if claims else {}
+
+    def _depicted(self):
+        """The Wikidata items in the P180 claims of the file"""
+        return {i['mainsnak'].get('datavalue', {}).get('value', {}).get('id') for i in (self.mc or {}).get('P180', ())}
+
+    def edit_commons(self, permission=True, depicted=True, public_domain=None, items=None):
+        """
+        Sets all structured data of the file (see commons_entity_data) in a single wbeditentity.
+        If the wiki refuses the combined edit, the edits are done one by one.
+        """
+        data = self.commons_entity_data(permission, depicted, public_domain, items)
+        if not data:
+            print('All structured data were already present on Commons')
+            return None
+        params = {'action': 'wbeditentity',
+                  'id': self.mid,
+                  'data': codec.dumps_str(data),
+                  'summary': f'{self.sum}, upload via #Wikiportret',
+                  'bot': True}
+        if self.comrevid is not None:
+            params['baserevid'] = self.comrevid
+        k = self._commons.post(params)  # The structured data in the response are stored by apply_write
+        if 'error' in k:
+            print(f"The combined edit on Commons failed ({k['error'].get('code')}), doing the edits one by one")
+            if permission is True:
+                self.ticket()
+                self.set_licence_properties(public_domain)
+            if depicted is True:
+                for i in items if items is not None else (None,):
+                    self.depicts(i)
+        return k
+
+    def add_category(self, retry_conflict=True, names=None):
+        """
+        This function will append the category generated before if it is not yet in the Commons datasheet
+        names are the categories of all people in the image (see ImageSet), the missing ones are added in a single edit
+        """
+        if self.comtext is None:
+            self.get_commons_text()
+        cat = '\n'.join(i for i in dict.fromkeys(f'[[Category:{j}]]' for j in ((self.catname,) if names is None else names))
+                        if i not in self.comtext)
+        if not cat:
             print('The category was already in the text')
             return None
         dic = {'action': 'edit',
@@ -813,17 +1558,26 @@ class Image:
                'summary': f'{self.sum}: adding correct category',
                'nocreate': True,
                'appendtext': '\n' * (not self.comtext.endswith('\n')) + cat + '\n'}
-        self._commons.post(dic)
+        if self.comrevid is not None:
+            # We checked the category against this revision, the wiki refuses the edit if the page changed since then
+            dic['baserevid'], dic['basetimestamp'] = self.comrevid, self.comtimestamp
+        k = self._commons.post(dic)
+        if k.get('error', {}).get('code') == 'editconflict' and retry_conflict:
+            print('The file page was changed in the meantime, checking the category again')
+            self.get_commons_text(True)
+            return self.add_category(False, names)
+        # apply_write keeps track of the revision, the structured data are edited later on with this revision as base
         print('Category has been added.')
 
-    def depicts(self):
-        """This function adds a P180-statement to the file on Commons"""
-        if self.mc is None:
-            self.get_commons_claims()
-        if self.qid is None:
+    def depicts(self, qid=None):
+        """This function adds a P180-statement to the file on Commons (for another person in the image if qid is given)"""
+        self._file_claims()
+        if qid is None and self.qid is None:
             self.ini_wikidata()
-        if self.mc.get('P180') is None:
-            val = f'"entity-type": "item", "numeric-id": {self.qid[1:]},"id": "{self.qid}"'
+        present = self.mc.get('P180') is not None if qid is None else qid in self._depicted()
+        if not present:
+            qid = self.qid if qid is None else qid
+            val = f'"entity-type": "item", "numeric-id": {qid[1:]},"id": "{qid}"'
             dic = {'action': 'wbcreateclaim',
                    'summary': f'{self.sum}, upload via #Wikiportret',
                    'property': 'P180',
@@ -852,14 +1606,31 @@ class Image:
             return f'{self.name} in {self.date.year}'
         return self.name
 
-    def add_image_to_article(self):
+    def get_article(self, full=False):
+        """
+        Gets the current wikitext (and its revision) of the article on nlwiki
+        Only the lead section is downloaded, unless full is True (or lead_section is False)
+        """
+        if full is True:
+            self.lead_section = False
+        self.read_from_plan('nl')
+        return self.article
+
+    def _store_article(self, page):
+        """Stores the wikitext & revision of the article from a page in a query response"""
+        self.redirect = 'redirect' in page
+        if 'revisions' in page:
+            revision = page['revisions'][0]
+            self.article = revision['slots']['main']['*']
+            self.article_revid, self.article_timestamp = revision['revid'], revision['timestamp']
+
+    def add_image_to_article(self, retry_conflict=True):
         """This function is designed to add the image to the article in an automated fashion"""
-        # Get the current Wikitext
-        parsedic = {'action': 'parse',
-                    'page': self.name,
-                    'prop': 'wikitext'}
-        content = self._nl.get(parsedic)['parse']['wikitext'][
-            '*']  # The wikitext of the page (split into the various lines)
+        # Get the current Wikitext (if prefetch did not get it already)
+        if self.article is None:
+            self.get_article()
+        content = self.article  # The wikitext of the page (or of the lead section, see lead_section)
+        section = 0 if self.lead_section else None
 
         low = content.lower()  # Store once to reduce computation time
 
@@ -868,12 +1639,19 @@ class Image:
             return None  # Do not continue with this function
 
         # Check whether an infobox is present on the article (and get the rule with the image)
-        if self.file in content:
+        if self.file in content or self.file_in_article:
             print('\n\nERROR: Image was already on the page, please verify this!\n\n')
             return None  # File is already on the page, abort the run
+        prepend = None  # Text added in front of the article if there is no infobox
+        if section is not None and '{{infobox' not in low and self.article_infobox is not False:
+            # The infobox is further down the article (or we could not tell), so we need the entire article after all
+            print('The infobox is not in the lead section, getting the entire article')
+            self.article = None
+            self.get_article(full=True)
+            return self.add_image_to_article(retry_conflict)
         if '{{infobox' in low:  # If possible, we would like to place the image in an infobox
             # An infobox has been detected, initiate process of finding the place where the infobox
-            pattern1 = r'\|\s*afbeelding\s*=[^\|]+'  # Regex pattern to find out where the image is located
+            pattern1 = Image.image_parameter  # Regex pattern to find out where the image is located
             image_match = re.search(pattern1, low)
 
             pattern2 = r'\{{2}infobox[^|]+\}{2}'
@@ -892,7 +1670,7 @@ class Image:
                 content = content.replace(line, line.rstrip() + f' {self.file}\n')
 
                 # Next step: add caption to the infobox
-                caploc = re.search(r'\|\s*(bij|onder)schrift\s*=[^|]+',
+                caploc = re.search(Image.caption_parameter,
                                    content.lower())  # find where caption should be inserted - DO NOT REUSE LOW SINCE CHANGES WERE MADE
                 if caploc is not None:
                     check_caption = content[caploc.start():caploc.end()].rstrip().split('=')
@@ -925,7 +1703,8 @@ class Image:
 
         # Third part: no infobox is present - just prepend the new image
         else:
-            content = f'[[File:{self.file}|thumb|{self.generate_caption()}]]\n' + content
+            prepend = f'[[File:{self.file}|thumb|{self.generate_caption()}]]\n'
+            content = prepend + content
 
         # Remove template asking for a photo
         for i in ('fotogewenst', 'verzoek om afbeelding', 'afbeelding gewenst'):
@@ -936,18 +1715,179 @@ class Image:
         # Fourth part: post new content on the wiki (bot edit)
         editdic = {'action': 'edit',
                    'title': self.name,
-                   'text': content,
                    'notminor': True,
                    'bot': False,
                    'nocreate': True,
                    'summary': '+Upload via #Wikiportret'}
-        self._nl.post(editdic)
+        if prepend is not None and content == prepend + self.article:
+            editdic['prependtext'] = prepend  # Nothing else changed, so there is no need to send the article back
+        else:
+            editdic['text'] = content
+            if section is not None:
+                editdic['section'] = section
+        if self.article_revid is not None:
+            # The text might have been read a while ago, the wiki refuses the edit if the article changed since then
+            editdic['baserevid'], editdic['basetimestamp'] = self.article_revid, self.article_timestamp
+        k = self._nl.post(editdic)
+        if k.get('error', {}).get('code') == 'editconflict' and retry_conflict:
+            print('The article was changed in the meantime, trying again with the latest version')
+            self.article = None
+            return self.add_image_to_article(False)
 
         # Some cleaning, save the garbage collector some work
         del content, low
 
     def is_dp(self):
-        return self._nl.is_dp(self.name)
+        if self.dp is None:
+            self.dp = self._nl.is_dp(self.name)
+        return self.dp
+
+    # Reads done before processing the image, bundled by ReadPlan
+    def preflight(self):
+        """
+        Runs the checks of the upload on the data that were read (see prepare_image_data), without editing anything.
+        Returns a dictionary (can be stored as JSON) with the findings & the revision of the article they are based on:
+            * dp & redirect: the article is a disambiguation page or a redirect (the article is not edited then)
+            * file_in_article: the file is already used in the article
+            * infobox: the article has an infobox (None if we could not tell)
+            * infobox_image & caption: the image & caption parameter of the infobox are already filled in
+            * category & category_exists: the name of the category on Commons & whether it exists already
+            * p18: the images (P18) that are already on the Wikidata item
+            * alive: was the person alive at the date of the image (None if the date is unknown)
+            * public_domain_hint: the file page hints at the public domain, so P6216 is not set
+                unless the operator decides otherwise (None if the file page was not read)
+        """
+        if self.article is None:
+            self.get_article()
+        low = (self.article or '').lower()
+        if self.lead_section and '{{infobox' not in low and self.article_infobox is not False:
+            # The infobox is further down the article (or we could not tell), just like add_image_to_article does
+            self.get_article(full=True)
+            low = (self.article or '').lower()
+        if self.claims is None:
+            self.ini_wikidata()
+        # The same tests as in add_image_to_article
+        image, caption = re.search(Image.image_parameter, low), re.search(Image.caption_parameter, low)
+        image = image.group().strip().replace(' ', '') if image is not None else ''
+        caption = caption.group().rstrip().split('=') if caption is not None else []
+        self.preflight_report = {
+            'article_revid': self.article_revid,
+            'article_timestamp': self.article_timestamp,
+            'lead_section': self.lead_section,
+            'dp': bool(self.dp),
+            'redirect': bool(self.redirect) or '#redirect' in low or '#doorverwijzing' in low,
+            'file_in_article': bool(self.file_in_article) or self.file.lower() in low,
+            'infobox': True if '{{infobox' in low else self.article_infobox,
+            'infobox_image': len(image) > 12,  # Longer than |afbeelding=
+            'caption': len(caption) > 1 and bool(caption[1]),
+            'category': self.catname,
+            'category_exists': self.category_exists,
+            'p18': [i['mainsnak']['datavalue']['value'] for i in self.claims.get('P18', ())
+                    if 'datavalue' in i['mainsnak']],
+            'alive': self.check_person_alive() if self.date is not None else None,
+            'public_domain_hint': None if self.comtext is None else
+            (self.mc or {}).get('P6216') is None and not self._copyrighted()}
+        return self.preflight_report
+
+    def restore_preflight(self, report, article=None):
+        """
+        Restores the results of the reads of a preflight (see preflight), article is the wikitext that was checked.
+        The upload then only checks whether the article changed since (see AsyncImage.refresh_article).
+        """
+        self.preflight_report = report
+        self.dp, self.redirect = report['dp'], report['redirect']
+        self.file_in_article = report['file_in_article']
+        self.article_infobox = report['infobox']
+        self.lead_section = report['lead_section']
+        if report['category_exists'] is not None:
+            self._categories[report['category']] = report['category_exists']
+        if article is not None:
+            self.article = article
+            self.article_revid, self.article_timestamp = report['article_revid'], report['article_timestamp']
+        return report
+
+    def plan_reads(self, plan=None):
+        """
+        Adds all pages this Image needs to a ReadPlan (one request for Commons & one for nlwiki).
+        The Wikidata item is read separately (through ini_wikidata).
+        """
+        plan = ReadPlan() if plan is None else plan
+        plan.need('nl', self.name, 'pageprops|templates|images',
+                  slots='main',
+                  section=0 if self.lead_section else None,
+                  ppprop='disambiguation',
+                  tlnamespace=10,  # The templates tell whether there is an infobox outside the lead section
+                  tllimit='max',
+                  imimages=f'File:{self.file}')  # Is the file already used somewhere in the article?
+        plan.need('commons', f'File:{self.file}', 'imageinfo',
+                  slots='main|mediainfo',  # The mediainfo slot contains the structured data of the file
+                  iiprop='commonmetadata')
+        plan.need('commons', f'Category:{self.catname}', 'info')  # Only to check whether it exists
+        return plan
+
+    def _store_reads(self, wiki, response):
+        """Spreads the response to the ReadPlan query for a wiki over the attributes of the Image"""
+        pages = ReadPlan.pages(response)
+        if wiki == 'nl':
+            page = pages[self.name]
+            self.dp = 'disambiguation' in page.get('pageprops', {})
+            self._store_article(page)
+            if 'tlcontinue' in response.get('continue', {}):
+                self.article_infobox = None  # Not all templates were listed
+            else:
+                self.article_infobox = any(i['title'].split(':', 1)[-1].lower().startswith('infobox')
+                                           for i in page.get('templates', ()))
+            # With the reads of an ImageSet merged, the article lists every file that was asked for
+            self.file_in_article = any(self._is_file(i['title']) for i in page.get('images', ()))
+        elif wiki == 'commons':
+            self._store_file_page(pages[f'File:{self.file}'])
+            self._categories[self.catname] = 'missing' not in pages[f'Category:{self.catname}']
+
+    def _is_file(self, title):
+        """Is title (with the local namespace, e.g. Bestand:...) the file of this Image?"""
+        def normalized(name):
+            name = name.replace('_', ' ').strip()
+            return name[:1].upper() + name[1:]  # The first letter of a title is always a capital
+        return normalized(title.split(':', 1)[-1]) == normalized(self.file)
+
+    def _store_file_page(self, page):
+        """Stores the wikitext, structured data & date of the file from its page in a query response"""
+        if 'revisions' not in page:
+            print(f'Could not find the file {self.file} on Commons!')
+            return None
+        revision = page['revisions'][0]
+        self.comtext = revision['slots']['main']['*']
+        self.comrevid, self.comtimestamp = revision['revid'], revision['timestamp']
+        self.mid = f"M{page['pageid']}"
+        mediainfo = revision['slots'].get('mediainfo')  # Missing if the file has no structured data at all
+        self.mc = codec.loads(mediainfo['*']).get('statements', {}) if mediainfo is not None else {}
+        if not isinstance(self.mc, dict):
+            self.mc = {}  # Empty structured data are stored as a list
+        self.get_date_from_commons_text()
+        if 'imageinfo' in page:
+            self._date_from_imageinfo(page)
+
+    def read_from_plan(self, wiki):
+        """Sends the request of the ReadPlan for a single wiki (and gets the content that was not cached)"""
+        bot, plan = {'commons': self._commons, 'nl': self._nl}[wiki], self.plan_reads()
+        response = bot.get(plan.queries()[wiki])
+        query = plan.content_query(wiki, response)
+        if query is not None:
+            plan.add_content(wiki, bot.get(query))
+        self._store_reads(wiki, response)
+
+    @property
+    def api_calls_saved(self):
+        """Number of API calls of this session that were answered by the memo"""
+        return self.memo.saved
+
+    def prefetch(self, wikidata=True):
+        """Does all reads needed to process the image, using a single request per wiki"""
+        return run_sync(AsyncImage(self).prefetch(wikidata))
+
+    def prefetch_tokens(self):
+        """Gets the tokens for Commons, Wikidata & nlwiki in parallel, before the first edit needs them"""
+        return run_sync(AsyncImage(self).prefetch_tokens())
 
     # Method to be used by the future interface
     # This method just parses the data that are needed for future inputs
@@ -960,47 +1900,178 @@ class Image:
         # First things first (addition 2024-03-22)
         # Check whether the requested page on the Dutch Wikipedia is a disambiguation page
         # If a disambiguation page is detected, an error will be thrown
+        print('Getting the information from Commons, Wikidata & nlwiki')
+        self.prefetch()
         if self.is_dp():
             print('ERROR: the page you passed is a disambiguation page!')
             raise ValueError('Found a disambiguation page - stopping the processing!')
 
-        print('Getting the information (starting with Commons)')
-        self.get_commons_claims()
-        self.get_commons_text()
-
-        print('Now getting the information from Wikidata')
-        self.ini_wikidata()
-
-        print('Getting information on when the image was generated')
-        self.get_image_date()
-
-    def prepare_image_data(self):
-        # More or less the same as prepare_information, just with threading enabled
+    def set_deadline(self, deadline):
+        """
+        Gives the session a time budget (in seconds, or a Deadline), shared by the four bots & the retry policy.
+        Every request takes its timeouts from the time that is left, DeadlineExceeded is raised once it is used up.
+        """
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+        self.deadline = self.retry.deadline = deadline
+        for i in list(self._bots.values()):  # The bots that are made later on get it from the Image
+            i.deadline = deadline
+        return deadline
+
+    def prepare_image_data(self, deadline=None):
+        # More or less the same as prepare_information, just with the requests running concurrently
+        if deadline is not None:
+            self.set_deadline(deadline)
         self.testing = True  # This is a safety measure to present
-        # First, check whether we are dealing with a dp
-        if self.is_dp():
-            print('ERROR: the page you passed is a disambiguation page!')
-            raise ValueError('Found a disambiguation page - stopping the processing!')
         # Vamos!
-        # For convenience, add threads to this party
-        t1 = threading.Thread(target=self.get_commons_claims)
-        t2 = threading.Thread(target=self.get_commons_text)
-
-        t1.start()
-        t2.start()
-        t1.join()
-        t2.join()
-
-        # Wikidata
-        t3 = threading.Thread(target=self.ini_wikidata)
-        t3.start()
-        t3.join()
-
-        self.get_image_date()
+        # All reads are independent, so they are awaited together (see AsyncImage)
+        return run_sync(AsyncImage(self).prepare_image_data())
 
-        return True
-
-    def __call__(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, conf=False, test=False):
+    def upload_steps(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, combine=True,
+                     public_domain=None, post_process=True):
+        """
+        Returns the steps of __call__ (see Wikiportret_schedule), the arguments are the same as for __call__.
+        Errors are isolated in the same way as before: an error on the permissions on Commons
+            or a missing Wikidata item only stops the steps that depend on it.
+        """
+        commons, wikidata, nl, meta = (http.host_of(i.api) for i in (self._commons, self._wikidata, self._nl, self._meta))
+        commons_error = 'Something went wrong while processing the stuff for Commons.'
+        no_item = ("I could NOT find a valid Wikidata-item. Please verify the input, and then rerun the bot. "
+                   "You might have to manually create the item.")
+        steps = [Step('wikidata', self.ini_wikidata, wikidata, errors=(AssertionError,), message=no_item,
+                      description='Getting claims and other data from Wikidata before starting to work on that item & its associated stuff on Commons.')]
+        if post_process is True:
+            # The short urls do not depend on any edit, so they are made while the edits are done
+            steps.append(Step('short_urls', self.short_urls, meta,
+                              description='I will now just generate two short url-links, which look nicer in the ticket of the customer.'))
+        if commons_perm is True and combine is False:
+            steps.append(Step('ticket', self.ticket, commons, errors=commons_errors, message=commons_error,
+                              description='I will now add the P6305 property to the file on Commons - the VRT-ticket number'))
+            steps.append(Step('licence', lambda: self.set_licence_properties(public_domain), commons,
+                              needs=('ticket',), errors=commons_errors, message=commons_error,
+                              description='Now adding other information on copyright (P275/P6216)'))
+        if category is True:
+            # The category contains the Wikidata Infobox, so it is only made if we found the item
+            steps.append(Step('make_cat', self.make_cat, commons, needs=('wikidata',),
+                              errors=(AssertionError,), message=no_item,
+                              description="I'm now making the category on Commons. If an error occurs, it likely means that the category already existed."))
+            steps.append(Step('add_category', self.add_category, commons, needs=('make_cat',),
+                              errors=(AssertionError,), message=no_item,
+                              description='The eleventh commandment of the Lord states that we should also check whether the category is attached to the file, so doing that now'))
+            if combine is False:  # The sitelink & P373 need the category
+                steps.append(Step('interwiki', self.interwiki, wikidata, needs=('make_cat',),
+                                  errors=(AssertionError,), message=no_item,
+                                  description='I will add the category on Commons to Wikidata.'))
+                steps.append(Step('commons_cat', self.commons_cat, wikidata, needs=('make_cat',),
+                                  errors=(AssertionError,), message=no_item))
+        if data_connect is True and combine is False:
+            steps.append(Step('depicts', self.depicts, commons, needs=('wikidata',),
+                              errors=(AssertionError,), message=no_item,
+                              description='Adding a P180-claim to Commons to list the identity of the depicted person.'))
+            steps.append(Step('set_image', self.set_image, wikidata, needs=('wikidata',),
+                              errors=(AssertionError,), message=no_item,
+                              description='Now continuing with the P18 property (connecting the image to the Wikidata item).'))
+            # The date is a qualifier (P585) of the P18 claim, so it needs the id of that claim
+            steps.append(Step('date_meta', self.date_meta, wikidata, needs=('set_image',),
+                              errors=(AssertionError,), message=no_item,
+                              description='I proceed with setting the date as a qualifyer for the image.'))
+        if combine is True and (category is True or data_connect is True):
+            steps.append(Step('edit_wikidata', lambda: self.edit_wikidata(category, data_connect), wikidata,
+                              needs=('wikidata', 'make_cat'), errors=(AssertionError,), message=no_item,
+                              description='Adding the image, its date, the category & the link to Commons to Wikidata in a single edit.'))
+        if combine is True and (commons_perm is True or data_connect is True):
+            # P180 is only possible if we found the Wikidata item, the edit uses the revision made by add_category
+            steps.append(Step('edit_commons',
+                              lambda: self.edit_commons(commons_perm,
+                                                        data_connect is True and self.qid not in (None, '-1'),
+                                                        public_domain),
+                              commons, after=('wikidata', 'add_category'), errors=commons_errors, message=commons_error,
+                              description='Adding the ticket number, copyright information & depicted person to Commons in a single edit.'))
+        if nlwiki is True:
+            steps.append(Step('article', self.add_image_to_article, nl,
+                              description='I will now add the image to the Dutch Wikipedia.'))
+
+        if post_process is False:
+            return steps  # Purging is done later (see purge_pages)
+
+        # The caches are purged once all edits on a wiki are done
+        steps.append(Step('purge_commons', self.purge_commons, commons,
+                          after=[i.name for i in steps if i.host == commons]))
+        steps.append(Step('purge_wikidata', self.purge_wikidata, wikidata,
+                          after=[i.name for i in steps if i.host == wikidata]))
+        steps.append(Step('purge_nl', self.purge_nl, nl,
+                          after=[i.name for i in steps if i.host == nl]))
+        return steps
+
+    def record_step(self, name, result):
+        """
+        Stores that a step of __call__ is done, with the part of its result we need to resume the upload.
+        Only ids, revisions & short urls are kept (no page contents), so the checkpoints can go to the db.
+        Overload this to store the checkpoints somewhere else as well (see WebImage).
+        """
+        record = {}
+        if name == 'wikidata':
+            record = {'qid': self.qid, 'revid': self.wdrevid}
+        elif name == 'short_urls':
+            record = {'urls': list(result)}
+        elif isinstance(result, dict):
+            if 'claim' in result:
+                record['claim'] = result['claim']  # The id of the P18 claim is needed for the P585 qualifier
+            for i in ('edit', 'pageinfo', 'entity'):
+                revid = result.get(i, {}).get('newrevid', result.get(i, {}).get('lastrevid'))
+                if revid is not None:
+                    record['revid'] = revid
+        self.checkpoints[name] = record
+        return record
+
+    def restore_step(self, name, record):
+        """Restores the state after a step that was done in an earlier run, returns the result of the step"""
+        if name == 'wikidata':
+            if self.claims is None:
+                return self.ini_wikidata()  # The claims were not stored with the checkpoints
+            self.qid = record['qid']
+            if self.wdrevid is None:
+                self.wdrevid = record['revid']
+            return self.qid, self.claims
+        if name == 'short_urls':
+            return tuple(record['urls'])
+        claim = record.get('claim')
+        if claim is not None and self.claims is not None:
+            if all(i.get('id') != claim.get('id') for i in self.claims.get('P18', ())):
+                self.claims['P18'] = self.claims.get('P18', []) + [claim]
+        return record
+
+    def plan_upload(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, combine=True,
+                    public_domain=None):
+        """
+        Planning mode of __call__ (same arguments): does all reads, but only collects the writes in an EditPlan.
+        The plan can be stored (EditPlan.to_json) & applied later on (see apply_plan & Wikiportret_plan.apply).
+        Note: the state of the Image is updated as if the writes were done, so use a fresh Image to do the upload.
+        """
+        self.prefetch(wikidata=False)
+        if self.is_dp():
+            print('WARNING: the page you passed is a disambiguation page!')
+            raise ValueError('Found a disambiguation page - stopping the processing!')
+        plan = plans.EditPlan({'file': self.file, 'name': self.name})
+        bots = (self._commons, self._wikidata, self._nl)
+        for i in bots:
+            i.plan = plan
+        try:
+            Scheduler(self.upload_steps(commons_perm, category, data_connect, nlwiki, combine, public_domain, False),
+                      fatal=(DeadlineExceeded,)).run()
+        finally:
+            for i in bots:
+                i.plan = None
+        plan.info['qid'] = self.qid
+        return plan
+
+    def apply_plan(self, plan):
+        """Applies a plan (see plan_upload) with the bots of this Image, returns write id => response"""
+        bots = {i.api: i for i in (self._commons, self._wikidata, self._nl, self._meta)}
+        return plans.apply([plan], lambda _, api: bots[api])[0]
+
+    def __call__(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, conf=False, test=False,
+                 combine=True, public_domain=None, deadline=None, post_process=True):
         """This function can be used to do handle an entire request at once.
         Arguments (and their function):
             * Commons_perm: if set to True, the bot will set all permission-related properties of the file @Commons
@@ -1009,10 +2080,26 @@ class Image:
             * Nlwiki: if set to True, the image will be placed on the Dutch Wikipedia article.
             * Conf: is set to True, the confirmation for VRT will be printed explicitly.
             * Test: if set to True, the bot will be run in its test mode - so not making any edits to the wiki
+            * Combine: if set to True, all edits on Wikidata are done in a single edit (see edit_wikidata),
+                and all structured data on Commons in another one (see edit_commons)
+            * Public_domain: True if the operator indicated that the file is in the public domain (P6216 is not set),
+                False if it is copyrighted for sure, None to let the bot check the file page (see _copyrighted)
+            * Deadline: time budget for the entire run (seconds or a Deadline), DeadlineExceeded is raised once it is used up
+            * Post_process: if set to False, the caches are not purged & the confirmation uses the full urls,
+                so this can be done later on (see purge_pages & short_urls)
+        The steps in self.checkpoints (done in an earlier run that failed) are skipped, so a failed run can be resumed.
         """
 
         # Make sure the bot is set to test mode (and does not make any edits)
+        if deadline is not None:
+            self.set_deadline(deadline)
         self.testing = test
+        if not self.testing:
+            self.prefetch_tokens()  # All tokens in one round-trip, instead of one before the first edit on each wiki
+
+        # Read the file page, category & article with one request per wiki
+        # The Wikidata item is read further down, errors there should not stop the work on Commons
+        self.prefetch(wikidata=False)
 
         # First things first (addition 2024-03-22)
         # Check whether the requested page on the Dutch Wikipedia is a disambiguation page
@@ -1021,86 +2108,354 @@ class Image:
             print('WARNING: the page you passed is a disambiguation page!')
             raise ValueError('Found a disambiguation page - stopping the processing!')
 
-        # Category on Wikimedia Commons
-        print('I will now process the image on Commons')
-
-        # Properties that should be set on Commons
-        print(
-            "I'll initialize the interface for Commons (getting the claims already present and the page of the file).")
-        try:
-            # Perform these tasks at all time
-            self.get_commons_claims()
-            self.get_commons_text()
-            if commons_perm is True:  # Only perform this task when requested
-                print('I will now add the P6305 property to the file on Commons - the VRT-ticket number')
-                self.ticket()
-                print('Now adding other information on copyright (P275/P6216)')
-                self.set_licence_properties()
-                print('Property set, I will need support from Wikidata for the next steps.')
-        # noinspection PyBroadException
-        except:
-            print('Something went wrong while processing the stuff for Commons.')
-
-        # Setting the properties on Wikidata
-        try:
-            # Always perform this task
-            print(
-                'Getting claims and other data from Wikidata before starting to work on that item & its associated stuff on Commons.')
-            self.ini_wikidata()
-            print(
-                'Initialization done, I can now safely generate the category and link to Wikidata on Commons and tell Commons who is depicted (if you allow me to).')
-            if category is True:  # Only perform these edits when the user commands them
-                print(
-                    "I'm now making the category on Commons. If an error occurs, it likely means that the category already existed.")
-                self.make_cat()
-                print(
-                    'The eleventh commandment of the Lord states that we should also check whether the category is attached to the file, so doing that now')
-                self.add_category()
-                print('I will add the category on Commons to Wikidata.')
-                self.interwiki()
-                self.commons_cat()
-                print('The category was placed on Commons and connected to Wikidata.')
-            print('I have done all operations that should be done on Commons.')
-            if data_connect is True:  # Only connect the image if ordered to do so
-                print('I will now identify the person in the image, as requested.')
-                print('Adding a P180-claim to Commons to list the identity of the depicted person.')
-                self.depicts()
-                print('I added the Wikidata item of the depicted person as P180 to the image.')
-                print('Now continuing with the P18 property (connecting the image to the Wikidata item).')
-                self.set_image()
-                print('The image has been set. I will now look for a date.')
-                # Doing one more Wikidata related thing, cause this needs the claims on Commons
-                print('I proceed with setting the date as a qualifyer for the image.')
-                self.date_meta()
-                print('The identity of the depicted is now properly listed on Wikidata and Commons.')
-
-        except AssertionError:
-            print(
-                "I could NOT find a valid Wikidata-item. Please verify the input, and then rerun the bot. You might have to manually create the item.")
-
-        # Last bit: add image to the Dutch Wikipedia (manually, to trigger watchlists)
-        if nlwiki is True:
-            print('I will now add the image to the Dutch Wikipedia.')
-            self.add_image_to_article()
-            print(
-                'I finished the addition. Check for eventual errors above. We hope you enjoyed the flight with us and hope to see you again!')
-
-        # Purge the cache on Wikidata, Commons and Wikipedia-nl
-        print('OKay, I will now start to purge the cache of the various items.')
-        self.purge()
-
-        # And now, the short url as final touch
-        print('I will now just generate two short url-links, which look nicer in the ticket of the customer.')
-        k = self.short_urls()
-        print(f'The short url for the Commons file is {k[0]}')
-        print(f'The short url for the article on nlwiki is {k[1]}')
+        # All edits are modelled as steps with dependencies (see upload_steps)
+        # Steps on different wikis are done at the same time, the steps on the same wiki are done one by one
+        # The steps that were done in an earlier (failed) run are not done again
+        scheduler = Scheduler(self.upload_steps(commons_perm, category, data_connect, nlwiki, combine, public_domain,
+                                                post_process),
+                              fatal=(DeadlineExceeded,),  # Out of time, there is no point in continuing
+                              done={i: self.restore_step(i, j) for i, j in self.checkpoints.items()},
+                              on_done=self.record_step if not self.testing else None)  # Nothing done in test mode
+        scheduler.run()
+        k = scheduler.results['short_urls'] if post_process is True else self.full_urls()
+        print(f'The url for the Commons file is {k[0]}')
+        print(f'The url for the article on nlwiki is {k[1]}')
         confirmation = self.generate_confirmation(k)  # pass the short urls as arguments, reduce the amount of API calls
         print('I generated the confirmation')
+        print(f'Time spent waiting for the wikis: {self.retry}')
         if conf is True:  # Default is False (for interaction with the other parts of the interface)
             print(confirmation)
         return self.name, k, confirmation
 
 
+def purge_pages(targets, batch=50):
+    """
+    Purges pages of many uploads with as few requests as possible.
+    targets are (bot, title) pairs (see Image.purge_targets), the titles on the same wiki are purged together,
+        batch titles in a single request (using the bot of the first target on that wiki).
+    """
+    wikis = {}  # api => (bot, titles)
+    for bot, title in targets:
+        titles = wikis.setdefault(bot.api, (bot, []))[1]
+        if title not in titles:
+            titles.append(title)
+    responses = []
+    for bot, titles in wikis.values():
+        for i in range(0, len(titles), batch):
+            print(f'Purging {len(titles[i:i + batch])} pages on {http.host_of(bot.api)}')
+            responses.append(bot.post({'action': 'purge',
+                                       'titles': '|'.join(titles[i:i + batch]),
+                                       'forcelinkupdate': True,
+                                       'forcerecursivelinkupdate': True}))
+    return responses
+
+
+class ImageSet:
+    """
+    A session with several files of the same person(s), or a group photo showing several people (or both).
+    The first file is the main file: it is placed in the articles & becomes the image (P18) of every subject.
+    Every file gets the ticket, the licence, all subjects as depicted (P180) & the categories of all subjects.
+    The reads that are shared (file pages, categories & articles) are done once for the entire set,
+        and the edits are grouped per entity: one edit per article, one Wikidata edit per subject,
+        one edit of the structured data & one of the wikitext (categories) per file.
+    """
+
+    def __init__(self, files, names, main=None):
+        """
+        files & names are the files & the subjects of the set, the first ones are those of the main file.
+        An existing Image (e.g. the WebImage of a session) can be passed as main, its login & data are used for the set.
+        """
+        files, names = list(dict.fromkeys(files)), list(dict.fromkeys(names))
+        assert files and names, 'Please provide at least one file and one subject!'
+        if main is not None:
+            assert (main.file, main.name) == (files[0], names[0]), 'The main Image must have the first file & subject!'
+        self.main = main if main is not None else Image(files[0], names[0])
+        self.files = [self.main] + [self.main.sibling(i, names[0]) for i in files[1:]]  # One Image per file
+        self.subjects = [self.main] + [self.main.sibling(files[0], i) for i in names[1:]]  # One Image per subject
+
+    def __str__(self):
+        return (f'Processing {", ".join(i.file for i in self.files)}, '
+                f'images of {", ".join(i.name for i in self.subjects)}.')
+
+    @property
+    def images(self):
+        """All Images of the set (the main one only once)"""
+        return self.files + self.subjects[1:]
+
+    @property
+    def testing(self):
+        return self.main.testing
+
+    @testing.setter
+    def testing(self, new):
+        for i in self.images:
+            i.testing = new
+
+    def set_deadline(self, deadline):
+        """One time budget for the entire set (see Image.set_deadline)"""
+        deadline = self.main.set_deadline(deadline)
+        for i in self.images[1:]:
+            i.set_deadline(deadline)
+        return deadline
+
+    def purge_targets(self):
+        """The pages of all subjects that are purged after the upload (see Image.purge_targets)"""
+        return [j for i in self.subjects for j in i.purge_targets()]
+
+    def short_urls(self):
+        return self.main.short_urls()
+
+    def generate_confirmation(self, shorts=None):
+        return self.main.generate_confirmation(shorts)
+
+    def plan_reads(self):
+        """A single ReadPlan with the pages of all Images (one request for Commons & one for nlwiki)"""
+        plan = ReadPlan()
+        for i in self.images:
+            i.plan_reads(plan)
+        return plan
+
+    def prefetch(self):
+        """Does the reads of all files & subjects, using a single request per wiki"""
+        plan, main = self.plan_reads(), AsyncImage(self.main)
+
+        async def read():
+            await asyncio.gather(*[main.read_from_plan(i, plan, self.images) for i in plan.queries()])
+
+        return run_sync(read())
+
+    def upload_steps(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, public_domain=None,
+                     post_process=True):
+        """
+        Returns the steps of __call__ (see Image.upload_steps, the edits are always combined).
+        A subject without Wikidata item is skipped, just like a single upload: no category, no claims & no P180.
+        """
+        main = self.main
+        commons, wikidata, nl, meta = (http.host_of(i.api) for i in (main._commons, main._wikidata, main._nl, main._meta))
+        commons_error = 'Something went wrong while processing the stuff for Commons.'
+        no_item = ("I could NOT find a valid Wikidata-item. Please verify the input, and then rerun the bot. "
+                   "You might have to manually create the item.")
+        found = lambda: [i for i in self.subjects if i.qid not in (None, '-1')]  # Subjects with a Wikidata item
+        steps = []
+        for i in self.subjects:
+            steps.append(Step(f'wikidata {i.name}', i.ini_wikidata, wikidata, errors=(AssertionError,), message=no_item,
+                              description=f'Getting claims and other data of {i.name} from Wikidata.'))
+            if category is True:
+                steps.append(Step(f'make_cat {i.name}', i.make_cat, commons, needs=(f'wikidata {i.name}',),
+                                  errors=(AssertionError,), message=no_item,
+                                  description=f'Making the category of {i.name} on Commons (if it does not exist yet).'))
+            if category is True or data_connect is True:
+                steps.append(Step(f'edit_wikidata {i.name}', lambda i=i: i.edit_wikidata(category, data_connect),
+                                  wikidata, needs=(f'wikidata {i.name}', f'make_cat {i.name}'),
+                                  errors=(AssertionError,), message=no_item,
+                                  description=f'Adding the image, the category & the link to Commons to the item of {i.name}.'))
+            if nlwiki is True:
+                steps.append(Step(f'article {i.name}', i.add_image_to_article, nl,
+                                  description=f'I will now add the image to the article on {i.name}.'))
+        items = [f'wikidata {i.name}' for i in self.subjects]
+        categories = [f'make_cat {i.name}' for i in self.subjects] if category is True else []
+        for i in self.files:
+            if category is True:
+                steps.append(Step(f'add_category {i.file}',
+                                  lambda i=i: i.add_category(names=[j.catname for j in found() if j.category_exists]),
+                                  commons, after=categories, errors=(AssertionError,), message=no_item,
+                                  description=f'Adding the categories to {i.file}.'))
+            if commons_perm is True or data_connect is True:
+                steps.append(Step(f'edit_commons {i.file}',
+                                  lambda i=i: i.edit_commons(commons_perm, data_connect is True and bool(found()),
+                                                             public_domain, [j.qid for j in found()]),
+                                  commons, after=items + [f'add_category {i.file}'], errors=commons_errors,
+                                  message=commons_error,
+                                  description=f'Adding the ticket number, copyright information & depicted people to {i.file}.'))
+        if post_process is True:
+            steps.append(Step('short_urls', main.short_urls, meta,
+                              description='I will now just generate two short url-links, which look nicer in the ticket of the customer.'))
+            # All pages of the set are purged at once, when all edits are done
+            steps.append(Step('purge', lambda: purge_pages(self.purge_targets()),
+                              after=[i.name for i in steps]))
+        return steps
+
+    def __call__(self, commons_perm=True, category=True, data_connect=True, nlwiki=True, conf=False, test=False,
+                 public_domain=None, deadline=None, post_process=True):
+        """
+        Handles the entire set at once, the arguments are the same as for Image.__call__.
+        Returns the names of the subjects, the urls of the main file & the article on the first subject,
+            and the confirmation (of the main file).
+        """
+        if deadline is not None:
+            self.set_deadline(deadline)
+        self.testing = test
+        if not self.testing:
+            self.main.prefetch_tokens()  # The tokens are cached per login, so the other Images use them as well
+
+        # All file pages, categories & articles with one request per wiki
+        self.prefetch()
+        for i in self.subjects:
+            if i.is_dp():
+                print(f'WARNING: {i.name} is a disambiguation page!')
+                raise ValueError('Found a disambiguation page - stopping the processing!')
+
+        steps = self.upload_steps(commons_perm, category, data_connect, nlwiki, public_domain, post_process)
+        # Steps on different wikis are done at the same time, the steps on the same wiki are done one by one
+        scheduler = Scheduler(steps, fatal=(DeadlineExceeded,))
+        scheduler.run()
+        k = scheduler.results['short_urls'] if post_process is True else self.main.full_urls()
+        print(f'The url for the Commons file is {k[0]}')
+        print(f'The url for the article on nlwiki is {k[1]}')
+        confirmation = self.main.generate_confirmation(k)
+        print(f'Time spent waiting for the wikis: {self.main.retry}')
+        print(f'API calls saved by sharing the reads: {self.main.api_calls_saved}')
+        if conf is True:
+            print(confirmation)
+        return [i.name for i in self.subjects], k, confirmation
+
+
+class AsyncImage:
+    """
+    Asyncio interface on top of an Image.
+    All data are stored on the wrapped Image, so the sync & async methods can be mixed freely.
+    The reads use the async bots directly, the writes run the (sequential) methods of Image on the executor.
+    This is the entry point for code that runs an event loop itself (the synchronous methods use run_sync).
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self._commons = AsyncCommonsBot(image._commons)
+        self._wikidata = AsyncWikidataBot(image._wikidata)
+        self._nl = AsyncNlBot(image._nl)
+        self._meta = AsyncMetaBot(image._meta)
+
+    def __str__(self):
+        return str(self.image)
+
+    # Read methods
+    async def is_dp(self):
+        if self.image.dp is None:
+            self.image.dp = await self._nl.is_dp(self.image.name)
+        return self.image.dp
+
+    async def read_from_plan(self, wiki, plan=None, images=None):
+        """plan & images can be the ReadPlan of several Images (see ImageSet), the response is spread over all of them"""
+        bot, plan = {'commons': self._commons, 'nl': self._nl}[wiki], self.image.plan_reads() if plan is None else plan
+        response = await bot.get(plan.queries()[wiki])
+        query = plan.content_query(wiki, response)
+        if query is not None:
+            plan.add_content(wiki, await bot.get(query))
+        for i in (self.image,) if images is None else images:
+            i._store_reads(wiki, response)
+
+    async def get_commons_claims(self):
+        await self.read_from_plan('commons')
+        return self.image.mid, self.image.mc
+
+    async def get_commons_text(self, force_update=False):
+        if self.image.comtext is None or force_update is True:
+            if self.image.comtext is not None and self.image.comrevid is not None:
+                if await self._commons.latest_revid(f'File:{self.image.file}') == self.image.comrevid:
+                    return self.image.comtext
+                self.image.memo.invalidate(self._commons.api)
+            await self.read_from_plan('commons')
+        return self.image.comtext
+
+    async def ini_wikidata(self):
+        response = self.image._cached_wikidata(await self._wikidata.get(self.image._wikidata_query('info')))
+        if response is None:
+            response = await self._wikidata.get(self.image._wikidata_query())
+            self.image._cache_wikidata(response)
+        return self.image._store_wikidata(response)
+
+    async def get_image_date(self):
+        await self.get_commons_text()  # The wikitext is checked first, saves a request in most cases
+        self.image.get_date_from_commons_text()
+        if self.image.date is None and not self.image._exif_checked:
+            return self.image._store_image_date(await self._commons.get(self.image._image_date_query()))
+        return self.image.date
+
+    async def refresh_article(self):
+        """After a preflight (see Image.restore_preflight): the article is only read again if it changed since then"""
+        if await self._nl.latest_revid(self.image.name) == self.image.article_revid:
+            print('The article did not change since the preflight, using the text that was checked')
+            return self.image.article
+        await self.read_from_plan('nl')
+        return self.image.article
+
+    def _read(self, wiki):
+        """The read of a wiki for prefetch (after a preflight, the article is only read again if it changed)"""
+        if wiki == 'nl' and self.image.preflight_report is not None and self.image.article is not None:
+            return self.refresh_article()
+        return self.read_from_plan(wiki)
+
+    async def prefetch(self, wikidata=True):
+        """Async version of Image.prefetch: the request for every wiki is awaited at the same time"""
+        jobs = [self._read(i) for i in self.image.plan_reads().queries()]
+        if wikidata:
+            jobs.append(self.ini_wikidata())
+        await asyncio.gather(*jobs)
+
+    async def prepare_image_data(self):
+        """
+        Async version of Image.prepare_image_data: Commons & nlwiki are read together,
+        the Wikidata item is only read once the article turned out not to be a disambiguation page.
+        """
+        commons = asyncio.ensure_future(self._read('commons'))
+        await self._read('nl')
+        if self.image.dp:
+            commons.cancel()
+            print('ERROR: the page you passed is a disambiguation page!')
+            raise ValueError('Found a disambiguation page - stopping the processing!')
+        await asyncio.gather(commons, self.ini_wikidata())
+        return True
+
+    async def prefetch_tokens(self):
+        """Gets the tokens for the three wikis we edit at the same time (if they were not cached yet)"""
+        return await asyncio.gather(self._commons.verify_token(),
+                                    self._wikidata.verify_token(),
+                                    self._nl.verify_token())
+
+    # Write methods (they depend on the local state, so they are still executed one by one)
+    async def _run(self, method, *args, **kwargs):
+        return await asyncio.to_thread(getattr(self.image, method), *args, **kwargs)
+
+    async def ticket(self, action=True):
+        return await self._run('ticket', action)
+
+    async def set_licence_properties(self):
+        return await self._run('set_licence_properties')
+
+    async def make_cat(self):
+        return await self._run('make_cat')
+
+    async def add_category(self):
+        return await self._run('add_category')
+
+    async def interwiki(self):
+        return await self._run('interwiki')
+
+    async def commons_cat(self):
+        return await self._run('commons_cat')
+
+    async def depicts(self):
+        return await self._run('depicts')
+
+    async def set_image(self):
+        return await self._run('set_image')
+
+    async def date_meta(self, manual_value=None):
+        return await self._run('date_meta', manual_value)
+
+    async def add_image_to_article(self):
+        return await self._run('add_image_to_article')
+
+    async def purge(self):
+        return await self._run('purge')
+
+    async def short_urls(self):
+        return tuple(await asyncio.gather(self._run('short_url_commons'), self._run('short_url_nlwiki')))
+
+    async def __call__(self, *args, **kwargs):
+        return await self._run('__call__', *args, **kwargs)
+
+
 # Use this code to run the bot
 if __name__ == '__main__':  # Do not run this code when we are using the interface
     a = Image('Jordan Bos.JPG', "Jordan Bos")
@@ -0,0 +1,56 @@
+"""
+Module containing the deadline of a session.
+
+A session gets a fixed time budget when it starts. Every HTTP request & database query of the session
+takes its timeouts from the time that is left, so a hung connection can never pin a worker thread forever.
+Once the budget is used up, DeadlineExceeded is raised and the session is stopped with a clear status.
+"""
+
+import time
+
+# Timeouts (seconds) of a single request, also used if no deadline is set
+connect_timeout = 5.0
+read_timeout = 60.0
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a session used up its time budget"""
+
+    def __str__(self):
+        return 'The session took too long and was stopped' + (f' ({self.args[0]})' if self.args else '')
+
+
+class Deadline:
+    """Time budget of a session, shared by all bots & database calls of that session"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def __str__(self):
+        return f'{self.remaining():.1f} of {self.seconds:.0f} seconds left'
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, what=None):
+        """Raises DeadlineExceeded if the budget is used up"""
+        if self.expired:
+            raise DeadlineExceeded(what)
+
+    def timeout(self, what=None):
+        """Returns the (connect, read) timeouts for the next request, limited by the time that is left"""
+        self.check(what)
+        remaining = self.remaining()
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+
+def timeout(deadline, what=None):
+    """The (connect, read) timeouts for a request, deadline can be None (then the default timeouts are used)"""
+    if deadline is None:
+        return connect_timeout, read_timeout
+    return deadline.timeout(what)
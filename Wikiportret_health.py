@@ -0,0 +1,178 @@
+"""
+Module containing the health model of the wikis the bots talk to.
+
+Every host gets a health score between 0 and 1, fed by the outcome of every request (latency, maxlag & server errors).
+The number of requests that may be in flight to a host at the same time shrinks with its health,
+so the threads of the background job do not all run into the same lagging wiki.
+If the health drops too far, the circuit of the host opens: the background job stops starting new uploads
+(the sessions stay in the queue), until a probe shows that the host is healthy again.
+"""
+
+import threading
+import requests
+import time
+import Wikiportret_http as http
+from Wikiportret_deadline import DeadlineExceeded
+
+max_in_flight = 8  # Number of parallel requests to a host in perfect health
+slow = 5.0  # Requests taking longer than this (seconds) count as half a failure
+weight = 0.2  # Weight of the newest request in the health score (exponential moving average)
+open_below = 0.3  # The circuit opens if the health drops below this value...
+min_requests = 5  # ... and at least this number of requests was seen
+cooldown = 30.0  # Seconds before the first probe of an open circuit (doubled after every failed probe)
+max_cooldown = 600.0
+unhealthy_codes = {'maxlag', 'readonly'}  # API errors (MediaWiki-API-Error header) that tell the host is in trouble
+
+_hosts = {}  # host => HostHealth
+_lock = threading.Lock()
+
+
+class CircuitOpen(DeadlineExceeded):
+    """Raised when a session used up its time budget waiting for a host of which the circuit is open"""
+
+    def __str__(self):
+        return 'The wiki is unhealthy, the session stopped waiting' + (f' ({self.args[0]})' if self.args else '')
+
+
+class HostHealth:
+    """Health score, concurrency limit & circuit breaker of a single host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.score = 1.0
+        self.requests = 0
+        self.in_flight = 0
+        self.opened_at = None  # Time at which the circuit opened (None if the circuit is closed)
+        self.cooldown = cooldown
+        self._condition = threading.Condition()
+
+    def __str__(self):
+        state = 'open' if self.is_open else 'closed'
+        return f'{self.host}: health {self.score:.2f}, {self.in_flight}/{self.limit} in flight, circuit {state}'
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    @property
+    def limit(self):
+        """Number of requests that may be in flight at the same time"""
+        if self.is_open:
+            return 1  # Sessions that are still running can finish, one request at a time
+        return max(1, round(max_in_flight * self.score))
+
+    @property
+    def probe_due(self):
+        """Is it time to check whether an open circuit can be closed again?"""
+        return self.is_open and time.monotonic() - self.opened_at >= self.cooldown
+
+    def acquire(self, deadline=None):
+        """
+        Waits until a request may be sent to the host. With a deadline, the wait stops when the time runs out:
+        CircuitOpen is raised if the circuit of the host is open, DeadlineExceeded otherwise.
+        """
+        with self._condition:
+            while self.in_flight >= self.limit:
+                remaining = None if deadline is None else deadline.remaining()
+                if remaining is not None and remaining <= 0:
+                    raise (CircuitOpen if self.is_open else DeadlineExceeded)(self.host)
+                self._condition.wait(remaining)
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, ok, latency):
+        """Feeds the outcome of a request to the health score (& opens or closes the circuit)"""
+        outcome = 0.0 if not ok else 0.5 if latency > slow else 1.0
+        with self._condition:
+            self.requests += 1
+            self.score = (1 - weight) * self.score + weight * outcome
+            if self.is_open:
+                if self.probe_due:  # This request was the probe
+                    if ok:
+                        print(f'{self.host} is healthy again, closing the circuit')
+                        self.opened_at, self.cooldown = None, cooldown
+                        self.score = max(self.score, 2 * open_below)  # Start again with a limited concurrency
+                    else:
+                        self.opened_at = time.monotonic()
+                        self.cooldown = min(2 * self.cooldown, max_cooldown)
+            elif self.score < open_below and self.requests >= min_requests:
+                print(f'{self.host} is unhealthy, opening the circuit for {self.cooldown:.0f} seconds')
+                self.opened_at = time.monotonic()
+            self._condition.notify_all()  # The limit might have changed
+
+
+def get(host):
+    """Returns the health of a host (created the first time the host is used)"""
+    with _lock:
+        health = _hosts.get(host)
+        if health is None:
+            health = _hosts[host] = HostHealth(host)
+        return health
+
+
+def send(host, request, deadline=None):
+    """
+    Calls request (which should return a requests.Response) within the concurrency limit of the host,
+        and feeds the outcome to the health of the host.
+    deadline limits the time spent waiting for the concurrency limit (see HostHealth.acquire).
+    """
+    health = get(host)
+    health.acquire(deadline)
+    started = time.monotonic()
+    try:
+        response = request()
+    except Exception:
+        health.record(False, time.monotonic() - started)
+        raise
+    finally:
+        health.release()
+    ok = response.status_code < 500 and response.headers.get('MediaWiki-API-Error') not in unhealthy_codes
+    health.record(ok, time.monotonic() - started)
+    return response
+
+
+def open_circuits():
+    """Returns the hosts of which the circuit is open"""
+    with _lock:
+        return [i for i in _hosts.values() if i.is_open]
+
+
+def paused():
+    """Should new uploads wait? True as long as the circuit of any host is open"""
+    return bool(open_circuits())
+
+
+def requeue(error, transient=()):
+    """
+    Should a session that stopped with error go back to the queue, to wait until the wikis are healthy again?
+    True if the circuit of a host was open, or if a request failed (or one of the transient errors occurred)
+    while the circuit of any host is open.
+    """
+    if isinstance(error, CircuitOpen):
+        return True
+    return paused() and isinstance(error, (requests.exceptions.RequestException, *transient))
+
+
+def probe(health):
+    """Sends a cheap request to a host with an open circuit, closes the circuit if the host answers properly"""
+    api = f'https://{health.host}/w/api.php'
+    try:
+        send(health.host, lambda: http.get_session(api).get(api,
+                                                            params={'action': 'query',
+                                                                    'meta': 'siteinfo',
+                                                                    'maxlag': 5,
+                                                                    'format': 'json'},
+                                                            timeout=10))
+    except Exception as error:  # Already recorded as a failure
+        print(f'Probe of {health.host} failed: {error}')
+
+
+def probe_due():
+    """Probes all open circuits that have been open long enough"""
+    for health in open_circuits():
+        if health.probe_due:
+            probe(health)
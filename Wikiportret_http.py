@@ -0,0 +1,66 @@
+"""
+Module that manages the HTTP connections of the bots.
+
+Every wiki gets one requests.Session per OAuth identity. These sessions are shared by all Bot objects
+(and by all threads of the background job), so the keep-alive connections to the API are reused
+instead of doing a new TCP + TLS handshake for every single API call.
+"""
+
+import threading
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+
+pool_size = 10  # Maximum number of keep-alive connections that are kept open per host & identity
+
+_sessions = {}  # (host, identity) => requests.Session
+_lock = threading.Lock()  # Sessions can be requested from several threads at the same time
+
+
+def host_of(api):
+    """Returns the host name of an API endpoint (e.g. commons.wikimedia.org)"""
+    return urllib.parse.urlsplit(api).netloc
+
+
+def identity_of(auth):
+    """
+    Returns a hashable key for the OAuth identity behind an OAuth1 object.
+    Anonymous requests (no auth configured yet) all share the identity None.
+    """
+    client = getattr(auth, 'client', None)
+    if client is None:
+        return None
+    return client.client_key, client.resource_owner_key
+
+
+def set_pool_size(size):
+    """
+    Changes the number of connections kept per host & identity.
+    Only sessions that are created after this call are affected, so call this before the first API call.
+    """
+    global pool_size
+    if not isinstance(size, int) or size < 1:
+        raise ValueError('The pool size must be a positive integer!')
+    pool_size = size
+
+
+def get_session(api, auth=None):
+    """Returns the shared session for the host of the given API endpoint and the identity behind auth"""
+    key = host_of(api), identity_of(auth)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[key] = session
+        return session
+
+
+def close_all():
+    """Closes all pooled sessions (e.g. when a worker shuts down)"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
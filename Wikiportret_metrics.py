@@ -0,0 +1,181 @@
+"""
+Module containing the metrics of the bots, the webservice & the background job.
+
+Counters, gauges & latency histograms are kept per wiki host (API calls) and per kind of query (database).
+The registry of a process can be rendered in the Prometheus text format (see render),
+written to a file (see dump, used by the background job) or served on a local port (see serve).
+"""
+
+import http.server
+import threading
+import tempfile
+import bisect
+import os
+import Wikiportret_codec as codec
+
+process = 'main'  # Added as a label to all series, so the webservice & the background job can be told apart
+dump_path = os.path.join(tempfile.gettempdir(), 'wikiportret-metrics.json')  # Where the background job dumps its metrics
+buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Upper bounds (seconds) of the histograms
+
+_help = {'wikiportret_http_requests_total': 'API requests sent, by host, method & HTTP status',
+         'wikiportret_http_request_seconds': 'Latency of the API requests',
+         'wikiportret_http_sent_bytes_total': 'Bytes sent to the API (url & body)',
+         'wikiportret_http_received_bytes_total': 'Bytes received from the API',
+         'wikiportret_http_errors_total': 'API requests that failed, by error code',
+         'wikiportret_ratelimit_sleep_seconds_total': 'Time spent waiting for the edit limiter',
+         'wikiportret_retries_total': 'Requests that were retried, by host & reason (see Wikiportret_retry)',
+         'wikiportret_retry_wait_seconds_total': 'Time spent waiting before a retry, by host & reason',
+         'wikiportret_cache_hits_total': 'Reads served from the persistent cache',
+         'wikiportret_cache_misses_total': 'Reads that were not in the persistent cache (or were outdated)',
+         'wikiportret_cache_evictions_total': 'Entries removed from the persistent cache to keep it within its size',
+         'wikiportret_db_queries_total': 'Database queries, by kind (select, insert, update, ...)',
+         'wikiportret_db_query_seconds': 'Latency of the database queries',
+         'wikiportret_db_errors_total': 'Database queries that failed',
+         'wikiportret_queue_depth': 'Sessions waiting in the queue of the background job, by status',
+         'wikiportret_active_threads': 'Threads of the background job that are processing a session'}
+
+_counters = {}  # (name, labels) => value, labels is a sorted tuple of (key, value)
+_gauges = {}
+_histograms = {}  # (name, labels) => [count per bucket (+inf last), sum]
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, n=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    """Adds a value (seconds) to a histogram"""
+    with _lock:
+        histogram = _histograms.setdefault(_key(name, labels), [0] * (len(buckets) + 1) + [0.0])
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+
+# The hooks used by the bots & the db utilities
+def http_request(host, method, seconds, response=None, error=None):
+    """Registers an API request. Pass the requests.Response, or the name of the error if no response came in."""
+    observe('wikiportret_http_request_seconds', seconds, host=host, method=method)
+    if response is None:
+        count('wikiportret_http_requests_total', host=host, method=method, status='none')
+        count('wikiportret_http_errors_total', host=host, code=error)
+        return None
+    count('wikiportret_http_requests_total', host=host, method=method, status=response.status_code)
+    request = response.request
+    body = request.body or b''
+    count('wikiportret_http_sent_bytes_total', len(request.url) + len(body), host=host)
+    count('wikiportret_http_received_bytes_total', len(response.content), host=host)
+    code = response.headers.get('MediaWiki-API-Error')  # Set by MediaWiki if the API returned an error
+    if code is None and response.status_code >= 400:
+        code = f'http-{response.status_code}'
+    if code is not None:
+        count('wikiportret_http_errors_total', host=host, code=code)
+
+
+def limiter_sleep(host, seconds):
+    if seconds:
+        count('wikiportret_ratelimit_sleep_seconds_total', seconds, host=host)
+
+
+def db_query(query, seconds, error=None):
+    """Registers a database query, the kind is the first word of the query (select, insert, update, ...)"""
+    kind = query.split(None, 1)[0].lower() if query.strip() else 'empty'
+    count('wikiportret_db_queries_total', kind=kind)
+    observe('wikiportret_db_query_seconds', seconds, kind=kind)
+    if error is not None:
+        count('wikiportret_db_errors_total', kind=kind, error=error)
+
+
+# Exporting the metrics
+def snapshot():
+    """Returns the contents of the registry as a dictionary (can be encoded as JSON)"""
+    with _lock:
+        return {'process': process,
+                'counters': [[name, dict(labels), value] for (name, labels), value in _counters.items()],
+                'gauges': [[name, dict(labels), value] for (name, labels), value in _gauges.items()],
+                'histograms': [[name, dict(labels), list(value)] for (name, labels), value in _histograms.items()]}
+
+
+def _labels(labels, process_name, **extra):
+    labels = {'process': process_name, **labels, **extra}
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels.items()) + '}'
+
+
+def render(*others):
+    """
+    Renders the registry of this process in the Prometheus text format.
+    others are snapshots of other processes (e.g. read from the dump file of the background job)
+    """
+    series = {}  # name => (type, lines)
+    for data in (snapshot(), *others):
+        name_of_process = data['process']
+        for name, labels, value in data['counters']:
+            series.setdefault(name, ('counter', []))[1].append(f'{name}{_labels(labels, name_of_process)} {value}')
+        for name, labels, value in data['gauges']:
+            series.setdefault(name, ('gauge', []))[1].append(f'{name}{_labels(labels, name_of_process)} {value}')
+        for name, labels, value in data['histograms']:
+            lines, cumulative = series.setdefault(name, ('histogram', []))[1], 0
+            for bound, n in zip((*buckets, '+Inf'), value[:-1]):
+                cumulative += n
+                lines.append(f'{name}_bucket{_labels(labels, name_of_process, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels, name_of_process)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(labels, name_of_process)} {cumulative}')
+    output = []
+    for name, (kind, lines) in sorted(series.items()):
+        if name in _help:
+            output.append(f'# HELP {name} {_help[name]}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(lines)
+    return '\n'.join(output) + '\n'
+
+
+def dump(path):
+    """Writes a snapshot of the registry to a file (replaced atomically, so a reader never sees half a file)"""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(codec.dumps(snapshot()))
+    os.replace(temporary, path)
+
+
+def load(path):
+    """Reads a snapshot written by dump (None if there is no valid snapshot)"""
+    try:
+        with open(path, 'rb') as f:
+            return codec.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return None
+        body = render().encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Do not fill the log of the background job with scrapes
+
+
+def serve(port, host='127.0.0.1'):
+    """Serves the metrics of this process on http://host:port/metrics (in a daemon thread)"""
+    server = http.server.ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,371 @@
+"""
+Module containing the edit plans of the bots.
+
+In planning mode (see Image.plan_upload), the writes of a session are not sent to the wikis, but collected in an EditPlan:
+every write with the page or entity it changes, its preconditions (base revision, claim that must still be absent)
+and the writes it depends on. A plan can be reviewed & stored (see to_json & from_json) and applied later on.
+The new claims of a wbeditentity are checked like the absent claims when the plan is applied,
+so a write that is sent again never adds a claim twice.
+apply runs the plans of many sessions in a single pass: new claims & sitelinks for the same entity are merged
+into a single edit, and the writes on different wikis are done at the same time (each within its rate limit).
+
+Results of a write that are needed by a later write (the id of a new claim, the new revision of a page)
+are not known while planning, so a placeholder is used instead (see Write.ref), which is filled in by apply.
+"""
+
+import re
+import threading
+import Wikiportret_codec as codec
+import Wikiportret_http as http
+from Wikiportret_schedule import Step, Scheduler
+from Wikiportret_deadline import DeadlineExceeded
+
+_placeholder = re.compile(r'<write (\d+):(\w+)>')
+batch = 50  # Maximal number of entities in a single wbgetentities (checking the claims that must be absent)
+
+
+class WriteError(Exception):
+    """Raised when the wiki refused a write of a plan"""
+
+    def __str__(self):
+        return 'The wiki refused the write' + (f' ({self.args[0]})' if self.args else '')
+
+
+class Write:
+    """
+    A single write of a plan.
+        * id: number of the write in the plan
+        * api: the API the write goes to
+        * params: the parameters of the request (without token)
+        * requires: writes (ids) that must be done first
+        * preconditions: base revision (baserevid) & claim that must still be absent (absent)
+    """
+
+    def __init__(self, id, api, params, requires=(), preconditions=None):
+        self.id, self.api, self.params = id, api, params
+        self.requires = tuple(requires)
+        self.preconditions = preconditions if preconditions is not None else self._preconditions()
+
+    def __str__(self):
+        return f'#{self.id} {self.params["action"]} {self.target} on {http.host_of(self.api)}'
+
+    def ref(self, field):
+        """Placeholder for a result of this write (claim, revid or timestamp), filled in when the plan is applied"""
+        return f'<write {self.id}:{field}>'
+
+    @property
+    def target(self):
+        """The page or entity that is changed"""
+        params = self.params
+        for i in ('title', 'titles', 'id', 'entity'):
+            if i in params:
+                return params[i]
+        return params.get('claim', '').split('$')[0] or None  # Claim ids start with the id of the entity
+
+    def references(self):
+        """The writes of which this write needs a result"""
+        return sorted({int(j) for i in self.params.values() if isinstance(i, str) for j, _ in _placeholder.findall(i)})
+
+    def _preconditions(self):
+        conditions = {}
+        if 'baserevid' in self.params:
+            conditions['baserevid'] = self.params['baserevid']
+        if self.params['action'] == 'wbcreateclaim' and self.params.get('snaktype') == 'value':
+            conditions['absent'] = {'property': self.params['property'], 'value': codec.loads(self.params['value'])}
+        return conditions
+
+    def new_statements(self):
+        """
+        The new statements (without id) of a wbeditentity, as (property, value).
+        They are derived from the parameters, so plans that were stored before are checked as well.
+        """
+        if self.params['action'] != 'wbeditentity':
+            return []
+        claims = codec.loads(self.params['data']).get('claims', [])
+        if not isinstance(claims, list):
+            return []  # Claims grouped by property are never planned
+        return [(i['mainsnak']['property'], _value(i)) for i in claims if 'id' not in i and 'mainsnak' in i]
+
+    def response(self):
+        """The response used while planning, with placeholders for what the wiki will return"""
+        params = self.params
+        if params['action'] == 'edit':
+            return {'edit': {'result': 'Success', 'newrevid': self.ref('revid'), 'newtimestamp': self.ref('timestamp')}}
+        response = {'success': 1, 'pageinfo': {'lastrevid': self.ref('revid')}}
+        if 'absent' in self.preconditions:
+            response['claim'] = _statement(params['property'],
+                                           self.preconditions['absent']['value'],
+                                           self.ref('claim'))
+        return response
+
+    def to_dict(self):
+        return {'id': self.id,
+                'api': self.api,
+                'params': self.params,
+                'requires': list(self.requires),
+                'preconditions': self.preconditions}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['api'], data['params'], data['requires'], data['preconditions'])
+
+
+class EditPlan:
+    """The writes of one or more sessions, in the order in which they were planned"""
+
+    def __init__(self, info=None):
+        self.info = dict(info or {})  # Description of the session (file, article, item, ...)
+        self.writes = []
+        self._lock = threading.Lock()  # The steps of an upload are planned from several threads
+
+    def __str__(self):
+        return '\n'.join([f'Edit plan for {self.info}'] +
+                         [f'{i} (after {", ".join(f"#{j}" for j in i.requires) or "nothing"})' for i in self.writes])
+
+    def __iter__(self):
+        return iter(self.writes)
+
+    def __len__(self):
+        return len(self.writes)
+
+    def add(self, bot, params):
+        """Adds a write of a bot to the plan (see Bot.post), returns the response used while planning"""
+        with self._lock:
+            write = Write(len(self.writes), bot.api, dict(params))
+            requires = set(write.references())
+            for i in reversed(self.writes):
+                if i.api == write.api and i.target == write.target:
+                    requires.add(i.id)  # The writes on the same page are done in the order they were planned
+                    break
+            write.requires = tuple(sorted(requires))
+            self.writes.append(write)
+        print(f'Planned write {write}')
+        return write.response()
+
+    def to_json(self):
+        """The plan as JSON (bytes)"""
+        return codec.dumps({'info': self.info, 'writes': [i.to_dict() for i in self.writes]})
+
+    @classmethod
+    def from_json(cls, data):
+        data = codec.loads(data)
+        plan = cls(data['info'])
+        plan.writes = [Write.from_dict(i) for i in data['writes']]
+        return plan
+
+
+def _statement(prop, value, claim_id=None):
+    """A new statement (for wbeditentity, or as the claim in the response used while planning)"""
+    kind = 'string' if isinstance(value, str) else 'wikibase-entityid' if 'entity-type' in value else 'time'
+    statement = {'type': 'statement',
+                 'rank': 'normal',
+                 'mainsnak': {'snaktype': 'value', 'property': prop, 'datavalue': {'value': value, 'type': kind}}}
+    if claim_id is not None:
+        statement['id'] = claim_id
+    return statement
+
+
+def _mergeable(write, used):
+    """Can the write be merged with other writes on the same entity (in a single wbeditentity)?"""
+    if write.id in used or write.references():
+        return False  # Some write needs its result, or it needs the result of another one
+    return (write.params['action'] == 'wbsetsitelink' or
+            (write.params['action'] == 'wbcreateclaim' and 'absent' in write.preconditions))
+
+
+def _merge(writes):
+    """Builds a single wbeditentity for several new claims & sitelinks on the same entity"""
+    claims, sitelinks = [], {}
+    for i in writes:
+        if i.params['action'] == 'wbsetsitelink':
+            sitelinks[i.params['linksite']] = {'site': i.params['linksite'], 'title': i.params['linktitle']}
+        else:
+            statement = _statement(i.params['property'], i.preconditions['absent']['value'])
+            if statement not in claims:  # Two sessions might add the same claim
+                claims.append(statement)
+    data = {'claims': claims} if claims else {}
+    if sitelinks:
+        data['sitelinks'] = sitelinks
+    params = writes[0].params
+    return {'action': 'wbeditentity',
+            'id': params.get('id', params.get('entity')),
+            'data': codec.dumps_str(data),
+            'summary': params.get('summary', ''),
+            'bot': True}
+
+
+def _value(claim):
+    """The value of the main snak of a claim (None for unknown or no value)"""
+    return claim['mainsnak'].get('datavalue', {}).get('value')
+
+
+def _find(claims, prop, value):
+    """The claim with a value for a property among the claims of an entity (None if there is none)"""
+    for i in claims.get(prop, ()):
+        if _value(i) == value:
+            return i
+    return None
+
+
+def _result(response, field):
+    """Gets a result (claim, revid or timestamp) from the response to a write"""
+    if field == 'claim':
+        return response['claim']['id']
+    if field == 'timestamp':
+        return response['edit']['newtimestamp']
+    for i in ('edit', 'pageinfo', 'entity'):
+        if i in response:
+            return response[i].get('newrevid', response[i].get('lastrevid'))
+    raise KeyError(field)
+
+
+def _entities(bot, writes):
+    """
+    Reads the entities that are changed by writes (one wbgetentities per batch of entities),
+    returns entity id => {'claims': ..., 'lastrevid': ...}
+    """
+    ids = sorted({i.target for i in writes})
+    entities = {}
+    for n in range(0, len(ids), batch):
+        response = bot.get({'action': 'wbgetentities', 'ids': '|'.join(ids[n:n + batch]), 'props': 'claims|info'})
+        for qid, entity in response.get('entities', {}).items():
+            entities[qid] = {'claims': entity.get('claims', entity.get('statements')) or {},  # MediaInfo: statements
+                             'lastrevid': entity.get('lastrevid')}
+    return entities
+
+
+def _without_present(params, entity):
+    """
+    Removes the new statements that are already on the entity from a wbeditentity
+    (an earlier attempt might have been done by the wiki, without the response reaching the bot).
+    Returns the parameters to send, or None if nothing is left to send.
+    """
+    data = codec.loads(params['data'])
+    claims = data.get('claims', [])
+    left = [i for i in claims if 'id' in i or _find(entity['claims'], i['mainsnak']['property'], _value(i)) is None]
+    if len(left) == len(claims):
+        return params
+    print(f'{len(claims) - len(left)} claim(s) of the edit of {params["id"]} are already present')
+    if left:
+        data['claims'] = left
+    else:
+        del data['claims']
+    if not data:
+        return None
+    params = dict(params, data=codec.dumps_str(data))
+    if 'baserevid' in params and entity['lastrevid'] is not None:
+        params['baserevid'] = entity['lastrevid']  # The present claims changed the entity since planning
+    return params
+
+
+def blocked(plan, done, skip=()):
+    """
+    The writes of a plan that cannot be sent in this pass: the writes in skip (given up, or not due yet)
+    and the writes that need a write that is not done & will not be sent either.
+    done are the ids of the writes that were done before.
+    """
+    ids, result = {i.id for i in plan}, set()
+    for write in plan:  # A write always comes after the writes it needs
+        if write.id in done:
+            continue
+        if write.id in skip or any(j not in done and (j in result or j not in ids) for j in write.requires):
+            result.add(write.id)
+    return result
+
+
+def apply(plans, bots, done=None, skip=None):
+    """
+    Applies plans (of many sessions) in a single pass.
+    bots(plan, api) returns the bot that does the writes of a plan on a wiki (the bots are never used while planning)
+    done has a dictionary per plan with the writes that were done before (write id => response), they are not sent again
+    skip has a set per plan with the writes that must not be sent (see blocked, the writes that need them are not sent either)
+    Returns a dictionary per plan: write id => response of the wiki (writes that failed or were skipped are missing)
+    """
+    results = [dict(i) for i in done] if done is not None else [{} for _ in plans]
+    skip = [blocked(plan, results[n], skip[n] if skip is not None else ()) for n, plan in enumerate(plans)]
+    jobs, groups = [], {}  # groups: (bot, api, target) => job in which the next mergeable write on that entity ends up
+    job_of = {}  # (plan, write id) => job
+    for n, plan in enumerate(plans):
+        used = {j for i in plan for j in i.references()}
+        for write in plan:
+            if write.id in results[n]:
+                continue  # Done before, the response is only used to fill in the placeholders
+            if write.id in skip[n]:
+                continue
+            bot = bots(plan, write.api)
+            key = (id(bot), write.api, write.target)
+            if _mergeable(write, used) and key in groups:
+                job = groups[key]
+            else:
+                job = {'bot': bot, 'writes': []}
+                jobs.append(job)
+                if _mergeable(write, used):
+                    groups[key] = job
+                else:
+                    groups.pop(key, None)  # Later writes on this entity are not merged with earlier ones
+            job['writes'].append((n, write))
+            job_of[n, write.id] = job
+
+    # The claims that must be absent are checked for all plans at once (one request per batch of entities & bot)
+    checks = {}
+    for job in jobs:
+        for n, write in job['writes']:
+            if 'absent' in write.preconditions or (write.new_statements() and not _placeholder.search(write.target)):
+                checks.setdefault((id(job['bot']), write.api), (job['bot'], []))[1].append(write)
+    present, entities = {}, {}  # write => claim that is already present, write => entity it changes
+    for bot, writes in checks.values():
+        found = _entities(bot, writes)
+        for i in writes:
+            entity = found.get(i.target, {'claims': {}, 'lastrevid': None})
+            if 'absent' not in i.preconditions:
+                entities[i] = entity
+                continue
+            claim = _find(entity['claims'], i.preconditions['absent']['property'], i.preconditions['absent']['value'])
+            if claim is not None:
+                present[i] = claim
+
+    def fill(value, n):
+        """Replaces the placeholders in a parameter by the results of the writes of plan n"""
+        if not isinstance(value, str):
+            return value
+        return _placeholder.sub(lambda m: str(_result(results[n][int(m.group(1))], m.group(2))), value)
+
+    def run(job):
+        writes = [(n, i) for n, i in job['writes'] if i not in present]
+        for n, i in job['writes']:
+            if i in present:
+                print(f'Skipping write {i}, the claim is already present')
+                results[n][i.id] = {'success': 1, 'claim': present[i]}
+        if not writes:
+            return None
+        n, write = writes[0]
+        params = _merge([i for _, i in writes]) if len(writes) > 1 else {k: fill(v, n) for k, v in write.params.items()}
+        if write in entities:
+            params = _without_present(params, entities[write])
+            if params is None:
+                print(f'Skipping write {write}, all its claims are already present')
+                results[n][write.id] = {'success': 1, 'entity': {'id': write.target,
+                                                                 'lastrevid': entities[write]['lastrevid']}}
+                return None
+        response = job['bot'].post(params)
+        if 'error' in response:
+            raise WriteError(response['error'].get('code'))
+        for n, i in writes:
+            results[n][i.id] = response
+        return response
+
+    steps = []
+    for k, job in enumerate(jobs):
+        job['name'] = f'write {k}'
+    for job in jobs:
+        needs = {job_of[n, j]['name'] for n, i in job['writes'] for j in i.requires if (n, j) in job_of} - {job['name']}
+        bot = job['bot']
+        # Never two writes of the same account on the same wiki at the same time (the bot waits for its rate limit)
+        steps.append(Step(job['name'],
+                          lambda job=job: run(job),
+                          (http.host_of(bot.api), http.identity_of(bot._auth)),
+                          needs=needs,
+                          errors=(Exception,),
+                          message=f'{job["name"]} failed: {", ".join(str(i) for _, i in job["writes"])}'))
+    Scheduler(steps, max_workers=max(1, len({i.host for i in steps})), fatal=(DeadlineExceeded,)).run()
+    return results
@@ -0,0 +1,65 @@
+"""
+Module containing the process-wide pool of the logins of the bots.
+
+Every WebImage used to read & decrypt the OAuth tokens of the operator from the db and to make an OAuth1 signer
+for each of its four bots, even if it was only used to render a page.
+The pool keeps the login of every user, made the first time a bot of that user calls the API,
+and reuses it for all wikis, bots, Images & threads of the process (the OAuth consumer is the same for all wikis).
+The pooled sessions, tokens & edit limiters are keyed by the login (see Wikiportret_http), so they are shared as well.
+
+A login is made again after ttl seconds, or as soon as a wiki refuses it (see invalidate),
+so tokens that were revoked or renewed by the user never stay in use for long.
+"""
+
+import threading
+import time
+
+ttl = 3600  # Seconds a login is reused, after that it is made again from its source
+_logins = {}  # user => (OAuth1, time at which it was made)
+_sources = {}  # user => function that makes the login of the user (see register)
+_locks = {}  # user => lock, so the login of a user is only made once, even if several threads need it at once
+_lock = threading.Lock()
+
+
+def register(user, source):
+    """
+    Registers how the login of a user is made: source() returns the OAuth1 signer.
+    Nothing is read yet, source is only called once a bot of the user calls the API.
+    A new source replaces the one registered before, the login made before is kept until it expires or is refused.
+    """
+    with _lock:
+        _sources[user] = source
+        _locks.setdefault(user, threading.Lock())
+
+
+def _valid(entry):
+    return entry is not None and time.monotonic() - entry[1] < ttl
+
+
+def login(user):
+    """The login of a user (made on first use & after it expired, see register)"""
+    entry = _logins.get(user)
+    if _valid(entry):
+        return entry[0]
+    with _lock:
+        if user not in _sources:
+            raise KeyError(f'No login was registered for user {user!r}!')
+        lock, source = _locks[user], _sources[user]
+    with lock:
+        entry = _logins.get(user)
+        if not _valid(entry):
+            entry = _logins[user] = (source(), time.monotonic())
+    return entry[0]
+
+
+def invalidate(user, auth=None):
+    """
+    Drops the login of a user, the next bot that needs it makes it again (e.g. after the wiki refused it).
+    If auth is given, the login is only dropped if it is still that login
+    (another thread might already have made a new one after the same error).
+    """
+    with _lock:
+        entry = _logins.get(user)
+        if entry is not None and (auth is None or entry[0] is auth):
+            del _logins[user]
+            print(f'The login of user {user} was dropped from the pool')
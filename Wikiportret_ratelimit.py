@@ -0,0 +1,143 @@
+"""
+Module containing the edit limiter of the bots.
+
+All bots that edit with the same account on the same wiki share one token bucket.
+The state of the bucket is stored in a small file (protected by a file lock), so the limit also holds
+across the threads & processes of the web tool and the background job.
+The size of the bucket is read from the rate limits that MediaWiki reports for the account,
+so an account with a bot flag automatically gets more throughput.
+"""
+
+import threading
+import tempfile
+import hashlib
+import json
+import time
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:  # Windows (command line interface): only the threads of this process are synchronised
+    fcntl = None
+
+state_dir = os.path.join(tempfile.gettempdir(), 'wikiportret-ratelimit')  # Where the bucket files are stored
+bot_limit = (60, 60)  # Edits per number of seconds for accounts with the noratelimit right (bot flag)
+
+_buckets = {}  # Key of the bucket (see bucket_key) => TokenBucket
+_lock = threading.Lock()
+
+
+def set_state_dir(path):
+    """Changes the directory in which the buckets are stored (it must be shared by all worker processes)"""
+    global state_dir
+    state_dir = path
+
+
+def limits_from_userinfo(userinfo, default):
+    """
+    Determines the edit limit of an account, based on the output of meta=userinfo&uiprop=rights|ratelimits.
+    Returns a tuple (hits, seconds), the most restrictive limit applying to the account is used.
+    """
+    if 'noratelimit' in userinfo.get('rights', ()):
+        return bot_limit
+    limits = [(i['hits'], i['seconds']) for i in userinfo.get('ratelimits', {}).get('edit', {}).values()
+              if i.get('hits') and i.get('seconds')]
+    if not limits:
+        return default
+    return min(limits, key=lambda t: t[0] / t[1])
+
+
+class TokenBucket:
+    """
+    A token bucket that is shared across threads (threading.Lock) and processes (file lock on the state file).
+    Every edit takes one token, tokens are refilled at a rate of hits/seconds.
+    """
+
+    def __init__(self, key, hits, seconds):
+        self.key = key
+        self.capacity = float(hits)
+        self.rate = hits / seconds  # Number of tokens added per second
+        self.slept = 0.0  # Total time this process spent waiting for this bucket
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, re.sub(r'[^\w.-]', '_', key) + '.json')
+
+    def __str__(self):
+        return f'{self.key}: {self.capacity:.0f} edits per {self.capacity / self.rate:.0f} seconds'
+
+    def set_limit(self, hits, seconds):
+        """Changes the limit of the bucket (the tokens that are left are kept, up to the new capacity)"""
+        with self._lock:
+            self.capacity, self.rate = float(hits), hits / seconds
+
+    def _take(self):
+        """Tries to take a token from the bucket. Returns the time to wait before trying again (0 if it worked)"""
+        with self._lock, open(self.path, 'a+', encoding='utf8') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:  # New (or corrupt) bucket, start with a full one
+                    state = {'tokens': self.capacity, 'updated': now}
+                tokens = min(self.capacity, state['tokens'] + (now - state['updated']) * self.rate)
+                if tokens >= 1:
+                    tokens, wait = tokens - 1, 0.0
+                else:
+                    wait = (1 - tokens) / self.rate
+                f.seek(0)
+                f.truncate()
+                json.dump({'tokens': tokens, 'updated': now}, f)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the time spent sleeping."""
+        slept = 0.0
+        wait = self._take()
+        while wait > 0:
+            print(f'Edit limit reached for {self.key}, going to sleep for {wait:.1f} seconds')
+            time.sleep(wait)
+            slept += wait
+            wait = self._take()
+        self.slept += slept
+        return slept
+
+
+def bucket_key(host, identity):
+    """
+    The key of the bucket of an account on a wiki, used in memory & for the state file on disk.
+    The tokens of the login are hashed, so they never end up in a file name.
+    """
+    account = 'anonymous' if identity is None else hashlib.sha256(repr(identity).encode('utf8')).hexdigest()[:16]
+    return f'{host}-{account}'
+
+
+def get_bucket(host, identity, load_userinfo, default, limit=None):
+    """
+    Returns the bucket for the account behind identity on the given host (one bucket per wiki & account).
+    load_userinfo is only called the first time a bucket is requested in this process, and never if limit is given.
+    default is the tuple (hits, seconds) to use if the wiki does not report a limit.
+    limit is an explicit tuple (hits, seconds), which takes precedence over the limits reported by the wiki:
+        it becomes the limit of the bucket of the account (also if the bucket was made before).
+    """
+    key = bucket_key(host, identity)
+    bucket = _buckets.get(key)
+    if bucket is not None:
+        if limit is not None:
+            bucket.set_limit(*limit)
+        return bucket
+    # The limits are read before taking the lock: the other bots should not wait for this API call
+    hits, seconds = limits_from_userinfo(load_userinfo(), default) if limit is None else limit
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(key, hits, seconds)
+        elif limit is not None:
+            bucket.set_limit(hits, seconds)
+        return bucket
@@ -0,0 +1,127 @@
+"""
+Module containing the retry policy of the bots.
+
+Maxlag, rate limits, 5xx-responses and connection resets are usually over after a couple of seconds.
+Instead of aborting the entire run, the request is retried after a jittered exponential backoff
+(or after the time the server asked us to wait), until the wait budget of the session is used up.
+Reads are always safe to retry, writes are only retried if we know for sure that the server did not execute them.
+"""
+
+import threading
+import requests
+import random
+import time
+import Wikiportret_health as health  # Concurrency limit & circuit breaker per host
+import Wikiportret_codec as codec
+import Wikiportret_metrics as metrics
+from Wikiportret_deadline import DeadlineExceeded
+
+# Errors after which any request can be retried (the server did not execute the request)
+retry_codes = {'maxlag', 'ratelimited', 'readonly'}
+retry_statuses = {429, 503}
+# Errors after which only reads are retried (a write might have been executed partially)
+read_retry_statuses = {500, 502, 504}
+
+# Global counters, shared by all policies in this process (used for monitoring)
+stats = {'retries': {}, 'waited': {}}  # (host, reason) => number of retries & seconds spent waiting
+_lock = threading.Lock()
+
+
+def record(host, reason, delay):
+    """Registers a retry in the global counters"""
+    with _lock:
+        stats['retries'][(host, reason)] = stats['retries'].get((host, reason), 0) + 1
+        stats['waited'][(host, reason)] = stats['waited'].get((host, reason), 0.0) + delay
+    metrics.count('wikiportret_retries_total', host=host, reason=reason)
+    metrics.count('wikiportret_retry_wait_seconds_total', delay, host=host, reason=reason)
+
+
+def _retry_after(response):
+    """Returns the value of the Retry-After header in seconds (None if not set or not a number)"""
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retry policy of one session. All bots of an Image share the same policy, so max_wait limits the total
+    time the session can spend waiting for a wiki.
+    """
+
+    def __init__(self, attempts=5, base=1.0, cap=60.0, max_wait=300.0):
+        self.attempts = attempts  # Maximum number of attempts per request
+        self.base = base  # First backoff (seconds), doubled for every attempt
+        self.cap = cap  # Maximum backoff for a single retry
+        self.max_wait = max_wait  # Maximum total time the session may spend waiting
+        self.waited = 0.0  # Time waited so far by this session
+        self.retries = 0  # Number of retries done so far by this session
+        self.deadline = None  # Deadline of the session, we do not wait for a retry beyond it
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f'{self.retries} retries, {self.waited:.1f} of {self.max_wait:.0f} seconds spent waiting'
+
+    def delay(self, attempt, hint=None):
+        """Computes the delay before the next attempt (full jitter), never shorter than the hint of the server"""
+        backoff = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        if hint is not None:
+            return max(min(hint, self.cap), backoff)
+        return backoff
+
+    def _reserve(self, delay):
+        """Takes delay out of the wait budget of the session, returns False if the budget is used up"""
+        with self._lock:
+            if self.waited + delay > self.max_wait:
+                return False
+            self.waited += delay
+            self.retries += 1
+            return True
+
+    def call(self, host, idempotent, send):
+        """
+        Calls send (which should return a requests.Response) until it returns a response that is not transient.
+        idempotent should be True for reads & False for writes.
+        Returns the decoded JSON response. If all retries failed, the last error is raised
+            (or for errors reported by the API, the last response is returned, so the caller can deal with it).
+        """
+        attempt = 0
+        while True:
+            data, hint = None, None
+            try:
+                response = health.send(host, send, self.deadline)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                # If we did not manage to connect, the server never saw the request
+                if not idempotent and not isinstance(error, requests.exceptions.ConnectTimeout):
+                    raise
+                reason, last = type(error).__name__, error
+            else:
+                if response.status_code in retry_statuses or (idempotent
+                                                                and response.status_code in read_retry_statuses):
+                    reason, hint = f'http-{response.status_code}', _retry_after(response)
+                    last = requests.exceptions.HTTPError(f'{response.status_code} for {response.url}',
+                                                         response=response)
+                else:
+                    response.raise_for_status()
+                    data = codec.decode_response(response)
+                    code = data.get('error', {}).get('code') if isinstance(data, dict) else None
+                    if code not in retry_codes:
+                        return data
+                    reason, last = code, None
+                    hint = max((i for i in (_retry_after(response), data['error'].get('lag')) if i is not None),
+                               default=None)
+
+            delay = self.delay(attempt, hint)
+            attempt += 1
+            if self.deadline is not None and delay >= self.deadline.remaining():
+                print(f'No time left to retry on {host} ({reason})')
+                raise DeadlineExceeded(host)
+            if attempt >= self.attempts or not self._reserve(delay):
+                print(f'Giving up on {host} after {attempt} attempt(s) ({reason})')
+                if last is not None:
+                    raise last
+                return data  # The caller decides what to do with the API error
+            print(f'{reason} on {host}, retrying in {delay:.1f} seconds')
+            record(host, reason, delay)
+            time.sleep(delay)
@@ -0,0 +1,142 @@
+"""
+Module containing the scheduler for the steps of an upload.
+
+The steps of an upload (ticket, licence, category, claims on Wikidata, the article, ...) are modelled as nodes
+with declared dependencies. Steps that do not depend on each other are run at the same time,
+but never two steps on the same wiki, so the edits on a wiki stay in order & within its rate limit.
+An error in a step is isolated just like before: the step is marked as failed, a message is printed,
+and the steps that need its result are skipped. Errors that are not isolated stop the entire run.
+Steps that were done in an earlier run (see Scheduler, done) are not run again, so an upload can be resumed.
+"""
+
+import concurrent.futures
+
+
+class Step:
+    """
+    A single step of an upload.
+        * name: unique name of the step
+        * run: function without arguments that does the work
+        * host: the wiki the step edits (steps on the same host are never run at the same time)
+        * needs: steps that must have succeeded (if not, this step is skipped)
+        * after: steps that must have finished first, regardless of their outcome
+        * errors: exception types that only stop this step (any other exception stops the entire run)
+        * message: printed if one of those errors occurs
+        * description: printed when the step starts
+    Dependencies on steps that are not part of the run are ignored.
+    """
+
+    def __init__(self, name, run, host=None, needs=(), after=(), errors=(), message=None, description=None):
+        self.name, self.run, self.host = name, run, host
+        self.needs, self.after = tuple(needs), tuple(after)
+        self.errors = tuple(errors)
+        self.message = message if message is not None else f'Something went wrong in step {name}.'
+        self.description = description
+
+    def __repr__(self):
+        return f'Step({self.name!r}, host={self.host!r})'
+
+
+class Scheduler:
+    """
+    Runs a set of steps, respecting their dependencies (see Step)
+    fatal are exception types that always stop the entire run (even if a step isolates a base class of them)
+    done are the steps that were done in an earlier run (name => result), they count as done & are not run again
+    on_done is called with the name & result of every step that is done (in the thread calling run)
+    """
+
+    def __init__(self, steps, max_workers=4, fatal=(), done=None, on_done=None):
+        self.steps = {i.name: i for i in steps}
+        if len(self.steps) != len(steps):
+            raise ValueError('The names of the steps must be unique!')
+        self.max_workers = max_workers
+        self.fatal = tuple(fatal)
+        self.results = {}  # name => value returned by the step
+        self.status = {}  # name => 'done', 'failed' or 'skipped'
+        for name, result in (done or {}).items():
+            if name in self.steps:
+                self.results[name], self.status[name] = result, 'done'
+        self.on_done = on_done
+        self._check_cycles()
+
+    def _dependencies(self, step):
+        return [i for i in step.needs + step.after if i in self.steps]
+
+    def _check_cycles(self):
+        """Raises ValueError if the steps depend on each other in a circle (they would never run)"""
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return None
+            if name in visiting:
+                raise ValueError(f'Circular dependency involving step {name}!')
+            visiting.add(name)
+            for i in self._dependencies(self.steps[name]):
+                visit(i)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    def _ready(self, step, busy):
+        """Can the step start now? Returns None if not, True to run it & False to skip it"""
+        if step.host is not None and step.host in busy:
+            return None
+        if any(i not in self.status for i in self._dependencies(step)):
+            return None
+        return all(self.status.get(i, 'done') == 'done' for i in step.needs if i in self.steps)
+
+    def _run(self, step):
+        if step.description is not None:
+            print(step.description)
+        try:
+            result = step.run()
+        except step.errors as error:
+            if isinstance(error, self.fatal):
+                raise
+            print(step.message)
+            return 'failed', None
+        return 'done', result
+
+    def run(self):
+        """Runs all steps. Returns a dictionary name => status. Raises the first error that is not isolated."""
+        todo = [i for i in self.steps.values() if i.name not in self.status]
+        running = {}  # future => step
+        busy = set()  # hosts with a running step
+        error = None
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as executor:
+            while todo or running:
+                if error is None:
+                    for step in list(todo):
+                        ready = self._ready(step, busy)
+                        if ready is None:
+                            continue
+                        todo.remove(step)
+                        if ready is False:
+                            print(f'Skipping step {step.name}, because a step it needs did not succeed.')
+                            self.status[step.name] = 'skipped'
+                            continue
+                        if step.host is not None:
+                            busy.add(step.host)
+                        running[executor.submit(self._run, step)] = step
+                    if not running:
+                        continue  # Skipped steps might have made other steps ready
+                if not running:
+                    break  # Stopped because of an error
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    busy.discard(step.host)
+                    try:
+                        self.status[step.name], self.results[step.name] = future.result()
+                        if self.status[step.name] == 'done' and self.on_done is not None:
+                            self.on_done(step.name, self.results[step.name])
+                    except BaseException as e:
+                        self.status[step.name] = 'failed'
+                        if error is None:
+                            error = e  # Let the steps that are still running finish, but do not start new ones
+        if error is not None:
+            raise error
+        return self.status
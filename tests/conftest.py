@@ -0,0 +1,19 @@
+"""
+Shared setup of the tests: the modules are imported from the root of the repo (and from GUI for the background job).
+The cache & the state of the edit limiter go to a temporary directory, so the tests never touch those of the tool.
+"""
+
+import os
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'GUI'))
+sys.path.insert(0, root)
+
+import Wikiportret_cache as cache  # noqa: E402
+import Wikiportret_ratelimit as ratelimit  # noqa: E402
+
+_state = tempfile.mkdtemp(prefix='wikiportret-tests-')
+cache.configure(os.path.join(_state, 'cache.sqlite'))
+ratelimit.set_state_dir(os.path.join(_state, 'ratelimit'))
@@ -0,0 +1,48 @@
+import pytest
+
+import Wikiportret_cache as cache
+from Wikiportret_core import Image
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'path', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(cache, 'max_bytes', cache.max_bytes)
+
+
+def test_entry_only_for_its_revision():
+    cache.put('wikidata:Q1', 5, {'id': 'Q1', 'lastrevid': 5})
+    assert cache.get('wikidata:Q1', 5) == {'id': 'Q1', 'lastrevid': 5}
+    assert cache.get('wikidata:Q1', 6) is None  # The item was edited since
+    assert cache.get('wikidata:Q2', 5) is None
+
+
+def test_new_revision_replaces_entry():
+    cache.put('nl:main:Jan', 5, {'revid': 5})
+    cache.put('nl:main:Jan', 6, {'revid': 6})
+    assert cache.get('nl:main:Jan', 5) is None and cache.get('nl:main:Jan', 6) == {'revid': 6}
+
+
+def test_least_recently_used_is_evicted(monkeypatch):
+    monkeypatch.setattr(cache, 'max_bytes', 2 * len(cache.codec.dumps({'text': 'x' * 100})))
+    for i in ('Jan', 'Piet'):
+        cache.put(i, 1, {'text': 'x' * 100})
+    assert cache.get('Jan', 1) is not None  # Jan is now used more recently than Piet
+    cache.put('Klaas', 1, {'text': 'x' * 100})
+    assert cache.get('Piet', 1) is None
+    assert cache.get('Jan', 1) is not None and cache.get('Klaas', 1) is not None
+
+
+def test_broken_cache_does_not_stop_the_bot(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, 'path', str(tmp_path))  # A directory cannot be opened as a database
+    cache.put('wikidata:Q1', 5, {'id': 'Q1'})
+    assert cache.get('wikidata:Q1', 5) is None
+
+
+def test_wikidata_item_from_cache_while_unchanged():
+    Image._cache_wikidata({'entities': {'Q1': {'id': 'Q1', 'lastrevid': 5, 'claims': {}}}})
+    assert Image._cached_wikidata({'entities': {'Q1': {'lastrevid': 5}}}) == \
+        {'entities': {'Q1': {'id': 'Q1', 'lastrevid': 5, 'claims': {}}}}
+    assert Image._cached_wikidata({'entities': {'Q1': {'lastrevid': 6}}}) is None
+    missing = {'entities': {'-1': {'missing': ''}}}
+    assert Image._cached_wikidata(missing) is missing  # Nothing to download for an item that does not exist
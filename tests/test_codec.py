@@ -0,0 +1,40 @@
+import json
+
+import pytest
+import requests
+
+import Wikiportret_codec as codec
+
+CLAIMS = {'P18': [{'mainsnak': {'datavalue': {'value': 'Jan Ëlsen.jpg'}}}], 'P569': None, 'count': 3}
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    """Runs the test with orjson (if installed) & with the json module of the standard library"""
+    if request.param == 'orjson' and codec.orjson is None:
+        pytest.skip('orjson is not installed')
+    if request.param == 'json':
+        monkeypatch.setattr(codec, 'orjson', None)
+    return request.param
+
+
+def test_round_trip(backend):
+    data = codec.dumps(CLAIMS)
+    assert isinstance(data, bytes) and codec.loads(data) == CLAIMS
+    assert codec.loads(data.decode('utf8')) == CLAIMS  # The db can also give back a str
+
+
+def test_same_output_as_json(backend):
+    assert codec.dumps(CLAIMS) == json.dumps(CLAIMS, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+    assert codec.dumps_str(CLAIMS) == codec.dumps(CLAIMS).decode('utf8')
+
+
+def test_decode_response(backend):
+    response = requests.Response()
+    response._content = codec.dumps(CLAIMS)
+    assert codec.decode_response(response) == CLAIMS
+
+
+def test_invalid_json_raises_value_error(backend):
+    with pytest.raises(ValueError):  # Both json.JSONDecodeError & orjson.JSONDecodeError
+        codec.loads(b'<html>Wikimedia error</html>')
@@ -0,0 +1,84 @@
+import pytest
+import requests
+
+import Wikiportret_health as health
+from Wikiportret_deadline import Deadline, DeadlineExceeded
+
+
+def failing(host, n):
+    for _ in range(n):
+        host.record(False, 0.1)
+
+
+def open_circuit(host):
+    """Fails requests until the circuit opens"""
+    for _ in range(20):
+        if host.is_open:
+            return None
+        host.record(False, 0.1)
+    raise AssertionError('The circuit did not open')
+
+
+def test_limit_shrinks_with_health():
+    host = health.HostHealth('shrink.test')
+    assert host.limit == health.max_in_flight
+    failing(host, 2)
+    assert 1 <= host.limit < health.max_in_flight and not host.is_open
+
+
+def test_circuit_opens_and_closes(monkeypatch):
+    host = health.HostHealth('circuit.test')
+    open_circuit(host)
+    assert host.is_open and host.limit == 1 and not host.probe_due
+    monkeypatch.setattr(host, 'opened_at', host.opened_at - health.cooldown)
+    assert host.probe_due
+    host.record(True, 0.1)  # The probe
+    assert not host.is_open and host.score >= 2 * health.open_below
+
+
+def test_failed_probe_doubles_cooldown(monkeypatch):
+    host = health.HostHealth('probe.test')
+    open_circuit(host)
+    monkeypatch.setattr(host, 'opened_at', host.opened_at - health.cooldown)
+    host.record(False, 0.1)
+    assert host.is_open and host.cooldown == 2 * health.cooldown
+
+
+def test_acquire_stops_at_deadline():
+    host = health.HostHealth('deadline.test')
+    for _ in range(host.limit):
+        host.acquire()
+    with pytest.raises(DeadlineExceeded) as error:
+        host.acquire(Deadline(0.05))
+    assert not isinstance(error.value, health.CircuitOpen)
+
+
+def test_acquire_stops_at_deadline_if_circuit_open():
+    host = health.HostHealth('open.test')
+    open_circuit(host)
+    host.acquire()  # The only request allowed while the circuit is open
+    with pytest.raises(health.CircuitOpen):
+        host.acquire(Deadline(0.05))
+    host.release()
+    host.acquire(Deadline(0.05))
+
+
+class Lagging(Exception):
+    """Stands in for MaxlagError"""
+
+
+def test_requeue_when_circuit_open(monkeypatch):
+    monkeypatch.setattr(health, 'paused', lambda: False)
+    assert health.requeue(health.CircuitOpen('requeue.test'))
+    assert not health.requeue(DeadlineExceeded('requeue.test'))
+    assert not health.requeue(requests.exceptions.ConnectionError('reset'))
+
+
+def test_requeue_request_errors_while_paused(monkeypatch):
+    monkeypatch.setattr(health, 'paused', lambda: True)
+    assert health.requeue(requests.exceptions.ConnectionError('reset'))
+    assert health.requeue(requests.exceptions.HTTPError('502'))
+    assert health.requeue(Lagging(), (Lagging,))
+    assert not health.requeue(Lagging())
+    assert not health.requeue(DeadlineExceeded('requeue.test'))
+    assert not health.requeue(KeyError('P18'))
@@ -0,0 +1,53 @@
+import pytest
+from requests_oauthlib import OAuth1
+
+import Wikiportret_core as core
+import Wikiportret_http as http
+
+COMMONS = 'https://commons.wikimedia.org/w/api.php'
+WIKIDATA = 'https://www.wikidata.org/w/api.php'
+
+
+@pytest.fixture(autouse=True)
+def no_sessions(monkeypatch):
+    monkeypatch.setattr(http, '_sessions', {})
+
+
+def login(owner):
+    return OAuth1('consumer', 'consumer secret', owner, 'owner secret')
+
+
+def test_host_of():
+    assert http.host_of(COMMONS) == 'commons.wikimedia.org'
+
+
+def test_identity_of():
+    assert http.identity_of(None) is None
+    assert http.identity_of(login('token')) == ('consumer', 'token')
+    assert http.identity_of(login('token')) == http.identity_of(login('token'))  # Another signer of the same login
+
+
+def test_session_shared_per_host_and_identity():
+    session = http.get_session(COMMONS, login('token'))
+    assert http.get_session(COMMONS.replace('api.php', 'index.php'), login('token')) is session
+    assert http.get_session(WIKIDATA, login('token')) is not session
+    assert http.get_session(COMMONS, login('other')) is not session
+    assert http.get_session(COMMONS) is not session
+
+
+def test_pool_size(monkeypatch):
+    monkeypatch.setattr(http, 'pool_size', http.pool_size)
+    http.set_pool_size(3)
+    assert http.get_session(COMMONS).get_adapter(COMMONS)._pool_maxsize == 3
+    with pytest.raises(ValueError):
+        http.set_pool_size(0)
+
+
+def test_close_all():
+    session = http.get_session(COMMONS)
+    http.close_all()
+    assert http.get_session(COMMONS) is not session
+
+
+def test_bots_share_the_session():
+    assert core.WikidataBot().session is core.WikidataBot().session
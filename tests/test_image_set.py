@@ -0,0 +1,42 @@
+import pytest
+
+from Wikiportret_core import Image, ImageSet
+
+
+def test_existing_image_is_the_main_file():
+    main = Image('Jan.jpg', 'Jan')
+    main.user = 'operator'
+    images = ImageSet(['Jan.jpg', 'Jan 2.jpg'], ['Jan', 'Piet'], main=main)
+    assert images.main is main
+    assert [i.file for i in images.files] == ['Jan.jpg', 'Jan 2.jpg']
+    assert [i.name for i in images.subjects] == ['Jan', 'Piet']
+    assert all(i.user == 'operator' for i in images.images)  # The login of the session is used for the set
+
+
+def test_main_image_must_come_first():
+    with pytest.raises(AssertionError):
+        ImageSet(['Piet.jpg', 'Jan.jpg'], ['Jan'], main=Image('Jan.jpg', 'Jan'))
+
+
+def test_pages_of_all_subjects_are_purged():
+    images = ImageSet(['Jan.jpg', 'Jan 2.jpg'], ['Jan', 'Piet'])
+    images.subjects[1].qid = 'Q2'
+    titles = [title for _, title in images.purge_targets()]
+    assert titles == [f'Category:{images.main.catname}', 'Jan', f'Category:{images.subjects[1].catname}', 'Piet', 'Q2']
+
+
+def licensed(mc, comtext):
+    image = Image('Jan.jpg', 'Jan')
+    image.mc, image.comtext = mc, comtext
+    return image
+
+
+def test_licence_read_from_permission_line():
+    image = licensed({}, '{{Information}}\nPermission=CC-BY-SA 4.0\n')
+    assert image.get_licence_for_image() == 'CC-BY-SA 4.0'
+
+
+def test_licence_kept_when_already_set():
+    image = licensed({'P275': [{}]}, None)
+    image.licence = 'CC-BY-SA 4.0'
+    assert image.get_licence_for_image() == 'CC-BY-SA 4.0'  # Nothing to read, the file already has its licence
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from Wikiportret_core import ReadMemo
+
+API = 'https://nl.wikipedia.org/w/api.php'
+
+
+def counting(result=None):
+    def fetch():
+        fetch.calls += 1
+        return result if result is not None else {'call': fetch.calls}
+    fetch.calls = 0
+    return fetch
+
+
+def test_same_request_is_done_once():
+    memo, fetch = ReadMemo(), counting()
+    assert memo.get(API, {'action': 'query', 'titles': 'Jan'}, fetch) == {'call': 1}
+    assert memo.get(API, {'titles': 'Jan', 'action': 'query'}, fetch) == {'call': 1}  # The order does not matter
+    assert fetch.calls == 1 and memo.saved == 1
+
+
+def test_other_requests_and_wikis_are_done():
+    memo, fetch = ReadMemo(), counting()
+    memo.get(API, {'titles': 'Jan'}, fetch)
+    memo.get(API, {'titles': 'Piet'}, fetch)
+    memo.get(API.replace('nl.wikipedia', 'commons.wikimedia'), {'titles': 'Jan'}, fetch)
+    assert fetch.calls == 3
+
+
+def test_write_invalidates_the_wiki():
+    memo, fetch = ReadMemo(), counting()
+    memo.get(API, {'titles': 'Jan'}, fetch)
+    memo.invalidate(API)
+    assert memo.get(API, {'titles': 'Jan'}, fetch) == {'call': 2}
+
+
+def test_errors_are_not_remembered():
+    memo = ReadMemo()
+
+    def failing():
+        raise ValueError('No answer')
+    with pytest.raises(ValueError):
+        memo.get(API, {'titles': 'Jan'}, failing)
+    assert memo.get(API, {'titles': 'Jan'}, counting()) == {'call': 1}
+
+
+def test_request_in_flight_is_shared():
+    memo, started, release = ReadMemo(), threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return {'slow': 1}
+    results = []
+    first = threading.Thread(target=lambda: results.append(memo.get(API, {'titles': 'Jan'}, slow)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(memo.get(API, {'titles': 'Jan'}, counting())))
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert results == [{'slow': 1}, {'slow': 1}] and memo.saved == 1
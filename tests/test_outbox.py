@@ -0,0 +1,138 @@
+import re
+
+import pytest
+
+import Wikiportret_codec as codec
+import Wikiportret_plan as plans
+
+try:
+    import Wikiportret_outbox as outbox
+except (ImportError, OSError):  # The db utilities load the encryption keys of the tool when they are imported
+    pytest.skip('The db utilities of the background job are not available', allow_module_level=True)
+
+COMMONS = 'https://commons.wikimedia.org/w/api.php'
+WIKIDATA = 'https://www.wikidata.org/w/api.php'
+
+
+class FakeBot:
+    """Answers the writes with a function of the parameters, keeps the writes it got"""
+
+    def __init__(self, api, answer):
+        self.api, self._auth, self.answer, self.sent = api, None, answer, []
+
+    def get(self, payload):
+        return {'entities': {i: {'claims': {}} for i in payload['ids'].split('|')}}
+
+    def post(self, params):
+        self.sent.append(params)
+        return self.answer(params)
+
+
+class FakeOutbox:
+    """The outbox table (& the sessions waiting for it), answering the queries of Wikiportret_outbox"""
+
+    def __init__(self):
+        self.rows = {}  # (session, write) => row
+
+    def add(self, session_id, plan, status='pending', due=True, response=None, attempts=0):
+        for write in plan:
+            self.rows[session_id, write.id] = {'user': 1, 'info': codec.dumps(plan.info),
+                                               'data': codec.dumps(write.to_dict()), 'status': status,
+                                               'due': due, 'response': response, 'attempts': attempts}
+
+    def row(self, query):
+        session_id, write_id = re.search(r'session_id = (\d+) AND write_id = (\d+)', query).groups()
+        return self.rows[int(session_id), int(write_id)]
+
+    def query_db(self, query, dbname, need_all=False, connection=None, deadline=None):
+        if query.strip().startswith('SELECT COUNT(*)'):
+            session_id = int(re.search(r'session_id = (\d+)', query).group(1))
+            return (sum(1 for (s, _), i in self.rows.items() if s == session_id and i['status'] == 'failed'),)
+        due = {s for (s, _), i in self.rows.items() if i['status'] == 'pending' and i['due']}
+        return [(s, w, i['user'], i['info'], i['data'], i['status'], i['response'], i['due'])
+                for (s, w), i in sorted(self.rows.items()) if s in due]
+
+    def adjust_db(self, query, dbname, connection=None, deadline=None, args=None):
+        row = self.row(query)
+        if "status = 'done'" in query:
+            row['status'], row['response'] = 'done', args[0]
+        elif 'attempts = attempts + 1' in query:
+            row['attempts'] += 1
+            row['status'] = 'failed' if row['attempts'] > outbox.attempts else 'pending'
+            row['due'] = False
+        elif "status = 'failed'" in query:
+            row['status'] = 'failed'
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeOutbox()
+    monkeypatch.setattr(outbox.dbut, 'query_db', fake.query_db)
+    monkeypatch.setattr(outbox.dbut, 'adjust_db', fake.adjust_db)
+    return fake
+
+
+@pytest.fixture
+def wikis(monkeypatch):
+    """The bots of the sender, answer[api] decides what the wiki answers"""
+    answer = {COMMONS: lambda params: {'edit': {'result': 'Success', 'newrevid': 7, 'newtimestamp': 'T'}},
+              WIKIDATA: lambda params: {'success': 1, 'pageinfo': {'lastrevid': 8},
+                                        'claim': {'id': 'Q1$new', 'mainsnak': {'property': params['property']}}}}
+    bots = {api: FakeBot(api, lambda params, api=api: answer[api](params)) for api in answer}
+    monkeypatch.setattr(outbox, '_bots', lambda config, user_id, deadline: bots)
+    return answer, bots
+
+
+def plan_with_dependency():
+    """A new P18 claim on Wikidata (write 0) & a write that needs its id (write 1)"""
+    plan = plans.EditPlan({'file': 'Jan.jpg'})
+    plan.writes = [plans.Write(0, WIKIDATA, {'action': 'wbcreateclaim', 'entity': 'Q1', 'property': 'P18',
+                                             'snaktype': 'value', 'value': '"Jan.jpg"'}),
+                   plans.Write(1, WIKIDATA, {'action': 'wbsetqualifier', 'claim': '<write 0:claim>',
+                                             'property': 'P585', 'snaktype': 'value', 'value': '{}'}, requires=(0,)),
+                   plans.Write(2, COMMONS, {'action': 'edit', 'title': 'File:Jan.jpg', 'appendtext': 'x'})]
+    return plan
+
+
+def drain():
+    return outbox.drain({'DB_NAME': 'test'}, connection=None)
+
+
+def test_all_writes_done(db, wikis):
+    db.add(1, plan_with_dependency())
+    assert drain() == {1: 'done'}
+    assert all(i['status'] == 'done' for i in db.rows.values())
+    qualifier = [i for i in wikis[1][WIKIDATA].sent if i['action'] == 'wbsetqualifier'][0]
+    assert qualifier['claim'] == 'Q1$new'  # The placeholder was filled in
+
+
+def test_failed_write_is_retried_later(db, wikis):
+    answer, bots = wikis
+    answer[WIKIDATA] = lambda params: {'error': {'code': 'failed-save'}}
+    db.add(1, plan_with_dependency())
+    assert drain() == {1: None}
+    assert db.rows[1, 0]['attempts'] == 1
+    assert db.rows[1, 1]['attempts'] == 0  # Never sent, the write it needs failed
+    assert db.rows[1, 2]['status'] == 'done'
+    assert drain() == {1: None}  # Write 1 is due, but it still waits for write 0 (not due until the backoff is over)
+    assert len(bots[WIKIDATA].sent) == 1
+    assert db.rows[1, 0]['attempts'] == 1 and db.rows[1, 1]['attempts'] == 0
+
+
+def test_given_up_write_gives_up_the_writes_that_need_it(db, wikis):
+    plan = plan_with_dependency()
+    db.add(1, plan)
+    db.rows[1, 0]['status'] = 'failed'
+    assert drain() == {1: 'failed'}
+    assert db.rows[1, 1]['status'] == 'failed'
+    assert not wikis[1][WIKIDATA].sent  # The given up writes are never sent again
+    assert db.rows[1, 2]['status'] == 'done'
+
+
+def test_writes_that_are_not_due_are_not_sent(db, wikis):
+    db.add(1, plan_with_dependency())
+    db.rows[1, 0]['due'], db.rows[1, 0]['attempts'] = False, 3
+    assert drain() == {1: None}
+    assert not wikis[1][WIKIDATA].sent
+    assert db.rows[1, 0]['attempts'] == 3 and db.rows[1, 1]['attempts'] == 0
+    assert db.rows[1, 2]['status'] == 'done'
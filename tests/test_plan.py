@@ -0,0 +1,107 @@
+import Wikiportret_codec as codec
+import Wikiportret_plan as plans
+
+WIKIDATA = 'https://www.wikidata.org/w/api.php'
+
+
+class FakeBot:
+    """A bot on Wikidata with the claims that are already on the entities, keeps the writes it got"""
+
+    def __init__(self, claims=None, lastrevid=5):
+        self.api, self._auth, self.sent = WIKIDATA, None, []
+        self.claims, self.lastrevid = claims or {}, lastrevid
+
+    def get(self, payload):
+        return {'entities': {i: {'claims': self.claims.get(i, {}), 'lastrevid': self.lastrevid}
+                             for i in payload['ids'].split('|')}}
+
+    def post(self, params):
+        self.sent.append(params)
+        return {'success': 1, 'entity': {'id': params.get('id', params.get('entity')), 'lastrevid': 9},
+                'claim': {'id': 'Q1$new'}, 'pageinfo': {'lastrevid': 9}}
+
+
+def item(qid):
+    return {'entity-type': 'item', 'numeric-id': int(qid[1:]), 'id': qid}
+
+
+def plan_with(*params):
+    plan = plans.EditPlan({'file': 'Test.jpg'})
+    for i in params:
+        plan.add(FakeBot(), i)
+    return plan
+
+
+def claim(prop, value):
+    return {'action': 'wbcreateclaim', 'entity': 'Q1', 'property': prop, 'snaktype': 'value',
+            'value': codec.dumps_str(value), 'bot': True}
+
+
+def present(prop, value):
+    return {prop: [plans._statement(prop, value, 'Q1$old')]}
+
+
+def test_merge_claims_and_sitelinks():
+    plan = plan_with(claim('P18', 'Test.jpg'), claim('P18', 'Test.jpg'),
+                     {'action': 'wbsetsitelink', 'id': 'Q1', 'linksite': 'commonswiki', 'linktitle': 'Category:Test'})
+    params = plans._merge(plan.writes)
+    data = codec.loads(params['data'])
+    assert params['action'] == 'wbeditentity' and params['id'] == 'Q1'
+    assert [i['mainsnak']['property'] for i in data['claims']] == ['P18']  # Both sessions add the same claim
+    assert data['sitelinks'] == {'commonswiki': {'site': 'commonswiki', 'title': 'Category:Test'}}
+
+
+def test_apply_merges_new_claims():
+    plan = plan_with(claim('P18', 'Test.jpg'), claim('P31', item('Q5')))
+    bot = FakeBot()
+    results = plans.apply([plan], lambda plan, api: bot)
+    assert len(bot.sent) == 1 and bot.sent[0]['action'] == 'wbeditentity'
+    assert set(results[0]) == {0, 1}
+
+
+def test_apply_does_not_resend_done_writes():
+    plan = plan_with(claim('P18', 'Test.jpg'),
+                     {'action': 'wbsetqualifier', 'claim': '<write 0:claim>',
+                      'property': 'P2096', 'snaktype': 'value', 'value': '"Test"', 'bot': True})
+    bot = FakeBot()
+    results = plans.apply([plan], lambda plan, api: bot, done=[{0: {'success': 1, 'claim': {'id': 'Q1$done'}}}])
+    assert [i['action'] for i in bot.sent] == ['wbsetqualifier']
+    assert bot.sent[0]['claim'] == 'Q1$done'  # The placeholder is filled in with the response of before
+    assert set(results[0]) == {0, 1}
+
+
+def test_apply_skips_present_claim():
+    bot = FakeBot(claims={'Q1': present('P18', 'Test.jpg')})
+    results = plans.apply([plan_with(claim('P18', 'Test.jpg'))], lambda plan, api: bot)
+    assert bot.sent == []
+    assert results[0][0]['claim']['id'] == 'Q1$old'
+
+
+def edit_entity(*statements, baserevid=3):
+    return {'action': 'wbeditentity', 'id': 'Q1', 'baserevid': baserevid, 'bot': True,
+            'data': codec.dumps_str({'claims': [plans._statement(*i) for i in statements]})}
+
+
+def test_apply_drops_present_claims_of_edit_entity():
+    bot = FakeBot(claims={'Q1': present('P18', 'Test.jpg')}, lastrevid=6)
+    plans.apply([plan_with(edit_entity(('P18', 'Test.jpg'), ('P373', 'Test')))], lambda plan, api: bot)
+    data = codec.loads(bot.sent[0]['data'])
+    assert [i['mainsnak']['property'] for i in data['claims']] == ['P373']
+    assert bot.sent[0]['baserevid'] == 6  # The claim that is present was added after planning
+
+
+def test_apply_skips_edit_entity_already_done():
+    bot = FakeBot(claims={'Q1': present('P18', 'Test.jpg')}, lastrevid=6)
+    plan = plan_with(edit_entity(('P18', 'Test.jpg')),
+                     {'action': 'edit', 'title': 'Test', 'text': 'revision <write 0:revid>'})
+    results = plans.apply([plan], lambda plan, api: bot)
+    assert [i['action'] for i in bot.sent] == ['edit']
+    assert bot.sent[0]['text'] == 'revision 6'
+    assert set(results[0]) == {0, 1}
+
+
+def test_apply_sends_edit_entity_unchanged():
+    bot = FakeBot()
+    params = edit_entity(('P18', 'Test.jpg'))
+    plans.apply([plan_with(params)], lambda plan, api: bot)
+    assert bot.sent == [params]
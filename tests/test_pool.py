@@ -0,0 +1,73 @@
+import pytest
+import requests
+
+import Wikiportret_core as core
+import Wikiportret_pool as pool
+
+
+class Login:
+    """Stands in for an OAuth1 signer, numbered in the order they were made"""
+    made = 0
+
+    def __init__(self):
+        Login.made += 1
+        self.number = Login.made
+
+
+@pytest.fixture(autouse=True)
+def empty_pool(monkeypatch):
+    monkeypatch.setattr(pool, '_logins', {})
+    monkeypatch.setattr(pool, '_sources', {})
+    monkeypatch.setattr(pool, '_locks', {})
+
+
+def test_login_is_made_once():
+    pool.register('user', Login)
+    assert pool.login('user') is pool.login('user')
+
+
+def test_unknown_user():
+    with pytest.raises(KeyError):
+        pool.login('nobody')
+
+
+def test_register_replaces_source():
+    pool.register('user', lambda: 'old')
+    pool.register('user', lambda: 'new')
+    assert pool.login('user') == 'new'
+
+
+def test_login_expires(monkeypatch):
+    pool.register('user', Login)
+    first = pool.login('user')
+    monkeypatch.setattr(pool, 'ttl', 0)
+    assert pool.login('user') is not first
+
+
+def test_invalidate_only_drops_the_refused_login():
+    pool.register('user', Login)
+    first = pool.login('user')
+    pool.invalidate('user', first)
+    second = pool.login('user')
+    assert second is not first
+    pool.invalidate('user', first)  # Another thread saw the same error, the new login is kept
+    assert pool.login('user') is second
+
+
+def test_bot_logs_in_again_when_refused(monkeypatch):
+    pool.register('user', Login)
+    bot = core.WikidataBot()
+    bot.user = 'user'
+    refused = bot._auth
+    answers = [b'{"error": {"code": "mwoauth-invalid-authorization-invalid-user"}}', b'{"ok": 1}']
+    used = []
+
+    def send(method, **kwargs):
+        used.append(bot._auth)
+        response = requests.Response()
+        response.status_code, response._content = 200, answers.pop(0)
+        return response
+    monkeypatch.setattr(bot, '_send', send)
+    assert bot.get({'action': 'query'}, memoize=False) == {'ok': 1}
+    assert used[0] is refused and used[1] is not refused
+    assert pool.login('user') is used[1]
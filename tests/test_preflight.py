@@ -0,0 +1,119 @@
+import datetime as dt
+
+from Wikiportret_core import Image
+
+ARTICLE = "'''Jan''' is iemand.\n{{Infobox persoon\n| afbeelding = \n| onderschrift = \n}}\nTekst"
+
+
+def image(claims=None, article=ARTICLE):
+    """An Image with the results of the reads already in place (so preflight needs no API calls)"""
+    im = Image('Jan.jpg', 'Jan')
+    im.claims = claims if claims is not None else {}
+    im.article, im.article_revid, im.article_timestamp = article, 5, '2026-01-01T00:00:00Z'
+    im.article_infobox, im.dp, im.redirect, im.file_in_article = True, False, False, False
+    return im
+
+
+def time_claim(prop, value):
+    return {prop: [{'mainsnak': {'property': prop, 'datavalue': {'value': {'time': value}}}}]}
+
+
+def test_preflight_with_birth_date_and_image_date():
+    im = image(time_claim('P569', '+1950-01-02T00:00:00Z'))
+    im.date = dt.date(2020, 1, 1)
+    im.date_born()
+    report = im.preflight()
+    assert report['alive'] is True
+    assert report['article_revid'] == 5
+
+
+def test_preflight_date_before_birth():
+    im = image(time_claim('P569', '+1950-01-02T00:00:00Z'))
+    im.date = dt.date(1949, 1, 1)
+    im.date_born()
+    assert im.preflight()['alive'] is False
+
+
+def test_preflight_date_after_death():
+    im = image(time_claim('P570', '+2000-05-01T00:00:00Z'))
+    im.date = dt.date(2001, 1, 1)
+    im.date_deceased()
+    assert im.preflight()['alive'] is False
+
+
+def test_preflight_without_date():
+    assert image().preflight()['alive'] is None
+
+
+def test_preflight_infobox_checks():
+    report = image().preflight()
+    assert report['infobox'] is True
+    assert report['infobox_image'] is False
+    filled = ARTICLE.replace('| afbeelding = ', '| afbeelding = Ander.jpg')
+    assert image(article=filled).preflight()['infobox_image'] is True
+
+
+def test_preflight_p18_and_redirect():
+    claims = {'P18': [{'mainsnak': {'property': 'P18', 'datavalue': {'value': 'Ander.jpg'}}}]}
+    im = image(claims, article='#DOORVERWIJZING [[Elders]]')
+    im.article_infobox = False  # No infobox anywhere, so the rest of the article is not needed
+    report = im.preflight()
+    assert report['p18'] == ['Ander.jpg']
+    assert report['redirect'] is True
+
+
+def test_restore_preflight():
+    report = image().preflight()
+    im = Image('Jan.jpg', 'Jan')
+    im.restore_preflight(report, ARTICLE)
+    assert im.article == ARTICLE and im.article_revid == 5
+    assert im.preflight_report is report
+
+
+def test_file_in_article_only_for_this_file():
+    im = image()
+    assert im._is_file('Bestand:Jan.jpg') and im._is_file('Bestand:jan.jpg')
+    assert not im._is_file('Bestand:Piet.jpg')  # Another file of the same ImageSet
+    im.file = 'Jan de Vries.jpg'
+    assert im._is_file('Bestand:Jan_de_Vries.jpg')
+
+
+def test_copyrighted_only_without_public_domain_hint():
+    im = image()
+    im.comtext = '{{Information|description=Jan}}\n{{cc-by-sa-4.0}}\n[[Category:Updates]]'
+    assert im._copyrighted() is True
+    im.comtext = '{{Information|description=Jan}}\n{{PD-old-70}}'
+    assert im._copyrighted() is False
+
+
+def test_operator_decides_over_public_domain_hint():
+    im = image()
+    im.comtext = '{{Information|description=Jan}}\n{{PD-old-70}}'
+    assert im._copyrighted(public_domain=False) is True  # The hint was a false positive
+    im.comtext = '{{cc-by-sa-4.0}}'
+    assert im._copyrighted(public_domain=True) is False
+
+
+def test_preflight_shows_public_domain_hint():
+    im = image()
+    assert im.preflight()['public_domain_hint'] is None  # The file page was not read
+    im.mc, im.comtext = {}, '{{PD-old-70}}'
+    assert im.preflight()['public_domain_hint'] is True
+    im.comtext = '{{cc-by-sa-4.0}}'
+    assert im.preflight()['public_domain_hint'] is False
+
+
+def date_qualifier(photo_date):
+    """The P585 qualifier of the new P18 claim of a subject that died on 1 May 2000 (None if it is missing)"""
+    im = image(time_claim('P570', '+2000-05-01T00:00:00Z'))
+    im.qid, im.date = 'Q1', photo_date
+    claim, = im.wikidata_entity_data(category=False)['claims']
+    return claim.get('qualifiers', {}).get('P585')
+
+
+def test_date_qualifier_for_photo_before_death():
+    assert date_qualifier(dt.date(1999, 1, 1)) is not None
+
+
+def test_no_date_qualifier_for_photo_after_death():
+    assert date_qualifier(dt.date(2001, 1, 1)) is None
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from Wikiportret_core import AsyncImage, Image, run_sync
+
+
+def prepared(dp):
+    """An AsyncImage of which the reads only note the wiki (the nlwiki read finds whether the page is dp)"""
+    image = AsyncImage(Image('Jan.jpg', 'Jan'))
+    image.read = []
+
+    async def read(wiki):
+        image.read.append(wiki)
+        if wiki == 'nl':
+            image.image.dp = dp
+
+    async def ini_wikidata():
+        image.read.append('wikidata')
+    image._read, image.ini_wikidata = read, ini_wikidata
+    return image
+
+
+def test_disambiguation_page_stops_before_wikidata():
+    image = prepared(True)
+    with pytest.raises(ValueError):
+        asyncio.run(image.prepare_image_data())
+    assert 'wikidata' not in image.read
+
+
+def test_all_reads_done():
+    image = prepared(False)
+    assert asyncio.run(image.prepare_image_data()) is True
+    assert sorted(image.read) == ['commons', 'nl', 'wikidata']
+
+
+async def answer():
+    await asyncio.sleep(0)
+    return 42
+
+
+def test_run_sync_without_loop():
+    assert run_sync(answer()) == 42
+
+
+def test_run_sync_inside_running_loop():
+    async def caller():
+        return run_sync(answer())  # A synchronous method called from async code
+    assert asyncio.run(caller()) == 42
@@ -0,0 +1,46 @@
+import os
+
+import Wikiportret_ratelimit as ratelimit
+
+
+def no_userinfo():
+    raise AssertionError('The limits of the account should not be read')
+
+
+def test_explicit_limit_skips_userinfo():
+    bucket = ratelimit.get_bucket('limit.test', ('consumer', 'owner'), no_userinfo, (12, 60), (30, 60))
+    assert bucket.capacity == 30
+    assert ratelimit.get_bucket('limit.test', ('consumer', 'owner'), no_userinfo, (12, 60), (30, 60)) is bucket
+
+
+def test_userinfo_read_once():
+    calls = []
+
+    def userinfo():
+        calls.append(1)
+        return {'name': 'Test', 'rights': ['noratelimit']}
+    first = ratelimit.get_bucket('userinfo.test', ('consumer', 'owner'), userinfo, (12, 60))
+    assert ratelimit.get_bucket('userinfo.test', ('consumer', 'owner'), userinfo, (12, 60)) is first
+    assert calls == [1] and first.capacity == ratelimit.bot_limit[0]
+
+
+def test_same_key_in_memory_and_on_disk():
+    bucket = ratelimit.get_bucket('key.test', ('consumer', 'secret-owner'), lambda: {}, (12, 60))
+    key = ratelimit.bucket_key('key.test', ('consumer', 'secret-owner'))
+    assert key.startswith('key.test-')
+    assert ratelimit._buckets[key] is bucket
+    assert os.path.basename(bucket.path) == key + '.json'
+    assert 'secret-owner' not in bucket.path
+
+
+def test_accounts_get_their_own_bucket():
+    anonymous = ratelimit.get_bucket('accounts.test', None, lambda: {}, (12, 60))
+    account = ratelimit.get_bucket('accounts.test', ('consumer', 'owner'), lambda: {}, (12, 60))
+    assert anonymous.path != account.path
+
+
+def test_explicit_limits_share_the_bucket_of_the_account():
+    first = ratelimit.get_bucket('shared.test', ('consumer', 'owner'), lambda: {}, (12, 60))
+    limited = ratelimit.get_bucket('shared.test', ('consumer', 'owner'), no_userinfo, (12, 60), (6, 60))
+    assert limited is first and first.capacity == 6
+    assert ratelimit.get_bucket('shared.test', ('consumer', 'owner'), no_userinfo, (12, 60)) is first
@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+import Wikiportret_cache as cache
+import Wikiportret_metrics as metrics
+import Wikiportret_retry as retry
+from Wikiportret_deadline import Deadline, DeadlineExceeded
+
+
+def response(status=200, body=b'{}', headers=None):
+    result = requests.Response()
+    result.status_code, result._content, result.url = status, body, 'https://test.invalid/w/api.php'
+    result.headers.update(headers or {})
+    return result
+
+
+def sender(*outcomes):
+    """Sends the outcomes one by one (a Response, or an exception that is raised), keeps the number of calls"""
+    outcomes = list(outcomes)
+
+    def send():
+        send.calls += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    send.calls = 0
+    return send
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, 'sleep', lambda seconds: None)
+
+
+def policy(**kwargs):
+    return retry.RetryPolicy(**{'base': 0.01, 'cap': 0.01, **kwargs})
+
+
+def counter(name, **labels):
+    return metrics._counters.get(metrics._key(name, labels), 0)
+
+
+def test_maxlag_is_retried():
+    send = sender(response(body=b'{"error": {"code": "maxlag", "lag": 0.01}}'), response(body=b'{"ok": 1}'))
+    before = counter('wikiportret_retries_total', host='retry-maxlag', reason='maxlag')
+    assert policy().call('retry-maxlag', False, send) == {'ok': 1}
+    assert send.calls == 2
+    assert counter('wikiportret_retries_total', host='retry-maxlag', reason='maxlag') == before + 1
+    assert 'wikiportret_retries_total{process="main",host="retry-maxlag",reason="maxlag"} 1' in metrics.render()
+
+
+def test_write_is_not_retried_after_server_error():
+    send = sender(response(status=502), response(body=b'{"ok": 1}'))
+    with pytest.raises(requests.exceptions.HTTPError):
+        policy().call('retry-write', False, send)
+    assert send.calls == 1
+
+
+def test_read_is_retried_after_server_error():
+    send = sender(response(status=502), response(body=b'{"ok": 1}'))
+    assert policy().call('retry-read', True, send) == {'ok': 1}
+
+
+def test_write_is_not_retried_after_reset():
+    send = sender(requests.exceptions.ConnectionError('reset'), response(body=b'{"ok": 1}'))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        policy().call('retry-reset', False, send)
+    assert send.calls == 1
+
+
+def test_api_error_returned_when_attempts_used_up():
+    send = sender(*[response(body=b'{"error": {"code": "ratelimited"}}')] * 2)
+    assert policy(attempts=2).call('retry-limit', True, send) == {'error': {'code': 'ratelimited'}}
+    assert send.calls == 2
+
+
+def test_no_retry_beyond_deadline():
+    send = sender(response(status=503, headers={'Retry-After': '30'}))
+    limited = policy(cap=60)
+    limited.deadline = Deadline(1)
+    with pytest.raises(DeadlineExceeded):
+        limited.call('retry-deadline', True, send)
+
+
+def test_cache_counts_reach_metrics():
+    before = counter('wikiportret_cache_hits_total')
+    cache._count('hits')
+    assert counter('wikiportret_cache_hits_total') == before + 1
+
+
+def test_write_is_retried_when_connection_was_not_made():
+    send = sender(requests.exceptions.ConnectTimeout('timeout'), response(body=b'{"ok": 1}'))
+    assert policy().call('retry-connect', False, send) == {'ok': 1}
+
+
+def test_write_is_retried_after_too_many_requests():
+    send = sender(response(status=429), response(body=b'{"ok": 1}'))
+    assert policy().call('retry-429', False, send) == {'ok': 1}
+
+
+def test_delay_follows_hint_of_server():
+    assert policy(cap=60).delay(0, hint=30) == 30
+    assert policy(cap=10).delay(0, hint=30) == 10  # Never longer than the cap
+    assert 0 <= policy(base=1, cap=60).delay(3) <= 8
+
+
+def test_wait_budget_is_shared_by_the_session():
+    session = policy(cap=1, max_wait=1.5)
+    send = sender(response(status=503, headers={'Retry-After': '1'}), response(body=b'{"ok": 1}'),
+                  response(status=503, headers={'Retry-After': '1'}))
+    assert session.call('retry-budget', True, send) == {'ok': 1}
+    with pytest.raises(requests.exceptions.HTTPError):
+        session.call('retry-budget', True, send)  # Only 0.5 seconds left for the second request
+    assert session.retries == 1 and session.waited == 1
+    assert retry.stats['retries'][('retry-budget', 'http-503')] == 1
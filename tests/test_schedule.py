@@ -0,0 +1,41 @@
+import pytest
+
+import Wikiportret_core as core
+import Wikiportret_health as health
+from Wikiportret_schedule import Scheduler, Step
+
+
+def raising(error):
+    def run():
+        raise error
+    return run
+
+
+def commons_step_of(run):
+    return Step('edit_commons', run, 'commons', errors=core.commons_errors, message='Commons failed')
+
+
+def commons_step(error):
+    return commons_step_of(raising(error))
+
+
+def test_commons_error_only_stops_the_commons_steps():
+    steps = [commons_step(KeyError('P6305')),
+             Step('after', lambda: 'done', 'commons', needs=('edit_commons',)),
+             Step('article', lambda: 'done', 'nl')]
+    status = Scheduler(steps).run()
+    assert status['edit_commons'] == 'failed' and status['article'] == 'done' and status['after'] != 'done'
+
+
+@pytest.mark.parametrize('error', [core.MaxlagError(), health.CircuitOpen('commons'), core.DeadlineExceeded('commons')])
+def test_maxlag_deadline_and_open_circuit_stop_the_run(error):
+    with pytest.raises(type(error)):
+        Scheduler([commons_step(error)], fatal=(core.DeadlineExceeded,)).run()
+
+
+@pytest.mark.parametrize('step', ['ticket', 'set_licence_properties', 'commons_entity_data', 'depicts'])
+def test_missing_file_only_stops_the_commons_step(monkeypatch, step):
+    image = core.Image('Missing.jpg', 'Jan')
+    monkeypatch.setattr(image, 'get_commons_claims', lambda: (None, None))  # The file page was not found
+    status = Scheduler([commons_step_of(getattr(image, step)), Step('article', lambda: 'done', 'nl')]).run()
+    assert status == {'edit_commons': 'failed', 'article': 'done'}
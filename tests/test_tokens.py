@@ -0,0 +1,61 @@
+import pytest
+import requests
+
+import Wikiportret_core as core
+import Wikiportret_pool as pool
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(core.Bot, '_tokens', {})
+    monkeypatch.setattr(pool, '_logins', {})
+    monkeypatch.setattr(pool, '_sources', {})
+    monkeypatch.setattr(pool, '_locks', {})
+
+
+def bot_answering(monkeypatch, *answers):
+    """A bot of which the requests get the answers one by one, keeps the requests it sent"""
+    pool.register('user', object)
+    bot = core.CommonsBot()
+    bot.user, bot._max = 'user', 1000  # An explicit limit, so the limits of the account are not read
+    answers, bot.sent = list(answers), []
+
+    def send(method, **kwargs):
+        bot.sent.append(kwargs.get('params', kwargs.get('data')))
+        response = requests.Response()
+        response.status_code, response._content = 200, answers.pop(0)
+        return response
+    monkeypatch.setattr(bot, '_send', send)
+    return bot
+
+
+def token(value):
+    return ('{"query": {"tokens": {"csrftoken": "%s"}}}' % value).encode()
+
+
+def test_token_is_fetched_once(monkeypatch):
+    bot = bot_answering(monkeypatch, token('first'), b'{"edit": {}}', b'{"edit": {}}')
+    bot.post({'action': 'edit', 'title': 'Test'})
+    bot.post({'action': 'edit', 'title': 'Test'})
+    assert [i.get('meta') for i in bot.sent] == ['tokens', None, None]
+    assert [i.get('token') for i in bot.sent[1:]] == ['first', 'first']
+
+
+def test_token_is_shared_by_bots_of_the_same_login(monkeypatch):
+    bot_answering(monkeypatch, token('first')).verify_token()
+    other = bot_answering(monkeypatch, b'{"edit": {}}')
+    other.post({'action': 'edit', 'title': 'Test'})
+    assert other.sent[0]['token'] == 'first'
+
+
+def test_badtoken_gets_a_new_token(monkeypatch):
+    bot = bot_answering(monkeypatch, token('old'), b'{"error": {"code": "badtoken"}}', token('new'), b'{"edit": {}}')
+    assert bot.post({'action': 'edit', 'title': 'Test'}) == {'edit': {}}
+    assert bot.sent[-1]['token'] == 'new'
+    assert bot.verify_token() == 'new'  # The new token replaces the rejected one in the cache
+
+
+def test_token_of_caller_is_not_replaced(monkeypatch):
+    bot = bot_answering(monkeypatch, b'{"error": {"code": "badtoken"}}')
+    assert bot.post({'action': 'edit', 'title': 'Test', 'token': 'own'}) == {'error': {'code': 'badtoken'}}
+    assert len(bot.sent) == 1
@@ -0,0 +1,59 @@
+import datetime as dt
+
+import pytest
+
+try:
+    import Wikiportret_core_web_link as wcl
+except (ImportError, OSError):  # The db utilities load the encryption keys of the tool when they are imported
+    pytest.skip('The db utilities of the webservice are not available', allow_module_level=True)
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """The queries sent to the db, as (query, args)"""
+    sent = []
+    monkeypatch.setattr(wcl.dbut, 'adjust_db', lambda query, dbname, connection=None, deadline=None, args=None:
+                        sent.append((query, args)))
+    return sent
+
+
+def web_image():
+    image = wcl.WebImage.__new__(wcl.WebImage)
+    wcl.Image.__init__(image, "Jan O'Brien.jpg", "Jan O'Brien")
+    image.dbname, image.caption = 'test', "O'Brien in 2020"
+    image.extra_files, image.extra_subjects = [], []
+    image.mc = {'P6305': [{'mainsnak': {'datavalue': {'value': '2020010110000001'}}}]}  # The ticket number
+    return image
+
+
+def test_input_data_values_are_passed_separately(queries):
+    image = web_image()
+    image.date, image.death = dt.date(2020, 1, 2), dt.datetime(2021, 3, 4)
+    image.input_data_to_db(5, connection=object())
+    (insert, args), (date, date_args), (death, death_args) = queries
+    assert "O'Brien" not in insert and args == ("O'Brien in 2020", image.catname, image.sum, 2020010110000001)
+    assert 'SET date = %s' in date and date_args == ('2020-01-02',)
+    assert 'UPDATE input_data' in death and 'SET death_date = %s' in death and death_args == ('2021-03-04',)
+
+
+def test_commons_text_is_passed_separately(queries, monkeypatch):
+    image = web_image()
+    monkeypatch.setattr(wcl.Image, 'get_commons_text', lambda self, force_update=False: None)
+    image.comtext = "{{Information|description=Jan O'Brien}}"
+    image.get_commons_text(session=5, connection=object())
+    (query, args), = queries
+    assert "O'Brien" not in query and args == (image.comtext,)
+
+
+def test_session_without_other_files_has_no_set():
+    assert web_image().image_set() is None
+
+
+def test_session_with_other_files_is_a_set(queries):
+    image = web_image()
+    image.extra_files, image.extra_subjects = ['Jan 2.jpg'], ['Piet']
+    images = image.image_set()
+    assert images.main is image and [i.file for i in images.files] == ["Jan O'Brien.jpg", 'Jan 2.jpg']
+    image.extra_images_to_db(5, connection=object())
+    (query, args), = queries
+    assert [wcl.codec.loads(i) for i in args] == [['Jan 2.jpg'], ['Piet']]